@@ -1,6 +1,5 @@
-from django.db.models import Max, Avg
 from rest_framework import serializers
-from game.models import Round
+from game.models import UserStats
 from .models import User
 
 
@@ -28,27 +27,19 @@ class UserReadSerializer(serializers.ModelSerializer):
     avg_round_score = serializers.SerializerMethodField()
 
     def get_best_round_score(self, obj):
-        result = Round.objects.filter(game__user=obj, game__is_over=True).\
-            aggregate(best_score=Max('score'))
-        return result['best_score']
+        return UserStats.objects.for_user(obj).best_round_score
 
     def get_avg_round_score(self, obj):
-        query = Round.objects.filter(game__user=obj, game__is_over=True). \
-            aggregate(avg_score=Avg('score', distinct=True))
-        avg_round_score = query['avg_score']
-        return round(avg_round_score) if avg_round_score is not None else avg_round_score
+        return UserStats.objects.for_user(obj).avg_round_score
 
     def get_avg_game_score(self, obj):
-        query = obj.games.finished().aggregate(avg_score=Avg('score'))
-        avg_game_score = query['avg_score']
-        return round(avg_game_score) if avg_game_score is not None else None
+        return UserStats.objects.for_user(obj).avg_game_score
 
     def get_best_game_score(self, obj):
-        result = obj.games.finished().aggregate(best_score=Max('score'))
-        return result['best_score']
+        return UserStats.objects.for_user(obj).best_game_score
 
     def get_games_count(self, obj):
-        return obj.games.finished().count()
+        return UserStats.objects.for_user(obj).games_count
 
 
     class Meta:
@@ -1,7 +1,14 @@
+from io import StringIO
 from rest_framework.test import APITestCase
 from rest_framework import status
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.urls import reverse
 from authorization.models import User
+from game.factories import GameFactory, RoundFactory
+from game.models import UserStats
+from geoquizz_backend.testing import QueryBudgetTestCase
 
 
 class UserRegistrationTest(APITestCase):
@@ -52,6 +59,69 @@ class UserInfoTest(APITestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_user_info_stats(self):
+        for scores in [(1000, 1000), (5000, 3000)]:
+            game = GameFactory(user=self.user)
+            for score in scores:
+                RoundFactory(game=game, score=score, user_point=GEOSGeometry('POINT(0 0)', srid=4326))
+            # Заранее созданный раунд, до которого игрок не дошел
+            RoundFactory(game=game, is_revealed=False)
+            game.finish()
+        GameFactory(user=self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['games_count'], 2)
+        self.assertEqual(response.data['best_game_score'], 8000)
+        self.assertEqual(response.data['avg_game_score'], 5000)
+        self.assertEqual(response.data['best_round_score'], 5000)
+        self.assertEqual(response.data['avg_round_score'], 2500)
+        self.assertEqual(UserStats.objects.get(user=self.user).rounds_count, 4)
+        UserStats.objects.rebuild(user_ids=[self.user.pk])
+        self.assertEqual(UserStats.objects.get(user=self.user).rounds_count, 4)
+
+    def test_deleted_game_leaves_user_stats(self):
+        games = []
+        for score in (1000, 5000):
+            game = GameFactory(user=self.user)
+            RoundFactory(game=game, score=score, user_point=GEOSGeometry('POINT(0 0)', srid=4326))
+            game.finish()
+            games.append(game)
+        games[1].delete()
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.games_count, stats.game_score_sum, stats.best_game_score), (1, 1000, 1000))
+        self.assertEqual((stats.rounds_count, stats.round_score_sum, stats.best_round_score), (1, 1000, 1000))
+        games[0].delete()
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.games_count, stats.rounds_count, stats.best_game_score), (0, 0, None))
+
+
+class UserInfoQueryBudgetTest(QueryBudgetTestCase):
+    query_budgets = {
+        'user_info': 3,
+    }
+
+    def test_user_info(self):
+        user = User.objects.create_user('test', 'test')
+        for _ in range(3):
+            game = GameFactory(user=user)
+            RoundFactory(game=game, score=100)
+            game.finish()
+        self.client.login(username='test', password='test')
+        self.assertQueryBudget('user_info', self.client.get(reverse('user_info')))
+
+
+class CheckUserStatsTest(APITestCase):
+    def test_check_and_fix(self):
+        user = User.objects.create_user('test', 'test')
+        game = GameFactory(user=user)
+        RoundFactory(game=game, score=100)
+        game.finish()
+        call_command('check_user_stats', stdout=StringIO())
+        UserStats.objects.filter(user=user).update(games_count=5)
+        with self.assertRaises(CommandError):
+            call_command('check_user_stats', stdout=StringIO())
+        call_command('check_user_stats', '--fix', stdout=StringIO())
+        self.assertEqual(UserStats.objects.get(user=user).games_count, 1)
+
 
 class ChangePasswordTest(APITestCase):
     def setUp(self) -> None:
@@ -96,7 +96,8 @@ def liked_category(request):
     """
     Понравившиеся категории
     """
-    return Response(CategorySerializer(request.user.liked_category, many=True).data)
+    categories = request.user.liked_category.with_stats(request.user)
+    return Response(CategorySerializer(categories, many=True).data)
 
 
 
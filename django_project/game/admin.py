@@ -1,8 +1,35 @@
 from django.contrib.gis import admin
-from .models import Point, Category, Game, Round
+from .models import (Point, Category, CategoryStats, DailyLeaderboardEntry, Game, GameEvent, LeaderboardEntry,
+                     PointStats, Round, UserStats)
 
 
-admin.site.register(Point, admin.OSMGeoAdmin)
+class PointStatsInline(admin.StackedInline):
+    model = PointStats
+    fields = readonly_fields = ['guesses_count', 'avg_distance', 'median_distance', 'avg_score', 'updated_at']
+    can_delete = False
+
+
+class PointAdmin(admin.OSMGeoAdmin):
+    list_display = ['id', 'category', 'guesses_count', 'median_distance']
+    list_select_related = ['category', 'stats']
+    inlines = [PointStatsInline]
+
+    @admin.display(description='Число ответов', ordering='stats__guesses_count')
+    def guesses_count(self, obj):
+        return obj.stats.guesses_count if hasattr(obj, 'stats') else None
+
+    @admin.display(description='Медианное расстояние', ordering='stats__median_distance')
+    def median_distance(self, obj):
+        return obj.stats.median_distance if hasattr(obj, 'stats') else None
+
+
+admin.site.register(Point, PointAdmin)
 admin.site.register(Category, admin.ModelAdmin)
 admin.site.register(Game, admin.ModelAdmin)
 admin.site.register(Round, admin.OSMGeoAdmin)
+admin.site.register(CategoryStats, admin.ModelAdmin)
+admin.site.register(LeaderboardEntry, admin.ModelAdmin)
+admin.site.register(UserStats, admin.ModelAdmin)
+admin.site.register(PointStats, admin.ModelAdmin)
+admin.site.register(DailyLeaderboardEntry, admin.ModelAdmin)
+admin.site.register(GameEvent, admin.ModelAdmin)
@@ -0,0 +1,159 @@
+"""
+Асинхронные версии эндпоинтов игры для запуска через ASGI.
+
+Django 3.2 не имеет асинхронного ORM, поэтому вся работа с БД одного запроса
+выполняется одним вызовом sync_to_async в потоке, привязанном к запросу, а ожидание
+запроса и отправка ответа не занимают поток.
+"""
+import json
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import (MethodNotAllowed, NotAuthenticated, NotFound, ParseError,
+                                       PermissionDenied, ValidationError)
+from rest_framework.renderers import JSONRenderer
+from .models import Game, GameIsOver, LeaderboardEntry, NoRoundsLeft, Round
+from .serializers import (GameReadSerializer, GameStartRequestBodySerializer, GameStartResponseSerializer,
+                          RoundReadSerializer, RoundSetPointRequestBodySerializer,
+                          RoundSetPointResponseSerializer, TopPlayersQuerySerializer,
+                          TopPlayersResponseSerializer)
+from .session import game_states
+from .views import GAME_IS_OVER_MESSAGE, NO_ROUNDS_LEFT_MESSAGE, ROOM_GAME_MESSAGE
+
+
+class ErrorResponse(Exception):
+    def __init__(self, data, status_code):
+        self.data = data
+        self.status_code = status_code
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), status=status_code,
+                        content_type='application/json')
+
+
+def parse_body(request):
+    try:
+        return json.loads(request.body or b'{}')
+    except ValueError:
+        raise ErrorResponse({'detail': str(ParseError.default_detail)}, status.HTTP_400_BAD_REQUEST)
+
+
+def check_csrf(request):
+    """
+    Как и DRF, проверяет CSRF только для пользователей, вошедших через сессию
+    """
+    if not request.user.is_authenticated:
+        return
+    try:
+        SessionAuthentication().enforce_csrf(request)
+    except PermissionDenied as error:
+        raise ErrorResponse({'detail': str(error.detail)}, status.HTTP_403_FORBIDDEN)
+
+
+def check_authenticated(request):
+    if not request.user.is_authenticated:
+        raise ErrorResponse({'detail': str(NotAuthenticated.default_detail)}, status.HTTP_403_FORBIDDEN)
+    check_csrf(request)
+
+
+def get_active_game(request, pk):
+    """
+    Активная игра пользователя для next_round и end_game, игрой в комнате управляет комната
+    """
+    game = game_states.get_game(pk, request.user) or get_or_404(Game.objects.active().filter(user=request.user), pk=pk)
+    if game.mode == Game.MODE_ROOM:
+        raise ErrorResponse([ROOM_GAME_MESSAGE], status.HTTP_400_BAD_REQUEST)
+    return game
+
+
+def get_or_404(queryset, **kwargs):
+    try:
+        return queryset.get(**kwargs)
+    except (queryset.model.DoesNotExist, ValueError):
+        raise ErrorResponse({'detail': str(NotFound.default_detail)}, status.HTTP_404_NOT_FOUND)
+
+
+def async_endpoint(methods):
+    """
+    Выполняет синхронную часть эндпоинта в потоке запроса и превращает ErrorResponse в ответ
+    """
+    def decorator(func):
+        @wraps(func)
+        async def view(request, *args, **kwargs):
+            if request.method not in methods:
+                return render({'detail': str(MethodNotAllowed(request.method).detail)},
+                              status.HTTP_405_METHOD_NOT_ALLOWED)
+            try:
+                data, status_code = await sync_to_async(func)(request, *args, **kwargs)
+            except ErrorResponse as error:
+                return render(error.data, error.status_code)
+            return render(data, status_code)
+        # csrf_exempt в Django 3.2 превращает view в синхронную, CSRF проверяется в check_csrf
+        view.csrf_exempt = True
+        return view
+    return decorator
+
+
+@async_endpoint(['POST'])
+def start_game(request):
+    check_authenticated(request)
+    serializer = GameStartRequestBodySerializer(data=parse_body(request), context={'user': request.user})
+    if not serializer.is_valid():
+        raise ErrorResponse(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    try:
+        with transaction.atomic():
+            game = serializer.save()
+            first_round = game.start()
+    except ValidationError as error:
+        raise ErrorResponse(error.detail, status.HTTP_400_BAD_REQUEST)
+    return GameStartResponseSerializer(first_round).data, status.HTTP_201_CREATED
+
+
+@async_endpoint(['POST'])
+def next_round(request, pk):
+    check_authenticated(request)
+    game = get_active_game(request, pk)
+    try:
+        next_round = game.next_round()
+    except NoRoundsLeft:
+        raise ErrorResponse([NO_ROUNDS_LEFT_MESSAGE], status.HTTP_400_BAD_REQUEST)
+    return RoundReadSerializer(next_round).data, status.HTTP_201_CREATED
+
+
+@async_endpoint(['POST'])
+def end_game(request, pk):
+    check_authenticated(request)
+    game = get_active_game(request, pk)
+    try:
+        game.finish()
+    except GameIsOver:
+        raise ErrorResponse({'detail': str(NotFound.default_detail)}, status.HTTP_404_NOT_FOUND)
+    return GameReadSerializer(game).data, status.HTTP_200_OK
+
+
+@async_endpoint(['PATCH'])
+def set_user_point(request, pk):
+    check_csrf(request)
+    round = get_or_404(Round.objects.filter(is_revealed=True).select_related('random_point'), pk=pk)
+    serializer = RoundSetPointRequestBodySerializer(round, data=parse_body(request))
+    if not serializer.is_valid():
+        raise ErrorResponse(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    try:
+        round.set_user_point(serializer.validated_data['user_point'])
+    except GameIsOver:
+        raise ErrorResponse([GAME_IS_OVER_MESSAGE], status.HTTP_400_BAD_REQUEST)
+    return RoundSetPointResponseSerializer(round).data, status.HTTP_200_OK
+
+
+@async_endpoint(['GET'])
+def top_players(request):
+    serializer = TopPlayersQuerySerializer(data=request.GET)
+    if not serializer.is_valid():
+        raise ErrorResponse(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    result = LeaderboardEntry.objects.top(serializer.validated_data['limit'], serializer.validated_data['offset'])
+    return TopPlayersResponseSerializer(result, many=True).data, status.HTTP_200_OK
+
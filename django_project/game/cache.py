@@ -0,0 +1,73 @@
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+
+
+class CategoryCache:
+    """
+    Кэш сериализованных категорий.
+
+    Ключи содержат версию каталога, которая меняется при изменении категорий, точек,
+    лайков и завершении игр, поэтому устаревшие записи просто перестают читаться.
+    Отметка лайка зависит от пользователя и добавляется к данным после чтения из кэша.
+    """
+    version_key = 'category_cache:version'
+    hits_key = 'category_cache:hits'
+    misses_key = 'category_cache:misses'
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'CATEGORY_CACHE_TIMEOUT', 60 * 60)
+
+    def version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, uuid.uuid4().hex, None)
+            version = cache.get(self.version_key)
+        return version
+
+    def bump(self):
+        cache.set(self.version_key, uuid.uuid4().hex, None)
+
+    def get_list(self, build):
+        return self._get('category_cache:{}:list'.format(self.version()), build)
+
+    def get_detail(self, pk, build):
+        return self._get('category_cache:{}:detail:{}'.format(self.version(), pk), build)
+
+    def merge_likes(self, data, user):
+        liked = (set(user.liked_category.values_list('id', flat=True))
+                 if user is not None and user.is_authenticated else set())
+        if isinstance(data, list):
+            return [dict(item, like=item['id'] in liked) for item in data]
+        return dict(data, like=data['id'] in liked)
+
+    def stats(self):
+        hits = cache.get(self.hits_key, 0)
+        misses = cache.get(self.misses_key, 0)
+        return {'hits': hits, 'misses': misses}
+
+    def reset_stats(self):
+        cache.delete_many([self.hits_key, self.misses_key])
+
+    def _get(self, key, build):
+        data = cache.get(key)
+        if data is not None:
+            self._count(self.hits_key)
+            return data
+        self._count(self.misses_key)
+        data = build()
+        cache.set(key, data, self.timeout)
+        return data
+
+    @staticmethod
+    def _count(key):
+        if cache.add(key, 1, None):
+            return
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+category_cache = CategoryCache()
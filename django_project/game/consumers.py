@@ -0,0 +1,162 @@
+"""
+WebSocket комнат многопользовательской игры: ws/game/room/<code>/?category=<codename>.
+
+Первый подключившийся создает комнату в категории category и становится ее хозяином.
+Сообщения клиента:
+    {"type": "start"}                     начать игру (хозяин комнаты)
+    {"type": "guess", "point": GeoJSON}   ответ в текущем раунде
+    {"type": "next_round"}                закрыть текущий раунд и открыть следующий (хозяин комнаты)
+События сервера: room, player_joined, player_left, round_started, player_guessed,
+round_results, game_over и error. Итоги раунда рассылаются, когда ответили все
+подключенные игроки или хозяин перешел к следующему раунду. Когда комнату покидает
+последний игрок, игры комнаты завершаются.
+"""
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from .models import GameIsOver
+from .rooms import (ROOM_STARTED_MESSAGE, Room, RoomError, find_category, finish_room_games,
+                    reveal_room_round, rooms, start_room_games, submit_guess)
+from .serializers import RoundSetPointRequestBodySerializer
+from .views import GAME_IS_OVER_MESSAGE
+
+ROUND_IS_CLOSED_MESSAGE = 'Раунд уже закрыт'
+ALREADY_GUESSED_MESSAGE = 'Ответ в этом раунде уже принят'
+UNKNOWN_MESSAGE = 'Неизвестный тип сообщения'
+
+
+class RoomConsumer(AsyncJsonWebsocketConsumer):
+    room = None
+    user = None
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close()
+            return
+        code = self.scope['url_route']['kwargs']['code']
+        room = rooms.get(code)
+        if room is None:
+            query = parse_qs(self.scope.get('query_string', b'').decode())
+            category = await database_sync_to_async(find_category)(query.get('category', [''])[0])
+            if category is None:
+                await self.close()
+                return
+            room = rooms.get_or_create(code, *category)
+        try:
+            player = room.join(self.user.pk, self.user.login, self.channel_name)
+        except RoomError:
+            await self.close()
+            return
+        self.room = room
+        await self.channel_layer.group_add(room.group, self.channel_name)
+        await self.accept()
+        await self.send_json(dict(room.to_dict(), type='room', you=self.user.pk))
+        await self.broadcast({'type': 'player_joined', 'player': player.to_dict(), 'host': room.host_id})
+
+    async def disconnect(self, code):
+        room = self.room
+        if room is None:
+            return
+        await self.channel_layer.group_discard(room.group, self.channel_name)
+        async with room.lock:
+            player = room.players.get(self.user.pk)
+            # Игрок мог переподключиться раньше, чем закрылось старое соединение
+            if player is None or player.channel_name != self.channel_name:
+                return
+            room.leave(self.user.pk)
+            if room.is_empty:
+                rooms.remove(room)
+                # Игры комнаты нельзя продолжить без нее, поэтому они завершаются вместе с комнатой
+                if room.state == Room.STATE_PLAYING:
+                    room.state = Room.STATE_FINISHED
+                    await database_sync_to_async(finish_room_games)(room.games_ids())
+                return
+            await self.broadcast({'type': 'player_left', 'player': self.user.pk, 'host': room.host_id})
+            if room.round_open and room.guesses and room.all_guessed():
+                await self.close_round()
+
+    async def receive_json(self, content, **kwargs):
+        handlers = {
+            'start': self.start_game,
+            'guess': self.guess,
+            'next_round': self.next_round,
+        }
+        handler = handlers.get(content.get('type') if isinstance(content, dict) else None)
+        if handler is None:
+            await self.send_error(UNKNOWN_MESSAGE)
+            return
+        try:
+            async with self.room.lock:
+                await handler(content)
+        except RoomError as error:
+            await self.send_error(str(error))
+
+    async def start_game(self, content):
+        room = self.room
+        room.check_host(self.user.pk)
+        if room.state != Room.STATE_WAITING:
+            raise RoomError(ROOM_STARTED_MESSAGE)
+        users_ids = [player.user_id for player in room.players.values()]
+        points, games = await database_sync_to_async(start_room_games)(room.category_id, users_ids)
+        room.begin(points, games)
+        await self.broadcast(dict(room.round_payload(), type='round_started'))
+
+    async def guess(self, content):
+        room = self.room
+        player = room.players[self.user.pk]
+        if not room.round_open or player.game_id is None:
+            raise RoomError(ROUND_IS_CLOSED_MESSAGE)
+        if player.user_id in room.guesses:
+            raise RoomError(ALREADY_GUESSED_MESSAGE)
+        serializer = RoundSetPointRequestBodySerializer(data={'user_point': content.get('point')})
+        if not serializer.is_valid():
+            await self.send_json({'type': 'error', 'detail': serializer.errors})
+            return
+        num = room.current_round
+        try:
+            score = await database_sync_to_async(submit_guess)(
+                player.game_id, player.rounds[num], num, room.points[num - 1],
+                serializer.validated_data['user_point'])
+        except GameIsOver:
+            raise RoomError(GAME_IS_OVER_MESSAGE)
+        room.add_guess(player.user_id, score)
+        await self.broadcast({'type': 'player_guessed', 'num': num, 'player': player.user_id})
+        if room.all_guessed():
+            await self.close_round()
+
+    async def next_round(self, content):
+        room = self.room
+        room.check_host(self.user.pk)
+        if room.state != Room.STATE_PLAYING:
+            raise RoomError(ROUND_IS_CLOSED_MESSAGE)
+        if room.round_open:
+            await self.close_round()
+            if room.state == Room.STATE_FINISHED:
+                return
+        num = room.current_round + 1
+        await database_sync_to_async(reveal_room_round)(room, num)
+        room.open_round(num)
+        await self.broadcast(dict(room.round_payload(), type='round_started'))
+
+    async def close_round(self):
+        """
+        Рассылает итоги раунда, после последнего раунда завершает игры игроков
+        """
+        room = self.room
+        room.close_round()
+        await self.broadcast({'type': 'round_results', 'num': room.current_round,
+                              'random_point': room.point_geometry(room.current_round),
+                              'players': room.standings()})
+        if room.state == Room.STATE_FINISHED:
+            await database_sync_to_async(finish_room_games)(room.games_ids())
+            await self.broadcast({'type': 'game_over', 'players': room.standings()})
+
+    async def broadcast(self, event):
+        await self.channel_layer.group_send(self.room.group, {'type': 'room.event', 'event': event})
+
+    async def room_event(self, message):
+        await self.send_json(message['event'])
+
+    async def send_error(self, detail):
+        await self.send_json({'type': 'error', 'detail': detail})
@@ -0,0 +1,54 @@
+"""
+Ежедневное испытание: одна последовательность точек категории на день, общая для всех игроков.
+
+Последовательность детерминированно выводится из зерна (категория, дата и SECRET_KEY)
+перестановкой индекса точек категории, один раз за день собирается вместе с координатами
+и дальше читается из кэша без обращения к таблице точек.
+"""
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .rotation import FeistelPermutation
+from .sampling import point_index
+
+
+class DailyChallengeStore:
+    cache_key = 'daily_challenge:{}:{}'
+
+    @property
+    def timeout(self):
+        # Игра, начатая перед полуночью, может закончиться на следующий день
+        return getattr(settings, 'DAILY_CHALLENGE_TIMEOUT', 2 * 24 * 60 * 60)
+
+    def today(self):
+        return timezone.now().date()
+
+    def seed(self, category_id: int, date) -> int:
+        digest = hashlib.blake2b('{}:{}:{}'.format(settings.SECRET_KEY, category_id, date.isoformat()).encode(),
+                                 digest_size=8).digest()
+        return int.from_bytes(digest, 'big') >> 1
+
+    def sequence(self, category_id: int, date):
+        """
+        Список (id, долгота, широта) точек испытания категории на дату
+        """
+        key = self.cache_key.format(category_id, date.isoformat())
+        data = cache.get(key)
+        if data is not None:
+            return data
+        data = self.generate(category_id, date)
+        cache.add(key, data, self.timeout)
+        return cache.get(key, data)
+
+    def generate(self, category_id: int, date):
+        from .models import Category, Point
+        rounds_count = Category.objects.values_list('rounds_count', flat=True).get(pk=category_id)
+        ids = point_index.ids(category_id)
+        if not ids:
+            return []
+        permutation = FeistelPermutation(len(ids), self.seed(category_id, date))
+        return Point.objects.coordinates([ids[permutation[i]] for i in range(min(rounds_count, len(ids)))])
+
+
+daily_challenges = DailyChallengeStore()
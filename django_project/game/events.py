@@ -0,0 +1,127 @@
+"""
+Журнал событий игры (GameEvent) с пакетной записью.
+
+record() только кладет событие в очередь процесса после коммита транзакции, запись в БД
+выполняет фоновый поток: bulk_create пакетами при накоплении GAME_EVENTS_BATCH_SIZE событий
+или раз в GAME_EVENTS_FLUSH_INTERVAL секунд, оставшиеся события записываются при завершении
+процесса. Буфер включается вызовом start() в wsgi.py и asgi.py, в тестах и командах
+без него события не записываются. created_at события - время вставки пакета по часам БД.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from functools import partial
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models.functions import Now
+
+logger = logging.getLogger(__name__)
+
+
+class GameEventBuffer:
+    def __init__(self):
+        self.enabled = False
+        self.dropped = 0
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._exit_registered = False
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'GAME_EVENTS_BATCH_SIZE', 500)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'GAME_EVENTS_FLUSH_INTERVAL', 1.0)
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'GAME_EVENTS_MAX_BUFFER', 50000)
+
+    def start(self, background: bool = True):
+        """
+        Включает запись событий, с background запускает поток записи и запись остатка при выходе
+        """
+        self.enabled = True
+        self._pid = os.getpid()
+        if not background:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='game-events-flush', daemon=True)
+            self._thread.start()
+        if not self._exit_registered:
+            atexit.register(self.flush)
+            self._exit_registered = True
+
+    def stop(self):
+        self.enabled = False
+        self._queue.clear()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def record(self, event_type: str, game_id: int, user_id=None, round_id=None, **data):
+        """
+        Добавляет событие в очередь после коммита текущей транзакции, не обращаясь к БД
+        """
+        if not self.enabled:
+            return
+        from .models import GameEvent
+        event = GameEvent(type=event_type, game_id=game_id, user_id=user_id, round_id=round_id, data=data)
+        transaction.on_commit(partial(self._append, event))
+
+    def _append(self, event):
+        if self._pid != os.getpid():
+            # Процесс форкнут после start(): очередь и поток родителя здесь не работают
+            self._queue.clear()
+            self.start(background=self._thread is not None)
+        if len(self._queue) >= self.max_size:
+            # БД недоступна дольше, чем помещается в буфер: новые события отбрасываются
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning('Game event buffer is full, %d events dropped', self.dropped)
+            return
+        self._queue.append(event)
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """
+        Записывает накопленные события пакетами, возвращает число записанных событий.
+        При ошибке пакет возвращается в начало очереди и записывается при следующем сбросе
+        """
+        from .models import GameEvent
+        written = 0
+        with self._flush_lock:
+            while self._queue:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                for event in batch:
+                    # Время ставит БД при вставке, в том числе повторной: по нему read_since
+                    # отличает пакеты, которые могли еще не закоммититься
+                    event.created_at = Now()
+                try:
+                    GameEvent.objects.bulk_create(batch)
+                except Exception:
+                    self._queue.extendleft(reversed(batch))
+                    raise
+                written += len(batch)
+        return written
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush game events')
+            finally:
+                close_old_connections()
+
+
+game_events = GameEventBuffer()
@@ -0,0 +1,11 @@
+from django.db.models import FloatField, Func
+
+
+class X(Func):
+    function = 'ST_X'
+    output_field = FloatField()
+
+
+class Y(Func):
+    function = 'ST_Y'
+    output_field = FloatField()
@@ -0,0 +1,173 @@
+"""
+Потоковое чтение точек из GeoJSON, NDJSON и CSV и пакетная загрузка в game_point.
+
+Файлы читаются по частям, в памяти одновременно находится только один пакет точек.
+"""
+import csv
+import io
+import json
+from itertools import islice
+import numpy as np
+from django.contrib.gis.geos import Point as GEOSPoint
+from django.db import connection, transaction
+
+FORMATS = ('geojson', 'ndjson', 'csv')
+
+CHUNK_SIZE = 1 << 16
+
+LON_COLUMNS = ('lon', 'lng', 'longitude', 'x')
+LAT_COLUMNS = ('lat', 'latitude', 'y')
+
+
+def detect_format(path):
+    name = path.lower()
+    if name.endswith(('.ndjson', '.jsonl', '.geojsonl')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return 'geojson'
+
+
+def feature_coordinates(feature):
+    """
+    Координаты (lon, lat) из Feature, геометрии Point или объекта с полями lon/lat
+    """
+    if feature.get('type') == 'Feature':
+        feature = feature.get('geometry') or {}
+    if feature.get('type') == 'Point':
+        lon, lat = feature['coordinates'][:2]
+        return lon, lat
+    return column(feature, LON_COLUMNS), column(feature, LAT_COLUMNS)
+
+
+def column(row, names):
+    for name in names:
+        if name in row:
+            return row[name]
+    raise ValueError('Missing coordinate, expected one of {}'.format(', '.join(names)))
+
+
+def iter_geojson(file):
+    """
+    Features из FeatureCollection по одному через JSONDecoder.raw_decode,
+    не загружая весь файл в память
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = file.read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    while True:
+        start = buffer.find('"features"', position)
+        if start != -1:
+            bracket = buffer.find('[', start)
+            if bracket != -1:
+                position = bracket + 1
+                break
+        if eof:
+            raise ValueError('GeoJSON FeatureCollection without features')
+        # Ключ найден, но '[' еще не прочитана: ключ остается в буфере для следующего поиска
+        position = start if start != -1 else max(0, len(buffer) - len('"features"'))
+        fill()
+
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position == len(buffer):
+            if eof:
+                raise ValueError('Unexpected end of GeoJSON file')
+            fill()
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            feature, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        position = end
+        yield feature_coordinates(feature)
+
+
+def iter_ndjson(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield feature_coordinates(json.loads(line))
+
+
+def iter_csv(file):
+    for row in csv.DictReader(file):
+        row = {key.strip().lower(): value for key, value in row.items() if key}
+        yield column(row, LON_COLUMNS), column(row, LAT_COLUMNS)
+
+
+READERS = {
+    'geojson': iter_geojson,
+    'ndjson': iter_ndjson,
+    'csv': iter_csv,
+}
+
+
+def batches(coordinates, size):
+    iterator = iter(coordinates)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def validate(batch):
+    """
+    Массив (n, 2) корректных координат пакета и число отброшенных строк
+    """
+    values = np.empty((len(batch), 2), dtype=np.float64)
+    valid = np.ones(len(batch), dtype=bool)
+    for i, (lon, lat) in enumerate(batch):
+        try:
+            values[i] = float(lon), float(lat)
+        except (TypeError, ValueError):
+            valid[i] = False
+    valid &= np.isfinite(values).all(axis=1)
+    valid &= (np.abs(values[:, 0]) <= 180) & (np.abs(values[:, 1]) <= 90)
+    return values[valid], int((~valid).sum())
+
+
+def copy_points(category_id, coordinates):
+    """
+    Загрузка пакета через COPY ... FROM STDIN, геометрия передается в EWKT
+    """
+    from .models import Point
+    buffer = io.StringIO()
+    for lon, lat in coordinates:
+        buffer.write('SRID=4326;POINT({!r} {!r})\t{}\n'.format(float(lon), float(lat), category_id))
+    buffer.seek(0)
+    table = connection.ops.quote_name(Point._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert('COPY {} (point, category_id) FROM STDIN'.format(table), buffer)
+
+
+def create_points(category_id, coordinates):
+    from .models import Point
+    Point.objects.bulk_create([Point(point=GEOSPoint(float(lon), float(lat), srid=4326),
+                                     category_id=category_id)
+                               for lon, lat in coordinates])
+
+
+def load_points(category_id, coordinates):
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            copy_points(category_id, coordinates)
+        else:
+            create_points(category_id, coordinates)
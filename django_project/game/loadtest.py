@@ -0,0 +1,331 @@
+"""
+Симуляция игроков для нагрузочных тестов: каждый игрок регистрируется
+и проходит игры целиком через HTTP API или через тестовый клиент Django в том же процессе.
+Игроки комнат подключаются по WebSocket к ASGI приложению в этом же процессе.
+"""
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+SYNC_ENDPOINTS = {
+    'start_game': '/game/game/start_game/',
+    'next_round': '/game/game/{pk}/next_round/',
+    'set_user_point': '/game/round/{pk}/set_user_point/',
+    'end_game': '/game/game/{pk}/end_game/',
+    'top_players': '/game/top_players/',
+    'category_list': '/game/category/',
+}
+
+ROOM_PATH = '/ws/game/room/{code}/?category={category}'
+
+ASYNC_ENDPOINTS = {
+    'start_game': '/game/async/game/start_game/',
+    'next_round': '/game/async/game/{pk}/next_round/',
+    'set_user_point': '/game/async/round/{pk}/set_user_point/',
+    'end_game': '/game/async/game/{pk}/end_game/',
+    'top_players': '/game/async/top_players/',
+    'category_list': '/game/category/',
+}
+
+
+def random_guess():
+    return {'type': 'Point', 'coordinates': [random.uniform(-180, 180), random.uniform(-90, 90)]}
+
+
+class HttpPlayer:
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+
+    @property
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, method, path, data=None):
+        """
+        Возвращает (статус, тело ответа, время запроса в секундах, заголовки)
+        """
+        body = json.dumps(data).encode() if data is not None else None
+        request = Request(self.base_url + path, data=body, method=method, headers={
+            'Content-Type': 'application/json',
+            'X-CSRFToken': self.csrf_token,
+            'Referer': self.base_url + '/',
+        })
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                content, status_code, headers = response.read(), response.status, response.headers
+        except HTTPError as error:
+            content, status_code, headers = error.read(), error.code, error.headers
+        elapsed = time.perf_counter() - started
+        try:
+            payload = json.loads(content) if content else None
+        except ValueError:
+            payload = None
+        return status_code, payload, elapsed, dict(headers)
+
+    def register(self):
+        login = 'loadtest_{}'.format(uuid.uuid4().hex[:16])
+        status_code, _, _, _ = self.request('POST', '/authorization/registration/',
+                                            {'login': login, 'password': login})
+        if status_code != 201:
+            raise RuntimeError('Registration failed with status {}'.format(status_code))
+        return login
+
+
+class ClientPlayer(HttpPlayer):
+    """
+    Игрок, отправляющий запросы через django.test.Client без запуска сервера.
+    Число SQL запросов считается напрямую и передается в заголовке X-DB-Queries.
+    """
+    def __init__(self, base_url=''):
+        from django.test import Client
+        self.client = Client()
+
+    def request(self, method, path, data=None):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        body = json.dumps(data) if data is not None else ''
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.generic(method, path, body, content_type='application/json')
+        elapsed = time.perf_counter() - started
+        headers = dict(response.items())
+        headers['X-DB-Queries'] = str(len(queries.captured_queries))
+        try:
+            payload = json.loads(response.content) if response.content else None
+        except ValueError:
+            payload = None
+        return response.status_code, payload, elapsed, headers
+
+
+def play_game(player, endpoints, category, record):
+    """
+    Проходит одну игру, record(endpoint, status, elapsed, headers) вызывается на каждый запрос
+    """
+    def call(endpoint, method, data=None, **kwargs):
+        status_code, payload, elapsed, headers = player.request(method, endpoints[endpoint].format(**kwargs),
+                                                                data)
+        record(endpoint, status_code, elapsed, headers)
+        return status_code, payload
+
+    call('category_list', 'GET')
+    status_code, payload = call('start_game', 'POST', {'category': category})
+    if status_code != 201:
+        return
+    game_pk = payload['game']
+    rounds_count = payload['category']['rounds_count']
+    round_pk = payload['id']
+    for num in range(rounds_count):
+        call('set_user_point', 'PATCH', {'user_point': random_guess()}, pk=round_pk)
+        if num + 1 == rounds_count:
+            break
+        status_code, payload = call('next_round', 'POST', pk=game_pk)
+        if status_code != 201:
+            break
+        round_pk = payload['id']
+    call('end_game', 'POST', pk=game_pk)
+    call('top_players', 'GET')
+
+
+def run_players(base_url, endpoints, category, players, games_per_player=1, player_class=HttpPlayer):
+    """
+    Запускает players параллельных игроков и возвращает список запросов
+    (endpoint, статус, время, заголовки) и общее время прохождения игр
+    """
+    records = []
+    http_players = [player_class(base_url) for _ in range(players)]
+    with ThreadPoolExecutor(max_workers=players) as executor:
+        list(executor.map(HttpPlayer.register, http_players))
+
+    def play(player):
+        for _ in range(games_per_player):
+            play_game(player, endpoints, category,
+                      lambda *args: records.append(args))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=players) as executor:
+        list(executor.map(play, http_players))
+    return records, time.perf_counter() - started
+
+
+def percentile(values, percent):
+    """
+    Процентиль по методу ближайшего ранга
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def summarize(records, elapsed):
+    """
+    Сводка по эндпоинтам: число запросов, ошибки, задержки p50/p95/p99 в мс,
+    пропускная способность и среднее число SQL запросов, если сервер их сообщает
+    """
+    by_endpoint = defaultdict(list)
+    for record in records:
+        by_endpoint[record[0]].append(record)
+    endpoints = {}
+    for endpoint, items in sorted(by_endpoint.items()):
+        latencies = [item[2] * 1000 for item in items]
+        queries = [int(item[3]['X-DB-Queries']) for item in items if 'X-DB-Queries' in item[3]]
+        endpoints[endpoint] = {
+            'requests': len(items),
+            'errors': sum(1 for item in items if item[1] >= 400),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'throughput_rps': len(items) / elapsed if elapsed else None,
+            'avg_queries': sum(queries) / len(queries) if queries else None,
+            'max_queries': max(queries) if queries else None,
+        }
+    return {
+        'requests': len(records),
+        'errors': sum(1 for record in records if record[1] >= 400),
+        'elapsed_s': elapsed,
+        'throughput_rps': len(records) / elapsed if elapsed else None,
+        'endpoints': endpoints,
+    }
+
+
+class SocketPlayer:
+    """
+    Игрок комнаты, подключенный через channels.testing.WebsocketCommunicator,
+    пользователь передается в scope напрямую без сессии
+    """
+    def __init__(self, application, path, user, timeout=30):
+        from channels.testing import WebsocketCommunicator
+        self.communicator = WebsocketCommunicator(application, path)
+        self.communicator.scope['user'] = user
+        self.timeout = timeout
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect(self.timeout)
+        if not connected:
+            raise RuntimeError('WebSocket connection rejected')
+        return await self.communicator.receive_json_from(self.timeout)
+
+    async def send(self, message):
+        await self.communicator.send_json_to(message)
+
+    async def wait_for(self, event_type, num=None):
+        """
+        Пропускает события до события event_type раунда num, возвращает его и момент получения
+        """
+        while True:
+            event = await self.communicator.receive_json_from(self.timeout)
+            if event['type'] == 'error':
+                raise RuntimeError('Room error: {}'.format(event['detail']))
+            if event['type'] == event_type and (num is None or event.get('num') == num):
+                return event, time.perf_counter()
+
+    async def disconnect(self):
+        await self.communicator.disconnect()
+
+
+async def play_room(application, code, category, users, record, timeout=30):
+    """
+    Проходит игру в комнате code всеми users. record(event, задержка в секундах) вызывается
+    для каждого игрока и каждой рассылки: задержка считается от отправки сообщения, вызвавшего
+    рассылку (start, последний ответ раунда, next_round), до получения события игроком
+    """
+    players = [SocketPlayer(application, ROOM_PATH.format(code=code, category=category), user, timeout)
+               for user in users]
+    for player in players:
+        started = time.perf_counter()
+        await player.connect()
+        record('connect', time.perf_counter() - started)
+
+    async def fan_out(event_type, num, started):
+        results = await asyncio.gather(*(player.wait_for(event_type, num) for player in players))
+        for _, received in results:
+            record(event_type, received - started)
+        return results[0][0]
+
+    host = players[0]
+    started = time.perf_counter()
+    await host.send({'type': 'start'})
+    rounds_count = (await fan_out('round_started', 1, started))['rounds_count']
+    for num in range(1, rounds_count + 1):
+        for player in players:
+            started = time.perf_counter()
+            await player.send({'type': 'guess', 'point': random_guess()})
+        await fan_out('round_results', num, started)
+        if num == rounds_count:
+            await fan_out('game_over', None, started)
+        else:
+            started = time.perf_counter()
+            await host.send({'type': 'next_round'})
+            await fan_out('round_started', num + 1, started)
+    await asyncio.gather(*(player.disconnect() for player in players))
+
+
+async def run_rooms(application, category, users, rooms_count, timeout=30):
+    """
+    Играет rooms_count комнат одновременно, пользователи делятся между комнатами поровну.
+    Возвращает записи (событие, задержка) и общее время
+    """
+    records = []
+    size = max(1, len(users) // rooms_count)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        play_room(application, 'loadtest-{}'.format(uuid.uuid4().hex[:12]), category,
+                  users[num * size:(num + 1) * size], lambda *args: records.append(args), timeout)
+        for num in range(rooms_count) if users[num * size:(num + 1) * size]
+    ))
+    return records, time.perf_counter() - started
+
+
+def summarize_fan_out(records, elapsed):
+    """
+    Сводка по событиям рассылки: число доставок и задержки p50/p95/p99/max в мс
+    """
+    by_event = defaultdict(list)
+    for event, latency in records:
+        by_event[event].append(latency * 1000)
+    return {
+        'deliveries': len(records),
+        'elapsed_s': elapsed,
+        'events': {
+            event: {
+                'count': len(latencies),
+                'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99),
+                'max_ms': max(latencies),
+            }
+            for event, latencies in sorted(by_event.items())
+        },
+    }
+
+
+def create_category(points, rounds):
+    """
+    Временная категория loadtest с points точками
+    """
+    from django.contrib.gis.geos import Point as GEOSPoint
+    from .models import Category, Point, points_changed
+    category = Category.objects.create(codename='loadtest', name='loadtest', description='',
+                                       rounds_count=rounds)
+    Point.objects.bulk_create(
+        [Point(category=category, point=GEOSPoint(num % 360 - 180, num % 170 - 85, srid=4326))
+         for num in range(points)],
+        batch_size=10000,
+    )
+    points_changed(category.pk)
+    return category
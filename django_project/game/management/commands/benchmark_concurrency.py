@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from game.loadtest import ASYNC_ENDPOINTS, SYNC_ENDPOINTS, run_players
+
+
+class Command(BaseCommand):
+    help = 'Сравнение пропускной способности синхронных (WSGI) и асинхронных (ASGI) эндпоинтов игры'
+
+    def add_arguments(self, parser):
+        parser.add_argument('category', help='Кодовое имя категории')
+        parser.add_argument('--sync-url', default='http://localhost:8080',
+                            help='Адрес WSGI сервера')
+        parser.add_argument('--async-url', default='http://localhost:8081',
+                            help='Адрес ASGI сервера')
+        parser.add_argument('--players', type=int, nargs='+', default=[1, 50, 500],
+                            help='Число одновременных игроков')
+        parser.add_argument('--games', type=int, default=1, help='Число игр на игрока')
+
+    def handle(self, *args, **options):
+        targets = [('wsgi', options['sync_url'], SYNC_ENDPOINTS),
+                   ('asgi', options['async_url'], ASYNC_ENDPOINTS)]
+        for players in options['players']:
+            for name, url, endpoints in targets:
+                records, elapsed = run_players(url, endpoints, options['category'], players, options['games'])
+                errors = sum(1 for _, status_code, _, _ in records if status_code >= 400)
+                self.stdout.write('{:>4} players {}: {:5d} requests in {:6.2f} s, {:8.1f} req/s, '
+                                  '{} errors'.format(players, name, len(records), elapsed,
+                                                     len(records) / elapsed, errors))
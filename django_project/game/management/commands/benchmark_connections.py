@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from game.loadtest import percentile
+
+
+class Command(BaseCommand):
+    help = 'Стоимость открытия соединения с БД: запросы без CONN_MAX_AGE и с постоянным соединением'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--max-age', type=int, default=600, help='CONN_MAX_AGE для постоянного соединения')
+
+    def handle(self, *args, **options):
+        original = connection.settings_dict['CONN_MAX_AGE']
+        try:
+            for name, max_age in [('new connection per request', 0),
+                                  ('persistent connection', options['max_age'])]:
+                timings = self.run(max_age, options['iterations'])
+                self.stdout.write('{:<28} avg {:7.3f} ms, p50 {:7.3f} ms, p95 {:7.3f} ms'.format(
+                    name, sum(timings) / len(timings), percentile(timings, 50), percentile(timings, 95)))
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = original
+
+    def run(self, max_age, iterations):
+        """
+        Время цикла запроса в мс: сигналы начала и конца запроса, как в обработчике Django, и один SELECT
+        """
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            request_started.send(sender=self.__class__)
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            request_finished.send(sender=self.__class__)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
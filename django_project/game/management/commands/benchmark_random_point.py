@@ -0,0 +1,59 @@
+import time
+from statistics import median
+from django.core.management.base import BaseCommand
+from django.contrib.gis.geos import Point as GEOSPoint
+from django.db import transaction
+from game.models import Category, Point
+from game.sampling import point_index
+
+
+class Command(BaseCommand):
+    help = 'Сравнение PointQueryset.random и выбора точки по point_index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000],
+                            help='Число точек в категории')
+        parser.add_argument('--repeat', type=int, default=20, help='Число выборок на каждый размер')
+        parser.add_argument('--exclude', type=int, default=5, help='Число исключаемых точек')
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            with transaction.atomic():
+                category = self._create_category(size)
+                exclude_pk = list(category.points.values_list('id', flat=True)[:options['exclude']])
+                queryset = Point.objects.filter(category=category)
+                old = self._measure(lambda: queryset.random(exclude_pk=exclude_pk), options['repeat'])
+                # Транзакция откатывается, поэтому индекс сбрасывается сразу, а не после коммита
+                point_index.invalidate(category.pk)
+                started = time.perf_counter()
+                point_index.ids(category.pk)
+                build = time.perf_counter() - started
+                new = self._measure(lambda: Point.objects.random_in_category(category.pk, exclude_pk),
+                                    options['repeat'])
+                self.stdout.write('{:>9} points: random {:9.2f} ms, index {:7.2f} ms '
+                                  '(build {:.2f} ms)'.format(size, old * 1000, new * 1000, build * 1000))
+                point_index.invalidate(category.pk)
+                transaction.set_rollback(True)
+
+    @staticmethod
+    def _measure(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return median(timings)
+
+    @staticmethod
+    def _create_category(size):
+        category = Category.objects.create(codename='benchmark', name='benchmark', description='',
+                                           rounds_count=5)
+        batch = []
+        for num in range(size):
+            batch.append(Point(category=category,
+                               point=GEOSPoint(num % 360 - 180, num % 170 - 85, srid=4326)))
+            if len(batch) == 10000:
+                Point.objects.bulk_create(batch)
+                batch = []
+        Point.objects.bulk_create(batch)
+        return category
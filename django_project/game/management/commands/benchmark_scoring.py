@@ -0,0 +1,34 @@
+import random
+import time
+from django.contrib.gis.geos import LineString, Point
+from django.core.management.base import BaseCommand
+from game import scoring
+
+
+class Command(BaseCommand):
+    help = 'Сравнение расчета расстояний через GEOS и векторизованного scoring'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='Число пар точек')
+
+    def handle(self, *args, **options):
+        pairs = [((random.uniform(-180, 180), random.uniform(-90, 90)),
+                  (random.uniform(-180, 180), random.uniform(-90, 90)))
+                 for _ in range(options['count'])]
+
+        started = time.perf_counter()
+        geos_distances = []
+        for target, guess in pairs:
+            ls = LineString(Point(*target), Point(*guess), srid=4326)
+            ls.transform(ct=54009)
+            geos_distances.append(round(ls.length))
+        geos_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        distances, _ = scoring.score_rounds([target for target, _ in pairs],
+                                            [guess for _, guess in pairs])
+        numpy_time = time.perf_counter() - started
+
+        mismatches = sum(1 for a, b in zip(geos_distances, distances) if a != b)
+        self.stdout.write('GEOS: {:.3f} s, numpy: {:.3f} s, speedup x{:.1f}, mismatches: {}'.format(
+            geos_time, numpy_time, geos_time / numpy_time, mismatches))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from game.cache import category_cache
+
+
+class Command(BaseCommand):
+    help = 'Счетчики попаданий и промахов кэша категорий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Сбросить счетчики')
+
+    def handle(self, *args, **options):
+        stats = category_cache.stats()
+        total = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / total * 100 if total else 0
+        self.stdout.write('hits: {hits}, misses: {misses}'.format(**stats) +
+                          ', hit rate: {:.1f}%'.format(hit_rate))
+        if options['reset']:
+            category_cache.reset_stats()
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from game.models import UserStats
+
+
+class Command(BaseCommand):
+    help = 'Сравнение статистики пользователей с агрегатами по играм и раундам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Пересчитать расходящиеся записи')
+
+    def handle(self, *args, **options):
+        stored = {stats.user_id: stats for stats in UserStats.objects.all()}
+        mismatched = []
+        for row in UserStats.objects.live().iterator():
+            expected = UserStats.fields_from_live(row)
+            stats = stored.get(row['pk'])
+            actual = {field: getattr(stats, field) for field in expected} if stats is not None else None
+            if actual != expected:
+                mismatched.append(row['pk'])
+                self.stdout.write('User {}: stored {}, expected {}'.format(row['pk'], actual, expected))
+        if not mismatched:
+            self.stdout.write('User stats are consistent')
+            return
+        if options['fix']:
+            UserStats.objects.rebuild(user_ids=mismatched)
+            self.stdout.write('Rebuilt stats for {} users'.format(len(mismatched)))
+        else:
+            raise CommandError('{} users have inconsistent stats'.format(len(mismatched)))
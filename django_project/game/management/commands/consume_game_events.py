@@ -0,0 +1,38 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from game.models import GameEvent
+
+
+class Command(BaseCommand):
+    help = 'Чтение журнала событий игр с границы прошлого запуска в NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', default='game_events', help='Имя границы чтения, своя у каждого потребителя')
+        parser.add_argument('--output', help='Файл, в который дописываются события, по умолчанию stdout')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Число событий в пакете')
+        parser.add_argument('--lag', type=int, default=5,
+                            help='События за последние секунды читаются в следующий раз')
+        parser.add_argument('--follow', action='store_true', help='Читать новые события, пока команда не остановлена')
+        parser.add_argument('--interval', type=float, default=1.0, help='Пауза между чтениями в режиме --follow, с')
+
+    def handle(self, *args, **options):
+        output = open(options['output'], 'a') if options['output'] else self.stdout
+        try:
+            while True:
+                count = GameEvent.objects.consume(options['name'], lambda events: self._write(output, events),
+                                                  batch_size=options['batch_size'], lag=options['lag'])
+                self.stderr.write('{} events consumed'.format(count))
+                if not options['follow']:
+                    return
+                time.sleep(options['interval'])
+        finally:
+            if output is not self.stdout:
+                output.close()
+
+    @staticmethod
+    def _write(output, events):
+        for event in events:
+            output.write(json.dumps(event.to_dict(), ensure_ascii=False) + '\n')
+        # Граница сдвигается только после того, как пакет записан
+        output.flush()
@@ -0,0 +1,40 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from game import importers
+from game.models import Category, points_changed
+
+
+class Command(BaseCommand):
+    help = 'Потоковая загрузка точек категории из GeoJSON, NDJSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу')
+        parser.add_argument('--category', type=int, required=True, help='Идентификатор категории')
+        parser.add_argument('--format', choices=importers.FORMATS, help='Формат файла, по умолчанию по расширению')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        category_id = options['category']
+        if not Category.objects.filter(pk=category_id).exists():
+            raise CommandError('Category {} does not exist'.format(category_id))
+        reader = importers.READERS[options['format'] or importers.detect_format(options['path'])]
+        loaded = skipped = 0
+        started = time.perf_counter()
+        try:
+            with open(options['path'], encoding='utf-8', newline='') as file:
+                for batch in importers.batches(reader(file), options['batch_size']):
+                    coordinates, invalid = importers.validate(batch)
+                    if len(coordinates):
+                        importers.load_points(category_id, coordinates)
+                    loaded += len(coordinates)
+                    skipped += invalid
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write('Loaded {} points ({:.0f} rows/sec)'.format(loaded, loaded / elapsed))
+        except ValueError as error:
+            raise CommandError('Failed to read {}: {}'.format(options['path'], error))
+        finally:
+            if loaded:
+                points_changed(category_id)
+        elapsed = time.perf_counter() - started
+        self.stdout.write('Imported {} points, skipped {} invalid rows in {:.1f} s ({:.0f} rows/sec)'.format(
+            loaded, skipped, elapsed, loaded / elapsed if elapsed else 0))
@@ -0,0 +1,57 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from authorization.models import User
+from game.loadtest import (ASYNC_ENDPOINTS, SYNC_ENDPOINTS, ClientPlayer, HttpPlayer, create_category, run_players,
+                           summarize)
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест полного цикла игры с отчетом о задержках, пропускной способности и SQL запросах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Адрес сервера, без него запросы идут через тестовый клиент '
+                                          'Django в этом процессе')
+        parser.add_argument('--async', dest='use_async', action='store_true',
+                            help='Использовать асинхронные эндпоинты')
+        parser.add_argument('--users', type=int, default=10, help='Число одновременных игроков')
+        parser.add_argument('--games', type=int, default=1, help='Число игр на игрока')
+        parser.add_argument('--category', help='Кодовое имя существующей категории')
+        parser.add_argument('--points', type=int, default=1000,
+                            help='Число точек во временной категории, если --category не указана')
+        parser.add_argument('--rounds', type=int, default=5, help='Число раундов во временной категории')
+        parser.add_argument('--output', help='Файл для результатов в формате JSON')
+
+    def handle(self, *args, **options):
+        if options['category'] is None and options['url'] is not None:
+            raise CommandError('--category is required when --url is set')
+        category = None
+        if options['category'] is None:
+            category = create_category(options['points'], options['rounds'])
+        codename = options['category'] or category.codename
+        player_class = HttpPlayer if options['url'] else ClientPlayer
+        endpoints = ASYNC_ENDPOINTS if options['use_async'] else SYNC_ENDPOINTS
+        try:
+            records, elapsed = run_players(options['url'] or '', endpoints, codename, options['users'],
+                                           options['games'], player_class=player_class)
+        finally:
+            if category is not None:
+                category.delete()
+                User.objects.filter(login__startswith='loadtest_').delete()
+        result = summarize(records, elapsed)
+        result['config'] = {key: options[key] for key in ('url', 'use_async', 'users', 'games', 'category',
+                                                          'points', 'rounds')}
+        self._print(result)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(result, output, indent=2)
+
+    def _print(self, result):
+        self.stdout.write('{requests} requests, {errors} errors, {elapsed_s:.2f} s, '
+                          '{throughput_rps:.1f} req/s'.format(**result))
+        self.stdout.write('{:<16}{:>8}{:>8}{:>10}{:>10}{:>10}{:>10}'.format(
+            'endpoint', 'count', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+        for endpoint, stats in result['endpoints'].items():
+            queries = stats['avg_queries']
+            self.stdout.write('{:<16}{:>8}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>10}'.format(
+                endpoint, stats['requests'], stats['errors'], stats['p50_ms'], stats['p95_ms'],
+                stats['p99_ms'], '{:.1f}'.format(queries) if queries is not None else '-'))
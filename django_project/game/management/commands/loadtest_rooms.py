@@ -0,0 +1,43 @@
+import json
+import uuid
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from django.core.management.base import BaseCommand
+from authorization.models import User
+from game.loadtest import create_category, run_rooms, summarize_fan_out
+from game.routing import websocket_urlpatterns
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест комнат: сотни WebSocket соединений в одном процессе с отчетом о задержке рассылки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=200, help='Общее число подключенных игроков')
+        parser.add_argument('--rooms', type=int, default=1, help='Число одновременных комнат')
+        parser.add_argument('--points', type=int, default=1000, help='Число точек во временной категории')
+        parser.add_argument('--rounds', type=int, default=5, help='Число раундов во временной категории')
+        parser.add_argument('--timeout', type=float, default=30, help='Время ожидания события, с')
+        parser.add_argument('--output', help='Файл для результатов в формате JSON')
+
+    def handle(self, *args, **options):
+        category = create_category(options['points'], options['rounds'])
+        try:
+            users = [User.objects.create(login='loadtest_{}'.format(uuid.uuid4().hex[:16]))
+                     for _ in range(options['sockets'])]
+            records, elapsed = async_to_sync(run_rooms)(URLRouter(websocket_urlpatterns), category.codename,
+                                                        users, options['rooms'], options['timeout'])
+        finally:
+            category.delete()
+            User.objects.filter(login__startswith='loadtest_').delete()
+        result = summarize_fan_out(records, elapsed)
+        result['config'] = {key: options[key] for key in ('sockets', 'rooms', 'points', 'rounds')}
+        self.stdout.write('{} sockets in {} rooms, {} deliveries, {:.2f} s'.format(
+            options['sockets'], options['rooms'], result['deliveries'], elapsed))
+        self.stdout.write('{:<16}{:>8}{:>10}{:>10}{:>10}{:>10}'.format(
+            'event', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'))
+        for event, stats in result['events'].items():
+            self.stdout.write('{:<16}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}'.format(
+                event, stats['count'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['max_ms']))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(result, output, indent=2)
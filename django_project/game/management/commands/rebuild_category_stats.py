@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from game.models import CategoryStats
+
+
+class Command(BaseCommand):
+    help = 'Пересчет статистики категорий с нуля'
+
+    def add_arguments(self, parser):
+        parser.add_argument('category_ids', type=int, nargs='*', help='Идентификаторы категорий')
+
+    def handle(self, *args, **options):
+        CategoryStats.objects.rebuild(category_ids=options['category_ids'] or None)
+        self.stdout.write('Category stats rebuilt')
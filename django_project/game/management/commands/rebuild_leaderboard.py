@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from game.models import LeaderboardEntry
+
+
+class Command(BaseCommand):
+    help = 'Пересчет рейтинга игроков по истории игр'
+
+    def handle(self, *args, **options):
+        LeaderboardEntry.objects.rebuild()
+        self.stdout.write('Leaderboard rebuilt: {} players'.format(LeaderboardEntry.objects.count()))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from game.functions import X, Y
+from game.models import CategoryStats, Game, LeaderboardEntry, Round, UserStats
+from game import scoring
+
+
+class Command(BaseCommand):
+    help = 'Пересчет очков всех раундов с указанной пользователем точкой'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Round.objects.filter(user_point__isnull=False, random_point__isnull=False).\
+            annotate(target_x=X('random_point__point'), target_y=Y('random_point__point'),
+                     guess_x=X('user_point'), guess_y=Y('user_point')).order_by('id')
+        last_id = 0
+        total = 0
+        category_ids = set()
+        user_ids = set()
+        while True:
+            rows = list(queryset.filter(id__gt=last_id).
+                        values_list('id', 'game_id', 'target_x', 'target_y', 'guess_x', 'guess_y')[:batch_size])
+            if not rows:
+                break
+            ids, game_ids, *coords = zip(*rows)
+            _, scores = scoring.score_rounds(list(zip(coords[0], coords[1])),
+                                             list(zip(coords[2], coords[3])))
+            rounds = [Round(id=round_id, score=int(score)) for round_id, score in zip(ids, scores)]
+            with transaction.atomic():
+                Round.objects.bulk_update(rounds, ['score'])
+                round_scores = Round.objects.filter(game=OuterRef('pk')).order_by().\
+                    values('game').annotate(total=Sum('score')).values('total')
+                Game.objects.finished().filter(pk__in=set(game_ids)).\
+                    update(score=Coalesce(Subquery(round_scores), 0))
+            last_id = ids[-1]
+            total += len(rows)
+            for category_id, user_id in Game.objects.filter(pk__in=set(game_ids)).order_by().\
+                    values_list('category_id', 'user_id').distinct():
+                category_ids.add(category_id)
+                user_ids.add(user_id)
+            self.stdout.write('Rescored {} rounds'.format(total))
+        # Очки обновлены запросами без сигналов, агрегаты пересчитываются по затронутым играм
+        CategoryStats.objects.rebuild(category_ids=list(category_ids))
+        LeaderboardEntry.objects.rebuild(user_ids=list(user_ids))
+        UserStats.objects.rebuild(user_ids=list(user_ids))
+        self.stdout.write('Rebuilt stats for {} categories and {} users'.format(len(category_ids), len(user_ids)))
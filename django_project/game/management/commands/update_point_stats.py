@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from game.models import PointStats
+
+
+class Command(BaseCommand):
+    help = 'Пересчет статистики точек по раундам, завершенным с прошлого запуска'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Пересчитать все точки с раундами')
+        parser.add_argument('--lag', type=int, default=60,
+                            help='Раунды, завершенные за последние секунды, обрабатываются в следующий раз')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Число точек в пакете')
+
+    def handle(self, *args, **options):
+        count = PointStats.objects.update_since_watermark(lag=options['lag'], batch_size=options['batch_size'],
+                                                          full=options['full'])
+        self.stdout.write('Point stats updated for {} points'.format(count))
@@ -0,0 +1,27 @@
+# Generated by Django 3.2 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0018_category_max_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='mode',
+            field=models.CharField(choices=[('classic', 'Раунды создаются по ходу игры'), ('pregenerated', 'Все раунды создаются в начале игры')], default='classic', max_length=20, verbose_name='Режим игры'),
+        ),
+        migrations.AddField(
+            model_name='round',
+            name='is_revealed',
+            field=models.BooleanField(default=True, verbose_name='Раунд открыт'),
+        ),
+        migrations.AddIndex(
+            model_name='round',
+            index=models.Index(fields=['game', 'is_revealed', 'num'], name='game_round_game_id_5c5b7e_idx'),
+        ),
+    ]
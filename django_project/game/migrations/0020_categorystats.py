@@ -0,0 +1,64 @@
+# Generated by Django 3.2 on 2026-10-18 11:00
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.db.models.deletion
+
+
+def fill_category_stats(apps, schema_editor):
+    """
+    Статистика категорий по уже созданным точкам и играм, как в CategoryStats.objects.rebuild()
+    """
+    Category = apps.get_model('game', 'Category')
+    CategoryStats = apps.get_model('game', 'CategoryStats')
+    Game = apps.get_model('game', 'Game')
+    Point = apps.get_model('game', 'Point')
+    points = dict(Point.objects.order_by().values('category').annotate(total=Count('id')).
+                  values_list('category', 'total'))
+    games = {row['category']: row for row in Game.objects.order_by().values('category').annotate(
+        games_total=Count('id'),
+        players_total=Count('user', distinct=True),
+        score_total=Sum('score'),
+        finished_games_total=Count('id', filter=Q(is_over=True)),
+        finished_score_total=Sum('score', filter=Q(is_over=True)),
+    )}
+    stats = []
+    for category_id in Category.objects.values_list('pk', flat=True):
+        row = games.get(category_id, {})
+        stats.append(CategoryStats(
+            category_id=category_id,
+            points_count=points.get(category_id, 0),
+            games_count=row.get('games_total', 0),
+            players_count=row.get('players_total', 0),
+            score_sum=row.get('score_total') or 0,
+            finished_games_count=row.get('finished_games_total', 0),
+            finished_score_sum=row.get('finished_score_total') or 0,
+        ))
+    CategoryStats.objects.bulk_create(stats, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0019_pregenerated_rounds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='game.category', verbose_name='Категория')),
+                ('points_count', models.IntegerField(default=0, verbose_name='Число точек')),
+                ('games_count', models.IntegerField(default=0, verbose_name='Число игр')),
+                ('players_count', models.IntegerField(default=0, verbose_name='Число игроков')),
+                ('score_sum', models.BigIntegerField(default=0, verbose_name='Сумма очков всех игр')),
+                ('finished_games_count', models.IntegerField(default=0, verbose_name='Число завершенных игр')),
+                ('finished_score_sum', models.BigIntegerField(default=0, verbose_name='Сумма очков завершенных игр')),
+            ],
+            options={
+                'verbose_name': 'Статистика категории',
+                'verbose_name_plural': 'Статистика категорий',
+            },
+        ),
+        migrations.RunPython(fill_category_stats, migrations.RunPython.noop),
+    ]
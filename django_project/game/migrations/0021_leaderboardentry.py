@@ -0,0 +1,53 @@
+# Generated by Django 3.2 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, ExpressionWrapper, F, Sum
+from django.db.models.functions import Cast
+import django.db.models.deletion
+
+
+def fill_leaderboard(apps, schema_editor):
+    """
+    Рейтинг игроков по уже сыгранным играм, как в LeaderboardEntry.objects.rebuild()
+    """
+    Game = apps.get_model('game', 'Game')
+    LeaderboardEntry = apps.get_model('game', 'LeaderboardEntry')
+    rows = Game.objects.order_by().values('user').annotate(
+        games_total=Count('id'),
+        sum_score_total=Sum('score'),
+        sum_ratio_total=Sum(ExpressionWrapper(Cast('score', models.FloatField()) / F('category__max_score'),
+                                              output_field=models.FloatField())),
+    )
+    LeaderboardEntry.objects.bulk_create([
+        LeaderboardEntry(user_id=row['user'], games_count=row['games_total'], sum_score=row['sum_score_total'],
+                         sum_ratio=row['sum_ratio_total'],
+                         avg_score=row['sum_ratio_total'] * 100 / row['games_total'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('game', '0020_categorystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='leaderboard_entry', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('games_count', models.IntegerField(default=0, verbose_name='Число игр')),
+                ('sum_score', models.BigIntegerField(default=0, verbose_name='Сумма очков')),
+                ('sum_ratio', models.FloatField(default=0, verbose_name='Сумма долей от максимального счета')),
+                ('avg_score', models.FloatField(db_index=True, default=0, verbose_name='Средний процент от максимального счета')),
+            ],
+            options={
+                'verbose_name': 'Позиция в рейтинге',
+                'verbose_name_plural': 'Рейтинг игроков',
+            },
+        ),
+        migrations.RunPython(fill_leaderboard, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2 on 2026-10-18 13:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('game', '0021_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('games_count', models.IntegerField(default=0, verbose_name='Число завершенных игр')),
+                ('best_game_score', models.IntegerField(default=None, null=True, verbose_name='Лучший счет игры')),
+                ('game_score_sum', models.BigIntegerField(default=0, verbose_name='Сумма очков игр')),
+                ('rounds_count', models.IntegerField(default=0, verbose_name='Число раундов')),
+                ('best_round_score', models.IntegerField(default=None, null=True, verbose_name='Лучший счет раунда')),
+                ('round_score_sum', models.BigIntegerField(default=0, verbose_name='Сумма очков раундов')),
+            ],
+            options={
+                'verbose_name': 'Статистика пользователя',
+                'verbose_name_plural': 'Статистика пользователей',
+            },
+        ),
+    ]
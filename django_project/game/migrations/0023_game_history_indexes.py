@@ -0,0 +1,25 @@
+# Generated by Django 3.2 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0022_userstats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['user', 'create_date', 'id'], name='game_game_user_id_6db8d4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['user', 'category', 'create_date', 'id'], name='game_game_user_id_3a5bd0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['user', 'is_over', 'create_date', 'id'], name='game_game_user_id_0a166a_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2 on 2026-10-18 15:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0023_game_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchWatermark',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Задача')),
+                ('value', models.DateTimeField(default=None, null=True, verbose_name='Обработано до')),
+            ],
+            options={
+                'verbose_name': 'Граница пакетной задачи',
+                'verbose_name_plural': 'Границы пакетных задач',
+            },
+        ),
+        migrations.CreateModel(
+            name='PointStats',
+            fields=[
+                ('point', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='game.point', verbose_name='Точка')),
+                ('guesses_count', models.IntegerField(default=0, verbose_name='Число ответов')),
+                ('distance_sum', models.FloatField(default=0, verbose_name='Сумма расстояний')),
+                ('median_distance', models.FloatField(default=None, null=True, verbose_name='Медианное расстояние')),
+                ('score_sum', models.BigIntegerField(default=0, verbose_name='Сумма очков')),
+                ('updated_at', models.DateTimeField(default=None, null=True, verbose_name='Время пересчета')),
+            ],
+            options={
+                'verbose_name': 'Статистика точки',
+                'verbose_name_plural': 'Статистика точек',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='round',
+            index=models.Index(condition=models.Q(('user_point__isnull', False)), fields=['date_end'], name='game_round_date_en_cedfcc_idx'),
+        ),
+    ]
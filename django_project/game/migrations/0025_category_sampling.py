@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0024_pointstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='sampling',
+            field=models.CharField(choices=[('uniform', 'Все точки с равной вероятностью'), ('underplayed', 'Чаще точки с меньшим числом ответов'), ('hard', 'Чаще точки с меньшим средним счетом')], default='uniform', max_length=20, verbose_name='Выбор точек'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2 on 2026-10-18 17:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('game', '0025_category_sampling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointRotation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seed', models.BigIntegerField(verbose_name='Зерно перестановки')),
+                ('cursor', models.IntegerField(default=0, verbose_name='Выдано точек в цикле')),
+                ('pool_size', models.IntegerField(verbose_name='Размер пула')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='point_rotations', to='game.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='point_rotations', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Очередь точек пользователя',
+                'verbose_name_plural': 'Очереди точек пользователей',
+                'unique_together': {('user', 'category')},
+            },
+        ),
+    ]
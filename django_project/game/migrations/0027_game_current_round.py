@@ -0,0 +1,43 @@
+# Generated by Django 3.2 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+# Раунды с повторяющимися номерами в игре перенумеровываются по порядку номера и id
+RENUMBER_DUPLICATE_ROUNDS = '''
+UPDATE game_round SET num = numbered.num
+FROM (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY game_id ORDER BY num, id) AS num
+    FROM game_round
+    WHERE num IS NOT NULL AND game_id IN (
+        SELECT game_id FROM game_round WHERE num IS NOT NULL GROUP BY game_id, num HAVING COUNT(*) > 1
+    )
+) AS numbered
+WHERE game_round.id = numbered.id
+'''
+
+SET_CURRENT_ROUND = '''
+UPDATE game_game SET current_round = COALESCE(
+    (SELECT MAX(num) FROM game_round WHERE game_id = game_game.id AND is_revealed), 0
+)
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0026_pointrotation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='current_round',
+            field=models.IntegerField(default=0, verbose_name='Номер последнего открытого раунда'),
+        ),
+        migrations.RunSQL(RENUMBER_DUPLICATE_ROUNDS, migrations.RunSQL.noop),
+        migrations.RunSQL(SET_CURRENT_ROUND, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='round',
+            constraint=models.UniqueConstraint(fields=('game', 'num'), name='unique_round_num_in_game'),
+        ),
+    ]
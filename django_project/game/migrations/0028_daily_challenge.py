@@ -0,0 +1,50 @@
+# Generated by Django 3.2 on 2026-10-18 19:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('game', '0027_game_current_round'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='game',
+            name='mode',
+            field=models.CharField(choices=[('classic', 'Раунды создаются по ходу игры'), ('pregenerated', 'Все раунды создаются в начале игры'), ('daily', 'Ежедневное испытание с общими для всех точками')], default='classic', max_length=20, verbose_name='Режим игры'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='challenge_date',
+            field=models.DateField(default=None, null=True, verbose_name='Дата ежедневного испытания'),
+        ),
+        migrations.AddConstraint(
+            model_name='game',
+            constraint=models.UniqueConstraint(fields=('user', 'category', 'challenge_date'), name='unique_daily_challenge_game'),
+        ),
+        migrations.CreateModel(
+            name='DailyLeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата испытания')),
+                ('score', models.IntegerField(verbose_name='Счет')),
+                ('finished_at', models.DateTimeField(auto_now_add=True, verbose_name='Время завершения')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.category', verbose_name='Категория')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Результат ежедневного испытания',
+                'verbose_name_plural': 'Рейтинг ежедневных испытаний',
+                'unique_together': {('category', 'date', 'user')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dailyleaderboardentry',
+            index=models.Index(fields=['category', 'date', '-score'], name='game_dailyl_categor_9e4798_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0028_daily_challenge'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchwatermark',
+            name='last_id',
+            field=models.BigIntegerField(default=0, verbose_name='Последний обработанный id'),
+        ),
+        migrations.CreateModel(
+            name='GameEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('game_started', 'Игра начата'), ('round_started', 'Раунд начат'), ('guess_submitted', 'Ответ принят'), ('game_ended', 'Игра завершена')], max_length=20, verbose_name='Тип события')),
+                ('game_id', models.BigIntegerField(verbose_name='Игра')),
+                ('user_id', models.BigIntegerField(default=None, null=True, verbose_name='Пользователь')),
+                ('round_id', models.BigIntegerField(default=None, null=True, verbose_name='Раунд')),
+                ('data', models.JSONField(default=dict, verbose_name='Данные события')),
+                ('created_at', models.DateTimeField(verbose_name='Время события')),
+            ],
+            options={
+                'verbose_name': 'Событие игры',
+                'verbose_name_plural': 'Журнал событий игр',
+            },
+        ),
+    ]
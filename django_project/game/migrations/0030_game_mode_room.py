@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0029_gameevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='game',
+            name='mode',
+            field=models.CharField(choices=[('classic', 'Раунды создаются по ходу игры'), ('pregenerated', 'Все раунды создаются в начале игры'), ('daily', 'Ежедневное испытание с общими для всех точками'), ('room', 'Игра в комнате, раунды открывает комната')], default='classic', max_length=20, verbose_name='Режим игры'),
+        ),
+    ]
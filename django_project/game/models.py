@@ -1,14 +1,64 @@
 import random
-from typing import List, Optional
+from datetime import timedelta
+from functools import partial
+from typing import Iterable, List, Optional
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.contrib.gis.db import models
-from django.contrib.gis.geos import LineString
-from django.db.models.signals import post_save
-from django.db.models import Sum
+from django.contrib.gis.geos import Point as GEOSPoint
+from django.db import connection, transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.db.models import Case, Count, Exists, ExpressionWrapper, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest, Now
 from django.dispatch import receiver
+from django.utils import timezone
+from . import scoring
+from .cache import category_cache
+from .daily import daily_challenges
+from .events import game_events
+from .functions import X, Y
+from .rotation import FeistelPermutation, new_seed
+from .sampling import point_index
+from .session import GameState, game_states
+from .signals import game_finished
+
+
+def get_difficulty(sum_scores, games_count, rounds_count):
+    if games_count == 0:
+        return None
+    avg_score = (sum_scores / (games_count * rounds_count * 5000)) * 100
+    if 0 <= avg_score < 30:
+        return 'hard'
+    elif 30 <= avg_score < 60:
+        return 'medium'
+    else:
+        return 'easy'
+
+
+class CategoryQueryset(models.QuerySet):
+    def with_stats(self, user=None):
+        """
+        Категории вместе со статистикой и отметкой лайка пользователя одним запросом
+        """
+        if user is None or user.is_anonymous:
+            is_liked = Value(False, output_field=models.BooleanField())
+        else:
+            is_liked = Exists(Category.likes.through.objects.filter(category_id=OuterRef('pk'),
+                                                                    user_id=user.pk))
+        return self.select_related('stats').annotate(is_liked=is_liked)
 
 
 class Category(models.Model):
+    SAMPLING_UNIFORM = 'uniform'
+    SAMPLING_UNDERPLAYED = 'underplayed'
+    SAMPLING_HARD = 'hard'
+    SAMPLING_CHOICES = (
+        (SAMPLING_UNIFORM, 'Все точки с равной вероятностью'),
+        (SAMPLING_UNDERPLAYED, 'Чаще точки с меньшим числом ответов'),
+        (SAMPLING_HARD, 'Чаще точки с меньшим средним счетом'),
+    )
+
     codename = models.CharField(max_length=20, verbose_name='Кодовое имя')
     name = models.CharField(max_length=50, verbose_name='Название')
     description = models.TextField(verbose_name='Описание')
@@ -16,6 +66,10 @@ class Category(models.Model):
     rounds_count = models.IntegerField(verbose_name='Число раундов')
     max_score = models.PositiveIntegerField(default=1, validators=[MinValueValidator(limit_value=1)])
     likes = models.ManyToManyField(to='authorization.User', related_name='liked_category')
+    sampling = models.CharField(max_length=20, choices=SAMPLING_CHOICES, default=SAMPLING_UNIFORM,
+                                verbose_name='Выбор точек')
+
+    objects = CategoryQueryset.as_manager()
 
     @property
     def points_count(self):
@@ -24,16 +78,30 @@ class Category(models.Model):
     @property
     def difficulty(self):
         games_count = self.games.all().count()
-        if games_count == 0:
-            return None
         query = self.games.aggregate(sum_scores=Sum('score'))
-        avg_score = (query['sum_scores'] / (games_count * self.rounds_count* 5000)) * 100
-        if 0 <= avg_score < 30:
-            return 'hard'
-        elif 30 <= avg_score < 60:
-            return 'medium'
-        else:
-            return 'easy'
+        return get_difficulty(query['sum_scores'], games_count, self.rounds_count)
+
+    def point_weights(self):
+        """
+        Пары (id, вес) точек категории по статистике точек для взвешенного выбора:
+        underplayed - 1 / (1 + число ответов), hard - от 1 до 2 по мере снижения
+        среднего счета, точкам без ответов достается середина диапазона
+        """
+        points = self.points.order_by('id').values_list('id', 'stats__guesses_count', 'stats__score_sum')
+        for point_id, guesses_count, score_sum in points.iterator(chunk_size=10000):
+            guesses_count = guesses_count or 0
+            if self.sampling == Category.SAMPLING_UNDERPLAYED:
+                yield point_id, 1 / (1 + guesses_count)
+            else:
+                avg_score = score_sum / guesses_count if guesses_count else scoring.MAX_SCORE / 2
+                yield point_id, 2 - min(avg_score, scoring.MAX_SCORE) / scoring.MAX_SCORE
+
+    def get_stats(self):
+        try:
+            return self.stats
+        except CategoryStats.DoesNotExist:
+            CategoryStats.objects.rebuild(category_ids=[self.pk])
+            return CategoryStats.objects.get(category=self)
 
     def __str__(self):
         return self.name
@@ -50,6 +118,18 @@ def set_max_score(sender, instance, created, **kwargs):
         instance.save()
 
 
+@receiver(post_save, sender=Category)
+def create_category_stats(sender, instance, created, **kwargs):
+    if created:
+        CategoryStats.objects.get_or_create(category=instance)
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category_point_index(sender, instance, **kwargs):
+    # Стратегия выбора точек могла измениться, индекс сбрасывается после коммита
+    transaction.on_commit(partial(point_index.invalidate, instance.pk))
+
+
 class PointQueryset(models.QuerySet):
     def random(self, exclude_pk: Optional[List[int]]=None):
 
@@ -58,6 +138,43 @@ class PointQueryset(models.QuerySet):
         random_id = random.choice(list(ids))
         return self.get(pk=random_id)
 
+    def random_in_category(self, category_id: int, exclude_pk: Optional[List[int]]=None):
+        """
+        Случайная точка категории, выбранная по индексу point_index одним запросом по pk
+        """
+        random_id = point_index.sample(category_id, exclude_pk)
+        point = self.filter(pk=random_id, category_id=category_id).first()
+        if point is None:
+            # Индекс устарел: точку удалили или перенесли в другую категорию
+            point_index.invalidate(category_id)
+            random_id = point_index.sample(category_id, exclude_pk)
+            point = self.get(pk=random_id)
+        return point
+
+    def deal_in_category(self, user_id: int, category_id: int, exclude_pk: Optional[List[int]]=None):
+        """
+        Следующая точка категории для пользователя. В категориях с равновероятным выбором
+        точки выдаются из перемешанного пула без повторов между играми (PointRotation),
+        во взвешенных категориях выбираются по весам
+        """
+        if point_index.table(category_id) is not None:
+            return self.random_in_category(category_id, exclude_pk)
+        point_id = PointRotation.objects.deal(user_id, category_id, 1, exclude_pk)[0]
+        point = self.filter(pk=point_id, category_id=category_id).first()
+        if point is None:
+            point_index.invalidate(category_id)
+            point_id = PointRotation.objects.deal(user_id, category_id, 1, exclude_pk)[0]
+            point = self.get(pk=point_id)
+        return point
+
+    def coordinates(self, points_ids: List[int]):
+        """
+        Список (id, долгота, широта) точек в порядке points_ids, удаленные точки пропускаются
+        """
+        coordinates = {point_id: (x, y) for point_id, x, y in self.filter(pk__in=points_ids).
+                       annotate(x=X('point'), y=Y('point')).values_list('id', 'x', 'y')}
+        return [(point_id, *coordinates[point_id]) for point_id in points_ids if point_id in coordinates]
+
 
 class Point(models.Model):
     point = models.PointField(verbose_name='Точка')
@@ -74,6 +191,35 @@ class Point(models.Model):
         verbose_name_plural = 'Точки'
 
 
+@receiver(post_save, sender=Point)
+@receiver(post_delete, sender=Point)
+def invalidate_point_index(sender, instance, **kwargs):
+    # После коммита, иначе параллельный запрос соберет и закэширует индекс по старым точкам
+    transaction.on_commit(partial(point_index.invalidate, instance.category_id))
+
+
+def points_changed(category_id: int):
+    """
+    Обновляет индекс, статистику и кэш категории после массового изменения точек,
+    при котором сигналы моделей не отправляются
+    """
+    CategoryStats.objects.rebuild(category_ids=[category_id])
+    transaction.on_commit(partial(point_index.invalidate, category_id))
+    transaction.on_commit(category_cache.bump)
+
+
+@receiver(post_save, sender=Point)
+def add_point_to_stats(sender, instance, created, **kwargs):
+    if created:
+        CategoryStats.objects.increment(instance.category_id, points_count=1)
+
+
+@receiver(post_delete, sender=Point)
+def remove_point_from_stats(sender, instance, **kwargs):
+    # При удалении категории ее статистика удаляется раньше точек и не должна создаваться заново
+    CategoryStats.objects.increment(instance.category_id, rebuild_missing=False, points_count=-1)
+
+
 class GameQueryset(models.QuerySet):
     def finished(self):
         return self.filter(is_over=True)
@@ -81,8 +227,105 @@ class GameQueryset(models.QuerySet):
     def active(self):
         return self.filter(is_over=False)
 
+    def history(self, user, category=None, is_over=None, created_after=None, created_before=None):
+        """
+        Игры пользователя с фильтрами истории, порядок задает пагинация по (create_date, id)
+        """
+        queryset = self.filter(user=user)
+        if category is not None:
+            queryset = queryset.filter(category=category)
+        if is_over is not None:
+            queryset = queryset.filter(is_over=is_over)
+        if created_after is not None:
+            queryset = queryset.filter(create_date__gte=created_after)
+        if created_before is not None:
+            queryset = queryset.filter(create_date__lt=created_before)
+        return queryset
+
+
+    def finalize(self, game_id: int):
+        """
+        Завершает активную игру одним UPDATE ... RETURNING: счет игры и итоги раундов
+        считаются в том же запросе. В итоги раундов попадают только раунды с ответом, раунды,
+        до которых игрок не дошел, не учитываются. Возвращает поля завершенной игры или None,
+        если игра уже завершена. Вызывается внутри транзакции.
+        """
+        game_table = connection.ops.quote_name(Game._meta.db_table)
+        round_table = connection.ops.quote_name(Round._meta.db_table)
+        category_table = connection.ops.quote_name(Category._meta.db_table)
+        with connection.cursor() as cursor:
+            # Строка игры блокируется до UPDATE: подзапрос по раундам в UPDATE видит снимок
+            # начала запроса, и очки раунда, записанные конкурентным set_user_point, пока UPDATE
+            # ждал блокировку, не попали бы в счет. После SELECT ... FOR UPDATE UPDATE получает
+            # новый снимок, а set_user_point, блокирующий ту же строку, видит is_over
+            cursor.execute('SELECT id FROM {} WHERE id = %s AND NOT is_over FOR UPDATE'.format(game_table),
+                           [game_id])
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute(
+                'UPDATE {game} AS game SET is_over = true, score = COALESCE(rounds.score, 0) '
+                'FROM (SELECT SUM(score) AS score, '
+                '             COUNT(id) FILTER (WHERE user_point IS NOT NULL) AS count, '
+                '             SUM(score) FILTER (WHERE user_point IS NOT NULL) AS total, '
+                '             MAX(score) FILTER (WHERE user_point IS NOT NULL) AS best '
+                '      FROM {round} WHERE game_id = %s) AS rounds '
+                'WHERE game.id = %s AND NOT game.is_over '
+                'RETURNING game.user_id, game.category_id, game.mode, game.create_date, game.score, '
+                '          game.current_round, game.challenge_date, rounds.count, rounds.total, rounds.best, '
+                '          (SELECT max_score FROM {category} WHERE id = game.category_id)'.format(
+                    game=game_table, round=round_table, category=category_table),
+                [game_id, game_id])
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        (user_id, category_id, mode, create_date, score, current_round, challenge_date,
+         count, total, best, max_score) = row
+        return {
+            'user_id': user_id, 'category_id': category_id, 'mode': mode, 'create_date': create_date,
+            'score': score, 'current_round': current_round, 'challenge_date': challenge_date, 'is_over': True,
+            'rounds_summary': {'count': count, 'total': total, 'best': best},
+            'category_max_score': max_score,
+        }
+
+
+    def allocate_round(self, game_id: int) -> Optional[int]:
+        """
+        Увеличивает счетчик current_round активной игры одним UPDATE ... RETURNING,
+        не выходя за Category.rounds_count. Возвращает новый номер раунда или None
+        """
+        game_table = connection.ops.quote_name(Game._meta.db_table)
+        category_table = connection.ops.quote_name(Category._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {game} SET current_round = current_round + 1 '
+                'WHERE id = %s AND NOT is_over '
+                'AND current_round < (SELECT rounds_count FROM {category} WHERE id = category_id) '
+                'RETURNING current_round'.format(game=game_table, category=category_table),
+                [game_id])
+            row = cursor.fetchone()
+        return row[0] if row is not None else None
+
+
+class NoRoundsLeft(Exception):
+    pass
+
+
+class GameIsOver(Exception):
+    pass
+
 
 class Game(models.Model):
+    MODE_CLASSIC = 'classic'
+    MODE_PREGENERATED = 'pregenerated'
+    MODE_DAILY = 'daily'
+    MODE_ROOM = 'room'
+    MODE_CHOICES = (
+        (MODE_CLASSIC, 'Раунды создаются по ходу игры'),
+        (MODE_PREGENERATED, 'Все раунды создаются в начале игры'),
+        (MODE_DAILY, 'Ежедневное испытание с общими для всех точками'),
+        (MODE_ROOM, 'Игра в комнате, раунды открывает комната'),
+    )
+
     category = models.ForeignKey(to=Category, on_delete=models.CASCADE, related_name='games',
                                  verbose_name='Категория')
     user = models.ForeignKey(to='authorization.USer', on_delete=models.CASCADE, related_name='games',
@@ -90,12 +333,145 @@ class Game(models.Model):
     create_date = models.DateTimeField(auto_now_add=True)
     is_over = models.BooleanField(default=False, verbose_name='Игра закончена')
     score = models.IntegerField(default=0)
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES, default=MODE_CLASSIC,
+                            verbose_name='Режим игры')
+    current_round = models.IntegerField(default=0, verbose_name='Номер последнего открытого раунда')
+    challenge_date = models.DateField(null=True, default=None, verbose_name='Дата ежедневного испытания')
 
     objects = GameQueryset.as_manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'create_date', 'id']),
+            models.Index(fields=['user', 'category', 'create_date', 'id']),
+            models.Index(fields=['user', 'is_over', 'create_date', 'id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category', 'challenge_date'],
+                                    name='unique_daily_challenge_game'),
+        ]
+
+    def start(self, points_ids: Optional[List[int]] = None):
+        """
+        Создает первый раунд игры и сохраняет состояние игры в кэше.
+        points_ids задает точки раундов заранее созданной игры
+        """
+        if self.mode in (Game.MODE_PREGENERATED, Game.MODE_ROOM):
+            first_round, points_ids = self.pregenerate_rounds(points_ids)
+            self.allocate_round()
+        elif self.mode == Game.MODE_DAILY:
+            first_round = self.daily_round(self.allocate_round())
+            points_ids = [first_round.random_point_id]
+        else:
+            first_round = Round(game=self, num=self.allocate_round())
+            first_round.set_random_point()
+            first_round.save()
+            points_ids = [first_round.random_point_id]
+        game_states.save(GameState(self.pk, self.user_id, self.category_id, self.mode, self.create_date,
+                                   used_points=points_ids, current_round=1, challenge_date=self.challenge_date))
+        game_events.record(GameEvent.GAME_STARTED, self.pk, self.user_id, category=self.category_id,
+                           mode=self.mode)
+        game_events.record(GameEvent.ROUND_STARTED, self.pk, self.user_id, first_round.pk, num=1,
+                           point=first_round.random_point_id)
+        return first_round
+
+    def next_round(self):
+        """
+        Создает или открывает следующий раунд игры. Номер раунда выдает счетчик
+        current_round, использованные точки берутся из состояния в кэше
+        """
+        with transaction.atomic():
+            # UPDATE счетчика блокирует строку игры, состояние читается и пишется под этой блокировкой
+            num = self.allocate_round()
+            state = game_states.load(self)
+            if self.mode == Game.MODE_PREGENERATED:
+                next_round = self.reveal_next_round(num)
+                if next_round is None:
+                    raise NoRoundsLeft()
+            elif self.mode == Game.MODE_DAILY:
+                next_round = self.daily_round(num)
+            else:
+                next_round = Round(game=self, num=num)
+                next_round.random_point = Point.objects.deal_in_category(self.user_id, self.category_id,
+                                                                         exclude_pk=state.used_points)
+                next_round.save()
+            state.add_round(next_round)
+            game_states.save(state)
+        game_events.record(GameEvent.ROUND_STARTED, self.pk, self.user_id, next_round.pk, num=next_round.num,
+                           point=next_round.random_point_id)
+        return next_round
+
+    def pregenerate_rounds(self, points_ids: Optional[List[int]] = None):
+        """
+        Создает все раунды игры одним запросом, открыт только первый раунд
+        """
+        if points_ids is None and point_index.table(self.category_id) is not None:
+            points_ids = point_index.sample_many(self.category_id, self.category.rounds_count)
+        elif points_ids is None:
+            points_ids = PointRotation.objects.deal(self.user_id, self.category_id, self.category.rounds_count)
+        rounds = Round.objects.bulk_create([
+            Round(game=self, num=num, random_point_id=point_id, is_revealed=num == 1)
+            for num, point_id in enumerate(points_ids, start=1)
+        ])
+        return rounds[0], points_ids
+
+    def daily_round(self, num):
+        """
+        Создает раунд с точкой номер num из последовательности ежедневного испытания,
+        точка берется из кэша без выбора случайной точки и запроса к таблице точек
+        """
+        sequence = daily_challenges.sequence(self.category_id, self.challenge_date)
+        if num > len(sequence):
+            raise NoRoundsLeft()
+        point_id, lon, lat = sequence[num - 1]
+        random_point = Point(pk=point_id, category_id=self.category_id, point=GEOSPoint(lon, lat, srid=4326))
+        next_round = Round(game=self, num=num, random_point=random_point)
+        next_round.save()
+        return next_round
+
+    def reveal_next_round(self, num):
+        """
+        Открывает заранее созданный раунд с номером num
+        """
+        next_round = self.rounds.filter(num=num, is_revealed=False).select_related('random_point').first()
+        if next_round is None:
+            return None
+        next_round.is_revealed = True
+        next_round.date_start = timezone.now()
+        next_round.save(update_fields=['is_revealed', 'date_start'])
+        return next_round
+
+    def allocate_round(self):
+        """
+        Номер следующего раунда, NoRoundsLeft, если все раунды категории уже открыты
+        """
+        num = Game.objects.allocate_round(self.pk)
+        if num is None:
+            raise NoRoundsLeft()
+        self.current_round = num
+        return num
+
     def set_score(self):
         scores_in_round = self.rounds.aggregate(scores=Sum('score'))
-        self.score = scores_in_round['scores']
+        self.score = scores_in_round['scores'] or 0
+
+    def finish(self):
+        """
+        Завершает игру и обновляет статистику в той же транзакции. Поля игры и итоги
+        раундов берутся из строки, возвращенной UPDATE, обработчики game_finished
+        используют их без повторного чтения
+        """
+        with transaction.atomic():
+            fields = Game.objects.finalize(self.pk)
+            if fields is None:
+                raise GameIsOver()
+            for field, value in fields.items():
+                setattr(self, field, value)
+            # При откате транзакции состояние будет собрано заново из БД
+            game_states.delete(self.pk)
+            game_finished.send(sender=Game, instance=self)
+            game_events.record(GameEvent.GAME_ENDED, self.pk, self.user_id, score=self.score,
+                               rounds=self.rounds_summary['count'])
 
     @property
     def round_counts(self):
@@ -106,6 +482,47 @@ class Game(models.Model):
         return list(self.rounds.values_list('random_point__id', flat=True))
 
 
+class RoundQueryset(models.QuerySet):
+    def answered(self):
+        return self.filter(user_point__isnull=False)
+
+    def save_user_point(self, round) -> bool:
+        """
+        Записывает точку пользователя, время и очки раунда одним UPDATE, если игра не завершена.
+        Строка игры блокируется, поэтому завершение игры не пропустит очки этого раунда
+        """
+        user_point = round.user_point.clone()
+        if user_point.srid is None:
+            user_point.srid = 4326
+        round_table = connection.ops.quote_name(Round._meta.db_table)
+        game_table = connection.ops.quote_name(Game._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {round} SET user_point = ST_GeomFromEWKT(%s), date_end = %s, score = %s '
+                'WHERE id = %s AND game_id IN '
+                '(SELECT id FROM {game} WHERE id = %s AND NOT is_over FOR UPDATE) '
+                'RETURNING score'.format(round=round_table, game=game_table),
+                [user_point.ewkt, round.date_end, round.score, round.pk, round.game_id])
+            row = cursor.fetchone()
+        if row is None:
+            return False
+        round.score = row[0]
+        return True
+
+    def reveal(self, games_ids: List[int], num: int) -> int:
+        """
+        Открывает раунд num заранее созданных игр games_ids. Счетчик current_round сдвигается
+        только у незавершенных игр, в которых открыт предыдущий раунд
+        """
+        with transaction.atomic():
+            Game.objects.filter(pk__in=games_ids, is_over=False, current_round=num - 1).\
+                update(current_round=num)
+            revealed = self.filter(game_id__in=games_ids, game__current_round=num, num=num, is_revealed=False).\
+                update(is_revealed=True, date_start=timezone.now())
+        game_states.delete_many(games_ids)
+        return revealed
+
+
 class Round(models.Model):
     game = models.ForeignKey(to=Game, on_delete=models.CASCADE, related_name='rounds',
                              verbose_name='Игра')
@@ -116,41 +533,711 @@ class Round(models.Model):
     date_start = models.DateTimeField(auto_now_add=True, verbose_name='Время начала раунда')
     date_end = models.DateTimeField(verbose_name='Время окончания раунда', null=True, default=None)
     score = models.IntegerField(default=0, null=True, verbose_name='Очки')
+    is_revealed = models.BooleanField(default=True, verbose_name='Раунд открыт')
 
+    objects = RoundQueryset.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['game', 'is_revealed', 'num']),
+            # Раунды с ответом после границы пересчета статистики точек
+            models.Index(fields=['date_end'], condition=Q(user_point__isnull=False),
+                         name='game_round_date_en_cedfcc_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'num'], name='unique_round_num_in_game'),
+        ]
 
     @property
     def distance_between_points(self):
         assert self.random_point is not None, 'Random point is not define'
         assert self.user_point is not None, 'User point is not define'
-        ls = LineString(self.random_point.point, self.user_point, srid=4326)
-        ls.transform(ct=54009)
-        return round(ls.length)
+        distance = scoring.distances(self.random_point.point.coords, self.user_point.coords)
+        return int(distance[0])
 
     def set_score(self):
-        value = 5000
         try:
             distance = self.distance_between_points
         except AssertionError:
-            value = 0
+            self.score = 0
         else:
-            if 150 < distance <= 1000:
-                value = 5000 - distance
-            elif 1000 < distance <= 100000:
-                value = 4000 - distance * 0.001
-            elif 100000 < distance <= 500000:
-                value = 3000 - distance * 0.002
-            elif 500000 < distance:
-                value = 2000 - distance * 0.001
-        finally:
-            self.score = value if value > 0 else 0
+            self.score = float(scoring.scores(distance))
+
+    def set_user_point(self, user_point):
+        self.user_point = user_point
+        self.date_end = timezone.now()
+        self.set_score()
+        self.score = int(self.score)
+        if not Round.objects.save_user_point(self):
+            raise GameIsOver()
+        state = game_states.get(self.game_id)
+        game_events.record(GameEvent.GUESS_SUBMITTED, self.game_id, state.user_id if state is not None else None,
+                           self.pk, num=self.num, score=self.score, point=list(self.user_point.coords))
 
     def set_random_point(self):
         used_points = self.game.used_points_pk
-        self.random_point = Point.objects.filter(category=self.game.category).\
-            random(exclude_pk=used_points)
+        self.random_point = Point.objects.deal_in_category(self.game.user_id, self.game.category_id,
+                                                           exclude_pk=used_points)
 
     def set_round_num(self):
-        self.num = self.game.round_counts
+        self.num = self.game.allocate_round()
+
+
+@receiver(post_save, sender=Game)
+def add_game_to_stats(sender, instance, created, **kwargs):
+    if not created:
+        return
+    is_new_player = not Game.objects.filter(category_id=instance.category_id, user_id=instance.user_id).\
+        exclude(pk=instance.pk).exists()
+    deltas = {'games_count': 1, 'players_count': int(is_new_player), 'score_sum': instance.score}
+    if instance.is_over:
+        deltas.update(finished_games_count=1, finished_score_sum=instance.score)
+    CategoryStats.objects.increment(instance.category_id, **deltas)
+
+
+@receiver(game_finished)
+def add_finished_game_to_stats(sender, instance, **kwargs):
+    # Счет активной игры равен нулю, поэтому в score_sum добавляется весь счет
+    CategoryStats.objects.increment(instance.category_id, finished_games_count=1,
+                                    score_sum=instance.score, finished_score_sum=instance.score)
+
+
+@receiver(pre_delete, sender=Game)
+def collect_deleted_game_stats(sender, instance, **kwargs):
+    # Раунды и категория удаляются каскадно раньше post_delete игры, поэтому ее вклад считается заранее
+    instance.category_max_score = Category.objects.filter(pk=instance.category_id).\
+        values_list('max_score', flat=True).first()
+    if instance.is_over:
+        instance.rounds_summary = instance.rounds.answered().\
+            aggregate(count=Count('id'), best=Max('score'), total=Sum('score'))
+
+
+@receiver(post_delete, sender=Game)
+def remove_game_from_stats(sender, instance, **kwargs):
+    CategoryStats.objects.remove_game(instance)
+
+
+class CategoryStatsQueryset(models.QuerySet):
+    def increment(self, category_id: int, rebuild_missing: bool = True, **deltas):
+        updated = self.filter(category_id=category_id).\
+            update(**{field: F(field) + value for field, value in deltas.items()})
+        if not updated and rebuild_missing:
+            self.rebuild(category_ids=[category_id])
+
+    def remove_game(self, game):
+        """
+        Вычитает удаленную игру, число игроков пересчитывается по оставшимся играм категории
+        """
+        players = Game.objects.filter(category_id=game.category_id).order_by().values('category').\
+            annotate(value=Count('user', distinct=True)).values('value')
+        deltas = {'games_count': 1, 'score_sum': game.score}
+        if game.is_over:
+            deltas.update(finished_games_count=1, finished_score_sum=game.score)
+        self.filter(category_id=game.category_id).update(
+            players_count=Coalesce(Subquery(players), 0),
+            **{field: F(field) - value for field, value in deltas.items()},
+        )
+
+    def rebuild(self, category_ids: Optional[List[int]]=None):
+        """
+        Пересчитывает статистику категорий по таблицам точек и игр
+        """
+        def aggregate(queryset, expression):
+            subquery = queryset.filter(category=OuterRef('pk')).order_by().values('category').\
+                annotate(value=expression).values('value')
+            return Coalesce(Subquery(subquery), 0)
+
+        categories = Category.objects.all()
+        if category_ids is not None:
+            categories = categories.filter(pk__in=category_ids)
+        categories = categories.annotate(
+            points_total=aggregate(Point.objects.all(), Count('id')),
+            games_total=aggregate(Game.objects.all(), Count('id')),
+            players_total=aggregate(Game.objects.all(), Count('user', distinct=True)),
+            score_total=aggregate(Game.objects.all(), Sum('score')),
+            finished_games_total=aggregate(Game.objects.finished(), Count('id')),
+            finished_score_total=aggregate(Game.objects.finished(), Sum('score')),
+        )
+        with transaction.atomic():
+            for category in categories:
+                self.update_or_create(category=category, defaults={
+                    'points_count': category.points_total,
+                    'games_count': category.games_total,
+                    'players_count': category.players_total,
+                    'score_sum': category.score_total,
+                    'finished_games_count': category.finished_games_total,
+                    'finished_score_sum': category.finished_score_total,
+                })
+
+
+class CategoryStats(models.Model):
+    category = models.OneToOneField(to=Category, on_delete=models.CASCADE, primary_key=True,
+                                    related_name='stats', verbose_name='Категория')
+    points_count = models.IntegerField(default=0, verbose_name='Число точек')
+    games_count = models.IntegerField(default=0, verbose_name='Число игр')
+    players_count = models.IntegerField(default=0, verbose_name='Число игроков')
+    score_sum = models.BigIntegerField(default=0, verbose_name='Сумма очков всех игр')
+    finished_games_count = models.IntegerField(default=0, verbose_name='Число завершенных игр')
+    finished_score_sum = models.BigIntegerField(default=0, verbose_name='Сумма очков завершенных игр')
+
+    objects = CategoryStatsQueryset.as_manager()
+
+    @property
+    def avg_games_score(self):
+        if self.finished_games_count == 0:
+            return None
+        return self.finished_score_sum / self.finished_games_count
+
+    def __str__(self):
+        return str(self.category)
+
+    class Meta:
+        verbose_name = 'Статистика категории'
+        verbose_name_plural = 'Статистика категорий'
+
+
+@receiver(post_save, sender=Game)
+def add_game_to_leaderboard(sender, instance, created, **kwargs):
+    if created:
+        LeaderboardEntry.objects.add_score(instance.user_id, instance.score / instance.category.max_score,
+                                           instance.score, games_count=1)
+
+
+@receiver(game_finished)
+def add_finished_game_to_leaderboard(sender, instance, **kwargs):
+    max_score = getattr(instance, 'category_max_score', None) or instance.category.max_score
+    LeaderboardEntry.objects.add_score(instance.user_id, instance.score / max_score, instance.score)
+
+
+@receiver(post_delete, sender=Game)
+def remove_game_from_leaderboard(sender, instance, **kwargs):
+    if instance.category_max_score:
+        LeaderboardEntry.objects.remove_score(instance.user_id, instance.score / instance.category_max_score,
+                                              instance.score)
+
+
+class LeaderboardQueryset(models.QuerySet):
+    def add_score(self, user_id: int, ratio: float, score: int, games_count: int = 0):
+        """
+        Добавляет очки игры пользователя, средний процент пересчитывается в том же UPDATE
+        """
+        updated = self.filter(user_id=user_id).update(
+            games_count=F('games_count') + games_count,
+            sum_score=F('sum_score') + score,
+            sum_ratio=F('sum_ratio') + ratio,
+            avg_score=ExpressionWrapper((F('sum_ratio') + ratio) * 100 / (F('games_count') + games_count),
+                                        output_field=models.FloatField()),
+        )
+        if not updated:
+            self.rebuild(user_ids=[user_id])
+
+    def remove_score(self, user_id: int, ratio: float, score: int):
+        """
+        Вычитает очки удаленной игры, у игрока без игр средний процент обнуляется
+        """
+        self.filter(user_id=user_id).update(
+            games_count=F('games_count') - 1,
+            sum_score=F('sum_score') - score,
+            sum_ratio=F('sum_ratio') - ratio,
+            avg_score=Case(
+                When(games_count__gt=1, then=ExpressionWrapper((F('sum_ratio') - ratio) * 100 / (F('games_count') - 1),
+                                                               output_field=models.FloatField())),
+                default=Value(0.0),
+            ),
+        )
+
+    def rebuild(self, user_ids: Optional[List[int]]=None):
+        """
+        Пересчитывает рейтинг игроков по всем играм
+        """
+        games = Game.objects.all()
+        if user_ids is not None:
+            games = games.filter(user_id__in=user_ids)
+        rows = games.order_by().values('user').annotate(
+            games_total=Count('id'),
+            sum_score_total=Sum('score'),
+            sum_ratio_total=Sum(ExpressionWrapper(Cast('score', models.FloatField()) / F('category__max_score'),
+                                                  output_field=models.FloatField())),
+        )
+        with transaction.atomic():
+            if user_ids is None:
+                self.all().delete()
+            for row in rows:
+                self.update_or_create(user_id=row['user'], defaults={
+                    'games_count': row['games_total'],
+                    'sum_score': row['sum_score_total'],
+                    'sum_ratio': row['sum_ratio_total'],
+                    'avg_score': row['sum_ratio_total'] * 100 / row['games_total'],
+                })
+
+    def top(self, limit: int, offset: int = 0):
+        return self.filter(games_count__gt=0).select_related('user').\
+            order_by('-avg_score', 'user_id')[offset:offset + limit]
+
+    def rank(self, entry):
+        return self.filter(games_count__gt=0).filter(
+            Q(avg_score__gt=entry.avg_score) | Q(avg_score=entry.avg_score, user_id__lt=entry.user_id)
+        ).count() + 1
+
+
+class LeaderboardEntry(models.Model):
+    user = models.OneToOneField(to='authorization.User', on_delete=models.CASCADE, primary_key=True,
+                                related_name='leaderboard_entry', verbose_name='Пользователь')
+    games_count = models.IntegerField(default=0, verbose_name='Число игр')
+    sum_score = models.BigIntegerField(default=0, verbose_name='Сумма очков')
+    sum_ratio = models.FloatField(default=0, verbose_name='Сумма долей от максимального счета')
+    avg_score = models.FloatField(default=0, db_index=True, verbose_name='Средний процент от максимального счета')
+
+    objects = LeaderboardQueryset.as_manager()
+
+    def __str__(self):
+        return str(self.user)
+
+    class Meta:
+        verbose_name = 'Позиция в рейтинге'
+        verbose_name_plural = 'Рейтинг игроков'
+
+
+@receiver(game_finished)
+def add_finished_game_to_daily_leaderboard(sender, instance, **kwargs):
+    if instance.mode == Game.MODE_DAILY and instance.challenge_date is not None:
+        DailyLeaderboardEntry.objects.get_or_create(
+            category_id=instance.category_id, date=instance.challenge_date, user_id=instance.user_id,
+            defaults={'score': instance.score},
+        )
+
+
+class DailyLeaderboardQueryset(models.QuerySet):
+    def for_day(self, category_id: int, date):
+        return self.filter(category_id=category_id, date=date)
+
+    def top(self, limit: int, offset: int = 0):
+        return self.select_related('user').order_by('-score', 'finished_at', 'user_id')[offset:offset + limit]
+
+    def rank(self, entry):
+        return self.filter(
+            Q(score__gt=entry.score) |
+            Q(score=entry.score, finished_at__lt=entry.finished_at) |
+            Q(score=entry.score, finished_at=entry.finished_at, user_id__lt=entry.user_id)
+        ).count() + 1
+
+
+class DailyLeaderboardEntry(models.Model):
+    category = models.ForeignKey(to=Category, on_delete=models.CASCADE, verbose_name='Категория')
+    date = models.DateField(verbose_name='Дата испытания')
+    user = models.ForeignKey(to='authorization.User', on_delete=models.CASCADE, verbose_name='Пользователь')
+    score = models.IntegerField(verbose_name='Счет')
+    finished_at = models.DateTimeField(auto_now_add=True, verbose_name='Время завершения')
+
+    objects = DailyLeaderboardQueryset.as_manager()
+
+    def __str__(self):
+        return '{} {} {}'.format(self.category, self.date, self.user)
+
+    class Meta:
+        unique_together = ('category', 'date', 'user')
+        indexes = [
+            models.Index(fields=['category', 'date', '-score']),
+        ]
+        verbose_name = 'Результат ежедневного испытания'
+        verbose_name_plural = 'Рейтинг ежедневных испытаний'
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def create_user_stats(sender, instance, created, **kwargs):
+    if created:
+        instance.stats = UserStats.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Game)
+def add_created_game_to_user_stats(sender, instance, created, **kwargs):
+    if created and instance.is_over:
+        UserStats.objects.add_game(instance)
+
+
+@receiver(game_finished)
+def add_finished_game_to_user_stats(sender, instance, **kwargs):
+    UserStats.objects.add_game(instance)
+
+
+@receiver(post_delete, sender=Game)
+def remove_game_from_user_stats(sender, instance, **kwargs):
+    if instance.is_over:
+        UserStats.objects.remove_game(instance)
+
+
+class UserStatsQueryset(models.QuerySet):
+    def for_user(self, user):
+        try:
+            return user.stats
+        except UserStats.DoesNotExist:
+            self.rebuild(user_ids=[user.pk])
+            user.stats = self.get(user=user)
+            return user.stats
+
+    def add_game(self, game):
+        rounds = getattr(game, 'rounds_summary', None) or game.rounds.answered().\
+            aggregate(count=Count('id'), best=Max('score'), total=Sum('score'))
+        updated = self.filter(user_id=game.user_id).update(
+            games_count=F('games_count') + 1,
+            game_score_sum=F('game_score_sum') + game.score,
+            best_game_score=Greatest(Coalesce('best_game_score', game.score), game.score),
+            rounds_count=F('rounds_count') + rounds['count'],
+            round_score_sum=F('round_score_sum') + (rounds['total'] or 0),
+            best_round_score=(Greatest(Coalesce('best_round_score', rounds['best']), rounds['best'])
+                              if rounds['best'] is not None else F('best_round_score')),
+        )
+        if not updated:
+            self.rebuild(user_ids=[game.user_id])
+
+    def remove_game(self, game):
+        """
+        Вычитает удаленную завершенную игру, лучшие результаты пересчитываются по оставшимся играм
+        """
+        rounds = game.rounds_summary
+        live = self.live(user_ids=[game.user_id])
+        self.filter(user_id=game.user_id).update(
+            games_count=F('games_count') - 1,
+            game_score_sum=F('game_score_sum') - game.score,
+            best_game_score=Subquery(live.values('best_game')),
+            rounds_count=F('rounds_count') - rounds['count'],
+            round_score_sum=F('round_score_sum') - (rounds['total'] or 0),
+            best_round_score=Subquery(live.values('best_round')),
+        )
+
+    def live(self, user_ids: Optional[List[int]]=None):
+        """
+        Статистика пользователей, посчитанная по таблицам игр и раундов
+        """
+        def aggregate(queryset, user_field, expression, default=None):
+            subquery = queryset.filter(**{user_field: OuterRef('pk')}).order_by().values(user_field).\
+                annotate(value=expression).values('value')
+            return Subquery(subquery) if default is None else Coalesce(Subquery(subquery), default)
+
+        users = get_user_model().objects.all()
+        if user_ids is not None:
+            users = users.filter(pk__in=user_ids)
+        games = Game.objects.finished()
+        rounds = Round.objects.answered().filter(game__is_over=True)
+        return users.annotate(
+            games_total=aggregate(games, 'user', Count('id'), 0),
+            best_game=aggregate(games, 'user', Max('score')),
+            game_score_total=aggregate(games, 'user', Sum('score'), 0),
+            rounds_total=aggregate(rounds, 'game__user', Count('id'), 0),
+            best_round=aggregate(rounds, 'game__user', Max('score')),
+            round_score_total=aggregate(rounds, 'game__user', Sum('score'), 0),
+        ).values('pk', 'games_total', 'best_game', 'game_score_total',
+                 'rounds_total', 'best_round', 'round_score_total')
+
+    def rebuild(self, user_ids: Optional[List[int]]=None):
+        with transaction.atomic():
+            for row in self.live(user_ids=user_ids):
+                self.update_or_create(user_id=row['pk'], defaults=UserStats.fields_from_live(row))
+
+
+class UserStats(models.Model):
+    """
+    Статистика пользователя по завершенным играм.
+
+    Раунды считаются только с ответом: раунды заранее созданных игр, до которых игрок
+    не дошел, не учитываются. Средний счет раунда - среднее по таким раундам завершенных игр,
+    одинаковые значения очков учитываются столько раз, сколько встречаются.
+    """
+    user = models.OneToOneField(to='authorization.User', on_delete=models.CASCADE, primary_key=True,
+                                related_name='stats', verbose_name='Пользователь')
+    games_count = models.IntegerField(default=0, verbose_name='Число завершенных игр')
+    best_game_score = models.IntegerField(null=True, default=None, verbose_name='Лучший счет игры')
+    game_score_sum = models.BigIntegerField(default=0, verbose_name='Сумма очков игр')
+    rounds_count = models.IntegerField(default=0, verbose_name='Число раундов')
+    best_round_score = models.IntegerField(null=True, default=None, verbose_name='Лучший счет раунда')
+    round_score_sum = models.BigIntegerField(default=0, verbose_name='Сумма очков раундов')
+
+    objects = UserStatsQueryset.as_manager()
+
+    @property
+    def avg_game_score(self):
+        return round(self.game_score_sum / self.games_count) if self.games_count else None
+
+    @property
+    def avg_round_score(self):
+        return round(self.round_score_sum / self.rounds_count) if self.rounds_count else None
+
+    @staticmethod
+    def fields_from_live(row):
+        return {
+            'games_count': row['games_total'],
+            'best_game_score': row['best_game'],
+            'game_score_sum': row['game_score_total'],
+            'rounds_count': row['rounds_total'],
+            'best_round_score': row['best_round'],
+            'round_score_sum': row['round_score_total'],
+        }
+
+    def __str__(self):
+        return str(self.user)
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+
+class BatchWatermark(models.Model):
+    """
+    Граница данных, уже обработанных пакетной задачей
+    """
+    name = models.CharField(max_length=100, primary_key=True, verbose_name='Задача')
+    value = models.DateTimeField(null=True, default=None, verbose_name='Обработано до')
+    last_id = models.BigIntegerField(default=0, verbose_name='Последний обработанный id')
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Граница пакетной задачи'
+        verbose_name_plural = 'Границы пакетных задач'
+
+
+class GameEventQueryset(models.QuerySet):
+    def read_since(self, after_id: int, limit: int = 1000, lag: int = 5):
+        """
+        События с id больше after_id по возрастанию id. Чтение останавливается на первом событии,
+        вставленном меньше lag секунд назад: пакеты разных процессов коммитятся не в порядке id,
+        и событие с меньшим id может появиться позже. Время сравнивается по часам БД
+        """
+        settled = ExpressionWrapper(Q(created_at__lte=Now() - timedelta(seconds=lag)),
+                                    output_field=models.BooleanField())
+        events = []
+        for event in self.filter(pk__gt=after_id).annotate(settled=settled).order_by('pk')[:limit]:
+            if not event.settled:
+                break
+            events.append(event)
+        return events
+
+    def consume(self, name: str, handle, batch_size: int = 1000, lag: int = 5) -> int:
+        """
+        Передает handle пакеты событий после границы name по возрастанию id и сдвигает границу
+        после каждого обработанного пакета. Возвращает число обработанных событий
+        """
+        watermark, _ = BatchWatermark.objects.get_or_create(name=name)
+        count = 0
+        while True:
+            events = self.read_since(watermark.last_id, batch_size, lag)
+            if not events:
+                return count
+            handle(events)
+            watermark.last_id = events[-1].pk
+            watermark.save(update_fields=['last_id'])
+            count += len(events)
+            if len(events) < batch_size:
+                return count
+
+
+class GameEvent(models.Model):
+    """
+    Запись журнала событий игры, только добавляется. Ссылки на игру, пользователя и раунд
+    хранятся без внешних ключей, чтобы вставка не проверяла и не блокировала эти строки
+    """
+    GAME_STARTED = 'game_started'
+    ROUND_STARTED = 'round_started'
+    GUESS_SUBMITTED = 'guess_submitted'
+    GAME_ENDED = 'game_ended'
+    TYPE_CHOICES = (
+        (GAME_STARTED, 'Игра начата'),
+        (ROUND_STARTED, 'Раунд начат'),
+        (GUESS_SUBMITTED, 'Ответ принят'),
+        (GAME_ENDED, 'Игра завершена'),
+    )
+
+    type = models.CharField(max_length=20, choices=TYPE_CHOICES, verbose_name='Тип события')
+    game_id = models.BigIntegerField(verbose_name='Игра')
+    user_id = models.BigIntegerField(null=True, default=None, verbose_name='Пользователь')
+    round_id = models.BigIntegerField(null=True, default=None, verbose_name='Раунд')
+    data = models.JSONField(default=dict, verbose_name='Данные события')
+    created_at = models.DateTimeField(verbose_name='Время события')
+
+    objects = GameEventQueryset.as_manager()
+
+    def to_dict(self):
+        return {'id': self.pk, 'type': self.type, 'game': self.game_id, 'user': self.user_id,
+                'round': self.round_id, 'data': self.data, 'created_at': self.created_at.isoformat()}
+
+    def __str__(self):
+        return '{} {}'.format(self.type, self.game_id)
+
+    class Meta:
+        verbose_name = 'Событие игры'
+        verbose_name_plural = 'Журнал событий игр'
+
+
+class PointStatsQueryset(models.QuerySet):
+    watermark_name = 'point_stats'
+
+    def finished_rounds(self):
+        return Round.objects.filter(user_point__isnull=False, random_point__isnull=False)
+
+    def update_since_watermark(self, lag: int = 60, batch_size: int = 1000, full: bool = False):
+        """
+        Пересчитывает статистику точек, у которых появились раунды, завершенные после
+        границы прошлого запуска (или всех точек с раундами при full). Раунды последних
+        lag секунд откладываются до следующего запуска, чтобы не пропустить еще
+        не закоммиченные ответы. Возвращает число пересчитанных точек
+        """
+        watermark, _ = BatchWatermark.objects.get_or_create(name=self.watermark_name)
+        until = timezone.now() - timedelta(seconds=lag)
+        rounds = self.finished_rounds()
+        if not full:
+            rounds = rounds.filter(date_end__lte=until)
+        if watermark.value is not None and not full:
+            rounds = rounds.filter(date_end__gt=watermark.value)
+        point_ids = sorted(set(rounds.values_list('random_point_id', flat=True)))
+        for start in range(0, len(point_ids), batch_size):
+            self.rebuild(point_ids[start:start + batch_size])
+        watermark.value = until
+        watermark.save(update_fields=['value'])
+        return len(point_ids)
+
+    def rebuild(self, point_ids: List[int]):
+        """
+        Статистика точек по всем их завершенным раундам: расстояния считаются
+        векторизованно одним пакетом, медиана - по отсортированным расстояниям группы
+        """
+        rounds = self.finished_rounds().filter(random_point_id__in=point_ids)
+        rows = list(rounds.annotate(target_x=X('random_point__point'), target_y=Y('random_point__point'),
+                                    guess_x=X('user_point'), guess_y=Y('user_point')).
+                    values_list('random_point_id', 'target_x', 'target_y', 'guess_x', 'guess_y', 'score'))
+        keys, *coords, round_scores = zip(*rows) if rows else ([], [], [], [], [], [])
+        distance = scoring.distances(list(zip(coords[0], coords[1])), list(zip(coords[2], coords[3])))
+        keys, counts, distance_sums, medians, score_sums = scoring.group_stats(
+            keys, distance, [score or 0 for score in round_scores])
+        stats = [PointStats(point_id=int(point_id), guesses_count=int(count), distance_sum=float(distance_sum),
+                            median_distance=float(median), score_sum=int(score_sum), updated_at=timezone.now())
+                 for point_id, count, distance_sum, median, score_sum
+                 in zip(keys, counts, distance_sums, medians, score_sums)]
+        with transaction.atomic():
+            self.filter(point_id__in=point_ids).delete()
+            self.bulk_create(stats)
+        # Веса точек во взвешенных категориях зависят от статистики
+        categories = Point.objects.filter(pk__in=point_ids).exclude(category__sampling=Category.SAMPLING_UNIFORM).\
+            order_by().values_list('category_id', flat=True).distinct()
+        for category_id in categories:
+            point_index.invalidate(category_id)
+
+
+class PointStats(models.Model):
+    """
+    Статистика ответов по точке, обновляется командой update_point_stats
+    """
+    point = models.OneToOneField(to=Point, on_delete=models.CASCADE, primary_key=True,
+                                 related_name='stats', verbose_name='Точка')
+    guesses_count = models.IntegerField(default=0, verbose_name='Число ответов')
+    distance_sum = models.FloatField(default=0, verbose_name='Сумма расстояний')
+    median_distance = models.FloatField(null=True, default=None, verbose_name='Медианное расстояние')
+    score_sum = models.BigIntegerField(default=0, verbose_name='Сумма очков')
+    updated_at = models.DateTimeField(null=True, default=None, verbose_name='Время пересчета')
+
+    objects = PointStatsQueryset.as_manager()
+
+    @property
+    def avg_distance(self):
+        return self.distance_sum / self.guesses_count if self.guesses_count else None
+
+    @property
+    def avg_score(self):
+        return self.score_sum / self.guesses_count if self.guesses_count else None
+
+    def __str__(self):
+        return str(self.point_id)
+
+    class Meta:
+        verbose_name = 'Статистика точки'
+        verbose_name_plural = 'Статистика точек'
+
+
+class PointRotationQueryset(models.QuerySet):
+    def deal(self, user_id: int, category_id: int, count: int, exclude_pk: Optional[Iterable[int]] = None):
+        """
+        Выдает до count точек категории, не входящих в exclude_pk, продолжая перестановку
+        пула пользователя. Когда пул исчерпан или изменился его размер, начинается новый цикл
+        """
+        ids = point_index.ids(category_id)
+        if not ids:
+            raise IndexError('Cannot choose from an empty sequence')
+        exclude = set(exclude_pk or ())
+        result = []
+        with transaction.atomic():
+            rotation, _ = self.select_for_update().get_or_create(
+                user_id=user_id, category_id=category_id,
+                defaults={'seed': new_seed(), 'pool_size': len(ids)})
+            if rotation.pool_size != len(ids):
+                rotation.start_cycle(len(ids))
+            attempts = len(ids) + count
+            while len(result) < count and attempts:
+                attempts -= 1
+                if rotation.cursor >= rotation.pool_size:
+                    rotation.start_cycle(len(ids))
+                point_id = ids[rotation.permutation()[rotation.cursor]]
+                rotation.cursor += 1
+                if point_id not in exclude and point_id not in result:
+                    result.append(point_id)
+            rotation.save(update_fields=['seed', 'cursor', 'pool_size'])
+        if not result and count:
+            raise IndexError('Cannot choose from an empty sequence')
+        return result
+
+
+class PointRotation(models.Model):
+    """
+    Перемешанный пул точек категории для пользователя: вместо списка точек хранится
+    зерно перестановки и число уже выданных точек
+    """
+    user = models.ForeignKey(to='authorization.User', on_delete=models.CASCADE, related_name='point_rotations',
+                             verbose_name='Пользователь')
+    category = models.ForeignKey(to=Category, on_delete=models.CASCADE, related_name='point_rotations',
+                                 verbose_name='Категория')
+    seed = models.BigIntegerField(verbose_name='Зерно перестановки')
+    cursor = models.IntegerField(default=0, verbose_name='Выдано точек в цикле')
+    pool_size = models.IntegerField(verbose_name='Размер пула')
+
+    objects = PointRotationQueryset.as_manager()
+
+    def permutation(self):
+        return FeistelPermutation(self.pool_size, self.seed)
+
+    def start_cycle(self, pool_size: int):
+        self.seed = new_seed()
+        self.cursor = 0
+        self.pool_size = pool_size
+
+    def __str__(self):
+        return '{} {}'.format(self.user_id, self.category_id)
+
+    class Meta:
+        unique_together = ['user', 'category']
+        verbose_name = 'Очередь точек пользователя'
+        verbose_name_plural = 'Очереди точек пользователей'
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Point)
+@receiver(post_delete, sender=Point)
+@receiver(post_delete, sender=Game)
+@receiver(game_finished)
+def bump_category_cache(sender, **kwargs):
+    # После коммита, иначе параллельный запрос закэширует в новой версии данные до коммита
+    transaction.on_commit(category_cache.bump)
+
+
+@receiver(post_save, sender=Game)
+def bump_category_cache_on_finished_game(sender, instance, created, **kwargs):
+    if created and instance.is_over:
+        transaction.on_commit(category_cache.bump)
+
+
+@receiver(m2m_changed, sender=Category.likes.through)
+def bump_category_cache_on_like(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(category_cache.bump)
 
 
 # @receiver(post_save, sender=Round)
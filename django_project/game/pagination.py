@@ -0,0 +1,23 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Пагинация курсором по (дата, id): страница выбирается условием по индексу,
+    а не OFFSET, поэтому любая страница стоит как первая
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class GamePagination(KeysetPagination):
+    ordering = ('-create_date', '-id')
+
+
+class RoundPagination(KeysetPagination):
+    ordering = ('-date_start', '-id')
+
+
+class PointStatsPagination(KeysetPagination):
+    ordering = ('point_id',)
@@ -0,0 +1,255 @@
+"""
+Комнаты для одновременной игры нескольких пользователей на одних и тех же точках.
+
+Состояние комнаты (игроки, текущий раунд, ответы раунда) хранится в памяти процесса,
+поэтому все подключения одной комнаты должны обслуживаться одним воркером. События комнаты
+рассылаются через группу слоя каналов. Каждый игрок играет свою игру Game в режиме
+MODE_ROOM с заранее созданными раундами на общих точках, так что история, статистика
+и рейтинг считаются так же, как для обычных игр. Раунды таких игр открывает и игры
+завершает только комната.
+"""
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.contrib.gis.geos import Point as GEOSPoint
+from django.db import transaction
+from .events import game_events
+from .models import Category, Game, GameEvent, GameIsOver, Point, Round
+from .sampling import point_index
+
+ROOM_STARTED_MESSAGE = 'Игра в комнате уже началась'
+ROOM_IS_FULL_MESSAGE = 'В комнате нет свободных мест'
+NOT_HOST_MESSAGE = 'Действие доступно только создателю комнаты'
+NO_POINTS_MESSAGE = 'В категории нет точек'
+
+
+class RoomError(Exception):
+    pass
+
+
+class RoomPlayer:
+    def __init__(self, user_id: int, login: str, channel_name: str):
+        self.user_id = user_id
+        self.login = login
+        self.channel_name = channel_name
+        self.connected = True
+        self.game_id: Optional[int] = None
+        self.rounds: Dict[int, int] = {}
+        self.score = 0
+
+    def to_dict(self):
+        return {'id': self.user_id, 'login': self.login, 'score': self.score, 'connected': self.connected}
+
+
+class Room:
+    STATE_WAITING = 'waiting'
+    STATE_PLAYING = 'playing'
+    STATE_FINISHED = 'finished'
+
+    def __init__(self, code: str, category_id: int, rounds_count: int):
+        self.code = code
+        self.category_id = category_id
+        self.rounds_count = rounds_count
+        self.state = Room.STATE_WAITING
+        self.host_id: Optional[int] = None
+        self.players: Dict[int, RoomPlayer] = {}
+        self.points: List[Tuple[int, float, float]] = []
+        self.current_round = 0
+        self.round_open = False
+        self.guesses: Dict[int, int] = {}
+        # Действия, которые ждут БД, выполняются по одному, чтобы состояние не менялось между await
+        self.lock = asyncio.Lock()
+
+    @property
+    def group(self):
+        return 'room_{}'.format(self.code)
+
+    @property
+    def max_players(self):
+        return getattr(settings, 'ROOM_MAX_PLAYERS', 500)
+
+    @property
+    def is_empty(self):
+        return not any(player.connected for player in self.players.values())
+
+    @property
+    def is_last_round(self):
+        return self.current_round >= len(self.points)
+
+    def join(self, user_id: int, login: str, channel_name: str) -> RoomPlayer:
+        """
+        Добавляет игрока в комнату, игрок начатой игры может переподключиться
+        """
+        player = self.players.get(user_id)
+        if player is not None:
+            player.channel_name = channel_name
+            player.connected = True
+        elif self.state != Room.STATE_WAITING:
+            raise RoomError(ROOM_STARTED_MESSAGE)
+        elif len(self.players) >= self.max_players:
+            raise RoomError(ROOM_IS_FULL_MESSAGE)
+        else:
+            player = self.players[user_id] = RoomPlayer(user_id, login, channel_name)
+        if self.host_id is None:
+            self.host_id = user_id
+        return player
+
+    def leave(self, user_id: int):
+        player = self.players.get(user_id)
+        if player is None:
+            return
+        if self.state == Room.STATE_WAITING:
+            del self.players[user_id]
+        else:
+            player.connected = False
+        if self.host_id == user_id:
+            self.host_id = next((player.user_id for player in self.players.values() if player.connected), None)
+
+    def check_host(self, user_id: int):
+        if user_id != self.host_id:
+            raise RoomError(NOT_HOST_MESSAGE)
+
+    def begin(self, points, games):
+        """
+        Запоминает общие точки и игры игроков, открывает первый раунд
+        """
+        self.points = points
+        for user_id, (game_id, rounds) in games.items():
+            # Игрок мог выйти, пока создавались игры
+            player = self.players.get(user_id)
+            if player is not None:
+                player.game_id = game_id
+                player.rounds = rounds
+        self.state = Room.STATE_PLAYING
+        self.open_round(1)
+
+    def open_round(self, num: int):
+        self.current_round = num
+        self.round_open = True
+        self.guesses = {}
+
+    def close_round(self):
+        self.round_open = False
+        if self.is_last_round:
+            self.state = Room.STATE_FINISHED
+
+    def add_guess(self, user_id: int, score: int):
+        self.guesses[user_id] = score
+        self.players[user_id].score += score
+
+    def all_guessed(self):
+        return all(player.user_id in self.guesses for player in self.players.values()
+                   if player.connected and player.game_id is not None)
+
+    def games_ids(self):
+        return [player.game_id for player in self.players.values() if player.game_id is not None]
+
+    def point_geometry(self, num: int):
+        _, lon, lat = self.points[num - 1]
+        return {'type': 'Point', 'coordinates': [lon, lat]}
+
+    def standings(self):
+        players = sorted(self.players.values(), key=lambda player: (-player.score, player.user_id))
+        return [dict(player.to_dict(), round_score=self.guesses.get(player.user_id)) for player in players]
+
+    def round_payload(self):
+        return {'num': self.current_round, 'rounds_count': len(self.points),
+                'random_point': self.point_geometry(self.current_round)}
+
+    def to_dict(self):
+        data = {
+            'code': self.code,
+            'category': self.category_id,
+            'state': self.state,
+            'host': self.host_id,
+            'rounds_count': len(self.points) or self.rounds_count,
+            'current_round': self.current_round,
+            'players': [player.to_dict() for player in self.players.values()],
+        }
+        if self.round_open:
+            data['round'] = self.round_payload()
+        return data
+
+
+class RoomRegistry:
+    """
+    Комнаты этого процесса по коду комнаты
+    """
+    def __init__(self):
+        self._rooms: Dict[str, Room] = {}
+
+    def get(self, code: str) -> Optional[Room]:
+        return self._rooms.get(code)
+
+    def get_or_create(self, code: str, category_id: int, rounds_count: int) -> Room:
+        room = self._rooms.get(code)
+        if room is None:
+            room = self._rooms[code] = Room(code, category_id, rounds_count)
+        return room
+
+    def remove(self, room: Room):
+        if self._rooms.get(room.code) is room:
+            del self._rooms[room.code]
+
+    def __len__(self):
+        return len(self._rooms)
+
+
+rooms = RoomRegistry()
+
+
+def find_category(codename: str) -> Optional[Tuple[int, int]]:
+    return Category.objects.filter(codename=codename).values_list('id', 'rounds_count').first()
+
+
+def start_room_games(category_id: int, users_ids: List[int]):
+    """
+    Выбирает общие точки комнаты и создает каждому игроку игру с заранее созданными раундами.
+    Возвращает точки (id, долгота, широта) и {user_id: (game_id, {номер раунда: id раунда})}
+    """
+    rounds_count = Category.objects.values_list('rounds_count', flat=True).get(pk=category_id)
+    try:
+        points = Point.objects.coordinates(point_index.sample_many(category_id, rounds_count))
+    except IndexError:
+        points = []
+    if not points:
+        raise RoomError(NO_POINTS_MESSAGE)
+    points_ids = [point_id for point_id, _, _ in points]
+    games = {}
+    with transaction.atomic():
+        for user_id in users_ids:
+            game = Game.objects.create(user_id=user_id, category_id=category_id, mode=Game.MODE_ROOM)
+            game.start(points_ids)
+            games[game.pk] = user_id
+        rounds = {}
+        for game_id, num, round_id in Round.objects.filter(game_id__in=games).values_list('game_id', 'num', 'id'):
+            rounds.setdefault(game_id, {})[num] = round_id
+    return points, {user_id: (game_id, rounds.get(game_id, {})) for game_id, user_id in games.items()}
+
+
+def submit_guess(game_id: int, round_id: int, num: int, point, user_point) -> int:
+    """
+    Очки ответа игрока, координаты точки раунда берутся из состояния комнаты без чтения из БД
+    """
+    point_id, lon, lat = point
+    round = Round(pk=round_id, game_id=game_id, num=num,
+                  random_point=Point(pk=point_id, point=GEOSPoint(lon, lat, srid=4326)))
+    round.set_user_point(user_point)
+    return round.score
+
+
+def reveal_room_round(room: Room, num: int):
+    Round.objects.reveal(room.games_ids(), num)
+    point_id = room.points[num - 1][0]
+    for player in room.players.values():
+        if player.game_id is not None:
+            game_events.record(GameEvent.ROUND_STARTED, player.game_id, player.user_id, player.rounds.get(num),
+                               num=num, point=point_id)
+
+
+def finish_room_games(games_ids: List[int]):
+    for game_id in games_ids:
+        try:
+            Game(pk=game_id).finish()
+        except GameIsOver:
+            pass
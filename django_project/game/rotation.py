@@ -0,0 +1,46 @@
+"""
+Перестановка индексов пула точек, заданная только зерном.
+
+Сеть Фейстеля переставляет числа в диапазоне степени двойки, значения за пределами
+размера пула пропускаются повторным применением (cycle walking), поэтому i-й элемент
+перестановки вычисляется за O(1) без хранения самой перестановки.
+"""
+import hashlib
+import random
+
+ROUNDS = 4
+
+
+def new_seed() -> int:
+    return random.getrandbits(63)
+
+
+class FeistelPermutation:
+    def __init__(self, size: int, seed: int):
+        if size <= 0:
+            raise ValueError('Permutation size must be positive')
+        self.size = size
+        self.seed = seed
+        self.half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+        self.mask = (1 << self.half_bits) - 1
+
+    def _round(self, num: int, value: int) -> int:
+        digest = hashlib.blake2b('{}:{}:{}'.format(self.seed, num, value).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') & self.mask
+
+    def _permute(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.mask
+        for num in range(ROUNDS):
+            left, right = right, left ^ self._round(num, right)
+        return (left << self.half_bits) | right
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index: int) -> int:
+        if not 0 <= index < self.size:
+            raise IndexError('Permutation index out of range')
+        value = self._permute(index)
+        while value >= self.size:
+            value = self._permute(value)
+        return value
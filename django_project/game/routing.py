@@ -0,0 +1,7 @@
+from django.urls import path
+from .consumers import RoomConsumer
+
+
+websocket_urlpatterns = [
+    path('ws/game/room/<slug:code>/', RoomConsumer.as_asgi(), name='room'),
+]
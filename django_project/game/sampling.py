@@ -0,0 +1,128 @@
+import random
+import uuid
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.core.cache import cache
+
+
+class AliasTable:
+    """
+    Таблица псевдонимов Уолкера (алгоритм Воуза) для выбора индекса с вероятностью,
+    пропорциональной весу, за O(1)
+    """
+    def __init__(self, weights: Iterable[float]):
+        weights = list(weights)
+        total = sum(weights)
+        if not weights or total <= 0 or min(weights) < 0:
+            raise ValueError('Weights must be non-negative with a positive sum')
+        n = len(weights)
+        scaled = [weight * n / total for weight in weights]
+        self.prob = array('d', [1.0] * n)
+        self.alias = array('q', range(n))
+        small = [i for i, value in enumerate(scaled) if value < 1]
+        large = [i for i, value in enumerate(scaled) if value >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] += scaled[less] - 1
+            (small if scaled[more] < 1 else large).append(more)
+        # Оставшиеся значения равны 1 с точностью до ошибок округления
+        self.weights = array('d', weights)
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self, rng=random) -> int:
+        i = rng.randrange(len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+
+class PointIndex:
+    """
+    Индекс идентификаторов точек категории для выбора случайной точки за O(1).
+
+    Версия индекса каждой категории хранится в кэше и меняется при изменении точек
+    или их весов, сами идентификаторы держатся в памяти процесса и перестраиваются из БД,
+    когда их версия расходится с версией в кэше. Для категорий со взвешенным выбором
+    вместе с идентификаторами строится таблица псевдонимов.
+    """
+    cache_key = 'point_index:{}:version'
+    max_attempts = 16
+
+    def __init__(self):
+        self._indexes: Dict[int, Tuple[str, array, Optional[AliasTable]]] = {}
+
+    def invalidate(self, category_id: int):
+        cache.set(self.cache_key.format(category_id), uuid.uuid4().hex, None)
+
+    def ids(self, category_id: int) -> array:
+        return self._get(category_id)[0]
+
+    def table(self, category_id: int) -> Optional[AliasTable]:
+        return self._get(category_id)[1]
+
+    def _get(self, category_id: int) -> Tuple[array, Optional[AliasTable]]:
+        key = self.cache_key.format(category_id)
+        version = cache.get(key)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.add(key, version, None)
+            version = cache.get(key, version)
+        local = self._indexes.get(category_id)
+        if local is not None and local[0] == version:
+            return local[1:]
+        ids, table = self._load(category_id)
+        self._indexes[category_id] = (version, ids, table)
+        return ids, table
+
+    def sample(self, category_id: int, exclude_pk: Optional[Iterable[int]] = None) -> int:
+        return self.sample_many(category_id, 1, exclude_pk)[0]
+
+    def sample_many(self, category_id: int, count: int,
+                    exclude_pk: Optional[Iterable[int]] = None) -> List[int]:
+        """
+        Выбирает count различных идентификаторов точек категории, не входящих в exclude_pk,
+        с учетом весов точек, если они заданы.
+        Если подходящих точек меньше, чем count, возвращает все подходящие.
+        """
+        ids, table = self._get(category_id)
+        exclude = set(exclude_pk or ())
+        result = []
+        chosen = set()
+        attempts = self.max_attempts + count
+        while len(result) < count and attempts:
+            attempts -= 1
+            if not ids:
+                break
+            point_id = ids[table.sample() if table is not None else random.randrange(len(ids))]
+            if point_id in exclude or point_id in chosen:
+                continue
+            chosen.add(point_id)
+            result.append(point_id)
+        if len(result) < count:
+            # Почти все точки исключены, выбираем из оставшихся
+            rest = [i for i, point_id in enumerate(ids) if point_id not in exclude and point_id not in chosen]
+            while rest and len(result) < count:
+                i = (random.choices(range(len(rest)), [table.weights[j] for j in rest])[0]
+                     if table is not None else random.randrange(len(rest)))
+                result.append(ids[rest.pop(i)])
+        if not result and count:
+            raise IndexError('Cannot choose from an empty sequence')
+        return result
+
+    def _load(self, category_id: int) -> Tuple[array, Optional[AliasTable]]:
+        from .models import Category, Point
+        category = Category.objects.filter(pk=category_id).first()
+        if category is None or category.sampling == Category.SAMPLING_UNIFORM:
+            return array('q', Point.objects.filter(category_id=category_id).
+                         order_by('id').values_list('id', flat=True).iterator(chunk_size=10000)), None
+        ids = array('q')
+        weights = array('d')
+        for point_id, weight in category.point_weights():
+            ids.append(point_id)
+            weights.append(weight)
+        return ids, AliasTable(weights) if ids else None
+
+
+point_index = PointIndex()
@@ -0,0 +1,87 @@
+"""
+Векторизованный расчет расстояний и очков раундов.
+
+Расстояние между загаданной точкой и точкой пользователя считается как длина
+отрезка в проекции Мольвейде (EPSG:54009), так же как LineString.transform(54009)
+в Round.distance_between_points, но сразу для массивов координат.
+"""
+import numpy as np
+
+EARTH_RADIUS = 6378137.0
+MAX_SCORE = 5000
+MAX_ITER = 30
+LOOP_TOL = 1e-7
+
+
+def mollweide(lon, lat):
+    """
+    Прямая проекция Мольвейде (сфера радиусом большой полуоси WGS84), градусы -> метры
+    """
+    lam = np.radians(np.asarray(lon, dtype=np.float64))
+    phi = np.radians(np.asarray(lat, dtype=np.float64))
+    # Как adjlon в PROJ: долгота приводится к [-180, 180] только за пределами диапазона,
+    # иначе 180 превратилась бы в -180
+    lam = np.where(np.abs(lam) > np.pi + 1e-12, (lam + np.pi) % (2 * np.pi) - np.pi, lam)
+    k = np.pi * np.sin(phi)
+    theta = phi.copy()
+    active = np.ones(theta.shape, dtype=bool)
+    for _ in range(MAX_ITER):
+        if not active.any():
+            break
+        delta = (theta + np.sin(theta) - k) / (1. + np.cos(theta))
+        theta = np.where(active, theta - delta, theta)
+        active &= np.abs(delta) >= LOOP_TOL
+    theta = np.where(active, np.copysign(np.pi, theta), theta) * 0.5
+    x = EARTH_RADIUS * 2 * np.sqrt(2) / np.pi * lam * np.cos(theta)
+    y = EARTH_RADIUS * np.sqrt(2) * np.sin(theta)
+    return x, y
+
+
+def distances(target, guess):
+    """
+    Расстояния в метрах (округленные) между массивами точек формы (N, 2): (долгота, широта)
+    """
+    target = np.asarray(target, dtype=np.float64).reshape(-1, 2)
+    guess = np.asarray(guess, dtype=np.float64).reshape(-1, 2)
+    target_x, target_y = mollweide(target[:, 0], target[:, 1])
+    guess_x, guess_y = mollweide(guess[:, 0], guess[:, 1])
+    return np.round(np.hypot(target_x - guess_x, target_y - guess_y))
+
+
+def scores(distance):
+    """
+    Очки за раунд по массиву расстояний
+    """
+    distance = np.asarray(distance, dtype=np.float64)
+    value = np.select(
+        [distance <= 150, distance <= 1000, distance <= 100000, distance <= 500000],
+        [MAX_SCORE, 5000 - distance, 4000 - distance * 0.001, 3000 - distance * 0.002],
+        2000 - distance * 0.001,
+    )
+    return np.maximum(value, 0)
+
+
+def score_rounds(target, guess):
+    """
+    Расстояния и очки для массивов пар (загаданная точка, точка пользователя)
+    """
+    distance = distances(target, guess)
+    return distance, scores(distance)
+
+
+def group_stats(keys, distance, score):
+    """
+    Статистика по группам: ключи, число значений, сумма и медиана расстояний, сумма очков
+    """
+    keys = np.asarray(keys)
+    distance = np.asarray(distance, dtype=np.float64)
+    score = np.asarray(score, dtype=np.float64)
+    if not len(keys):
+        empty = np.array([])
+        return keys, empty.astype(int), empty, empty, empty
+    order = np.lexsort((distance, keys))
+    keys, distance, score = keys[order], distance[order], score[order]
+    unique, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    median = (distance[starts + (counts - 1) // 2] + distance[starts + counts // 2]) / 2
+    return (unique, counts, np.add.reduceat(distance, starts), median,
+            np.add.reduceat(score, starts))
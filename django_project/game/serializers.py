@@ -1,32 +1,45 @@
-from django.db.models import Avg
 from django.contrib.auth.models import AnonymousUser
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from rest_framework_gis.serializers import (GeometrySerializerMethodField,
                                             GeometryField)
-from authorization.models import User
-from .models import Category, Game, Round
+from .daily import daily_challenges
+from .models import Category, Game, PointStats, Round, get_difficulty
+
+
+DAILY_CHALLENGE_PLAYED_MESSAGE = 'Испытание дня уже пройдено'
+DAILY_CHALLENGE_CONSTRAINT = 'unique_daily_challenge_game'
+ROOM_GAME_START_MESSAGE = 'Игру в комнате можно начать только в комнате'
 
 
 class CategorySerializer(serializers.ModelSerializer):
-    points_count = serializers.ReadOnlyField()
+    points_count = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
     avg_games_score = serializers.SerializerMethodField()
     players_count = serializers.SerializerMethodField()
     like = serializers.SerializerMethodField()
-    difficulty = serializers.ReadOnlyField()
+    difficulty = serializers.SerializerMethodField()
 
     def get_like(self, obj):
+        if hasattr(obj, 'is_liked'):
+            return obj.is_liked
         user = self.context.get('user', None)
         if user is None or user.is_anonymous:
             return False
         return user.liked_category.filter(pk=obj.pk).exists()
 
+    def get_points_count(self, obj):
+        return obj.get_stats().points_count
+
+    def get_difficulty(self, obj):
+        stats = obj.get_stats()
+        return get_difficulty(stats.score_sum, stats.games_count, obj.rounds_count)
+
     def get_players_count(self, obj):
-        return User.objects.filter(games__category=obj).distinct().count()
+        return obj.get_stats().players_count
 
     def get_avg_games_score(self, obj):
-        result = obj.games.finished().aggregate(avg_score=Avg('score'))
-        return result['avg_score']
+        return obj.get_stats().avg_games_score
 
     def get_image(self, instance):
         return instance.image.url if instance.image else None
@@ -52,13 +65,34 @@ class GameStartRequestBodySerializer(serializers.ModelSerializer):
     category = serializers.SlugRelatedField(queryset=Category.objects.all(),
                                             slug_field='codename')
 
+    def validate_mode(self, value):
+        if value == Game.MODE_ROOM:
+            raise serializers.ValidationError(ROOM_GAME_START_MESSAGE)
+        return value
+
+    def validate(self, attrs):
+        if attrs.get('mode') == Game.MODE_DAILY:
+            attrs['challenge_date'] = daily_challenges.today()
+            if Game.objects.filter(user=self.context['user'], category=attrs['category'],
+                                   challenge_date=attrs['challenge_date']).exists():
+                raise serializers.ValidationError(DAILY_CHALLENGE_PLAYED_MESSAGE)
+        return attrs
+
     def create(self, validated_data):
         validated_data['user'] = self.context['user']
-        return super(GameStartRequestBodySerializer, self).create(validated_data)
+        try:
+            # Одновременные попытки начать испытание дня отсекает уникальное ограничение
+            with transaction.atomic():
+                return super(GameStartRequestBodySerializer, self).create(validated_data)
+        except IntegrityError as error:
+            constraint = getattr(getattr(error.__cause__, 'diag', None), 'constraint_name', None)
+            if validated_data.get('mode') != Game.MODE_DAILY or constraint != DAILY_CHALLENGE_CONSTRAINT:
+                raise
+            raise serializers.ValidationError(DAILY_CHALLENGE_PLAYED_MESSAGE)
 
     class Meta:
         model = Game
-        fields = ['category']
+        fields = ['category', 'mode']
 
 
 class GameStartResponseSerializer(RoundReadBaseSerializer):
@@ -79,6 +113,21 @@ class GameReadSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class GameHistoryQuerySerializer(serializers.Serializer):
+    category = serializers.IntegerField(required=False, help_text='Идентификатор категории')
+    is_over = serializers.BooleanField(required=False, allow_null=True, default=None)
+    created_after = serializers.DateTimeField(required=False, help_text='Игры, начатые не раньше')
+    created_before = serializers.DateTimeField(required=False, help_text='Игры, начатые раньше')
+
+
+class RoundListQuerySerializer(serializers.Serializer):
+    game = serializers.IntegerField(required=False, help_text='Идентификатор игры')
+
+
+class PointStatsQuerySerializer(serializers.Serializer):
+    category = serializers.IntegerField(required=False, help_text='Идентификатор категории')
+
+
 class RoundSetPointRequestBodySerializer(serializers.ModelSerializer):
     user_point = GeometryField()
 
@@ -106,8 +155,38 @@ class RoundReadSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class PointStatsSerializer(serializers.ModelSerializer):
+    category = serializers.IntegerField(source='point.category_id')
+    avg_distance = serializers.FloatField()
+    avg_score = serializers.FloatField()
+
+    class Meta:
+        model = PointStats
+        fields = ['point', 'category', 'guesses_count', 'avg_distance', 'median_distance', 'avg_score',
+                  'updated_at']
+
+
+class TopPlayersQuerySerializer(serializers.Serializer):
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    offset = serializers.IntegerField(min_value=0, default=0)
+
+
 class TopPlayersResponseSerializer(serializers.Serializer):
-    id = serializers.IntegerField()
-    login = serializers.CharField()
+    id = serializers.IntegerField(source='user_id')
+    login = serializers.CharField(source='user.login')
     avg_score = serializers.FloatField()
-    sum_score = serializers.IntegerField()
\ No newline at end of file
+    sum_score = serializers.IntegerField()
+
+
+class PlayerRankResponseSerializer(TopPlayersResponseSerializer):
+    rank = serializers.IntegerField()
+
+class DailyLeaderboardQuerySerializer(TopPlayersQuerySerializer):
+    date = serializers.DateField(required=False, help_text='Дата испытания, по умолчанию сегодня')
+
+
+class DailyLeaderboardEntrySerializer(serializers.Serializer):
+    id = serializers.IntegerField(source='user_id')
+    login = serializers.CharField(source='user.login')
+    score = serializers.IntegerField()
+    finished_at = serializers.DateTimeField()
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.core.cache import cache
+
+
+class GameState:
+    """
+    Состояние активной игры: категория, использованные точки и номер текущего раунда
+    """
+    fields = ('game_id', 'user_id', 'category_id', 'mode', 'create_date', 'used_points',
+              'current_round', 'challenge_date')
+
+    def __init__(self, game_id, user_id, category_id, mode, create_date, used_points=None,
+                 current_round=0, challenge_date=None):
+        self.game_id = game_id
+        self.user_id = user_id
+        self.category_id = category_id
+        self.mode = mode
+        self.create_date = create_date
+        self.used_points = used_points or []
+        self.current_round = current_round
+        self.challenge_date = challenge_date
+
+    def add_round(self, round):
+        self.current_round = max(self.current_round, round.num or 0)
+        if round.random_point_id is not None and round.random_point_id not in self.used_points:
+            self.used_points.append(round.random_point_id)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.fields}
+
+
+class GameStateStore:
+    """
+    Хранит состояние активных игр в кэше от начала до завершения игры.
+    БД остается основным хранилищем: изменения пишутся в нее, а при промахе кэша
+    состояние собирается заново по игре и ее раундам.
+    """
+    cache_key = 'game_state:{}'
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'GAME_STATE_TIMEOUT', 6 * 60 * 60)
+
+    def get(self, game_id):
+        data = cache.get(self.cache_key.format(game_id))
+        return GameState(**data) if data is not None else None
+
+    def save(self, state):
+        cache.set(self.cache_key.format(state.game_id), state.to_dict(), self.timeout)
+
+    def delete(self, game_id):
+        cache.delete(self.cache_key.format(game_id))
+
+    def delete_many(self, games_ids):
+        cache.delete_many([self.cache_key.format(game_id) for game_id in games_ids])
+
+    def load(self, game):
+        """
+        Состояние игры из кэша или, при промахе, из БД
+        """
+        state = self.get(game.pk)
+        if state is not None:
+            return state
+        state = GameState(game.pk, game.user_id, game.category_id, game.mode, game.create_date,
+                          challenge_date=game.challenge_date)
+        rounds = game.rounds.values_list('num', 'random_point_id', 'is_revealed')
+        for num, random_point_id, is_revealed in rounds:
+            if random_point_id is not None:
+                state.used_points.append(random_point_id)
+            if num is not None and is_revealed:
+                state.current_round = max(state.current_round, num)
+        self.save(state)
+        return state
+
+    def get_game(self, game_id, user):
+        """
+        Активная игра пользователя, собранная из состояния в кэше без запроса к БД
+        """
+        from .models import Game
+        try:
+            state = self.get(int(game_id))
+        except (TypeError, ValueError):
+            return None
+        if state is None or state.user_id != user.pk:
+            return None
+        return Game(pk=state.game_id, user_id=state.user_id, category_id=state.category_id,
+                    mode=state.mode, create_date=state.create_date, challenge_date=state.challenge_date,
+                    is_over=False)
+
+
+game_states = GameStateStore()
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+
+# Отправляется после завершения игры, instance - завершенная игра
+game_finished = Signal()
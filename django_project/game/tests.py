@@ -1,16 +1,47 @@
+import io
 import json
-from unittest.mock import patch, PropertyMock
+import os
+import random
+import tempfile
+import threading
+from datetime import timedelta
+from unittest.mock import Mock, patch, PropertyMock
 import geojson
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.gis.geos import GEOSGeometry, LineString
-from rest_framework import status
-from rest_framework.test import APITestCase, APIRequestFactory, force_authenticate
+from rest_framework import serializers, status
+from rest_framework.test import APITestCase, APITransactionTestCase, APIRequestFactory, force_authenticate
 from rest_framework_gis.serializers import GeometryField
 from authorization.factories import UserFactory
-from .models import Point, Game, Round
+from geoquizz_backend.db import check_connections
+from geoquizz_backend.testing import QueryBudgetTestCase
+from .models import (Category, CategoryStats, GameEvent, GameIsOver, LeaderboardEntry, Point, PointRotation,
+                     PointStats, Game, NoRoundsLeft, Round, UserStats, get_difficulty)
 from .factories import (PointFactory, CategoryFactory, GameFactory,
                         RoundFactory)
-from .serializers import CategorySerializer
+from . import importers, scoring
+from .cache import category_cache
+from .daily import daily_challenges
+from .events import game_events
+from .consumers import ALREADY_GUESSED_MESSAGE
+from .loadtest import (ROOM_PATH, SYNC_ENDPOINTS, ClientPlayer, play_game, run_rooms, summarize,
+                       summarize_fan_out)
+from .rooms import NOT_HOST_MESSAGE, rooms
+from .rotation import FeistelPermutation
+from .routing import websocket_urlpatterns
+from .sampling import AliasTable, point_index
+from .session import game_states
+from .serializers import CategorySerializer, GameStartRequestBodySerializer
 from .permissions import PlayInCategoryPermission
 from .views import CategoryViewSet, top_players
 
@@ -36,6 +67,67 @@ class CategoryModelTest(APITestCase):
         self.assertEqual(hard_category.difficulty, 'hard')
 
 
+class CategoryStatsTest(APITestCase):
+    def test_incremental_stats(self):
+        category = CategoryFactory(rounds_count=1)
+        point = PointFactory(category=category)
+        PointFactory(category=category)
+        user = UserFactory()
+        game_1 = GameFactory(category=category, user=user)
+        GameFactory(category=category, user=user)
+        RoundFactory(game=game_1, random_point=point, score=3000)
+        game_1.finish()
+        point.delete()
+        stats = CategoryStats.objects.get(category=category)
+        self.assertEqual(stats.points_count, 1)
+        self.assertEqual(stats.games_count, 2)
+        self.assertEqual(stats.players_count, 1)
+        self.assertEqual(stats.finished_games_count, 1)
+        self.assertEqual(stats.avg_games_score, 3000)
+        self.assertEqual(get_difficulty(stats.score_sum, stats.games_count, category.rounds_count),
+                         category.difficulty)
+
+    def test_deleted_games_match_rebuild(self):
+        category = CategoryFactory(rounds_count=1)
+        user = UserFactory()
+        game = GameFactory(category=category, user=user)
+        RoundFactory(game=game, score=3000)
+        game.finish()
+        GameFactory(category=category, user=user)
+        other_user = UserFactory()
+        GameFactory(category=category, user=other_user, is_over=True, score=1000)
+        game.delete()
+        other_user.delete()
+        stats = CategoryStats.objects.get(category=category)
+        self.assertEqual((stats.games_count, stats.players_count, stats.finished_games_count), (1, 1, 0))
+        fields = ['games_count', 'players_count', 'score_sum', 'finished_games_count', 'finished_score_sum']
+        incremental = CategoryStats.objects.filter(category=category).values(*fields).get()
+        CategoryStats.objects.rebuild(category_ids=[category.pk])
+        self.assertEqual(CategoryStats.objects.filter(category=category).values(*fields).get(), incremental)
+
+    def test_delete_category_with_points(self):
+        category = CategoryFactory()
+        PointFactory(category=category)
+        PointFactory(category=category)
+        category_id = category.pk
+        category.delete()
+        connection.check_constraints()
+        self.assertFalse(CategoryStats.objects.filter(category_id=category_id).exists())
+        self.assertFalse(Point.objects.filter(category_id=category_id).exists())
+
+    def test_rebuild(self):
+        category = CategoryFactory()
+        PointFactory(category=category)
+        GameFactory(category=category, is_over=True, score=100)
+        CategoryStats.objects.filter(category=category).update(points_count=0, games_count=0,
+                                                               finished_score_sum=0)
+        CategoryStats.objects.rebuild()
+        stats = CategoryStats.objects.get(category=category)
+        self.assertEqual(stats.points_count, 1)
+        self.assertEqual(stats.games_count, 1)
+        self.assertEqual(stats.finished_score_sum, 100)
+
+
 class PointModelTest(APITestCase):
     def setUp(self) -> None:
         self.category = CategoryFactory()
@@ -53,6 +145,57 @@ class PointModelTest(APITestCase):
         self.assertEqual(random_point.category, self.category)
         self.assertNotEqual(random_point, self.point_1)
 
+    def test_random_in_category_with_exclude(self):
+        random_point = Point.objects.random_in_category(self.category.pk,
+                                                        exclude_pk=[self.point_1.pk, self.point_2.pk])
+        self.assertEqual(random_point, self.point_3)
+
+    def test_random_in_category_after_point_changes(self):
+        point_index.ids(self.category.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.point_1.delete()
+            self.point_2.delete()
+            point_4 = PointFactory(category=self.category)
+        random_point = Point.objects.random_in_category(self.category.pk,
+                                                        exclude_pk=[self.point_3.pk])
+        self.assertEqual(random_point, point_4)
+
+    def test_sample_many(self):
+        ids = point_index.sample_many(self.category.pk, 5)
+        self.assertCountEqual(ids, [self.point_1.pk, self.point_2.pk, self.point_3.pk])
+
+    def assertMatchesWeights(self, counts, weights):
+        # Критическое значение хи-квадрат для уровня значимости 0.001
+        critical = {2: 13.82, 3: 16.27, 4: 18.47}[len(weights) - 1]
+        total = sum(counts)
+        chi_square = sum((count - total * weight / sum(weights)) ** 2 / (total * weight / sum(weights))
+                         for count, weight in zip(counts, weights))
+        self.assertLess(chi_square, critical)
+
+    def test_alias_table_distribution(self):
+        weights = [1, 2, 3, 4, 0.5]
+        table = AliasTable(weights)
+        rng = random.Random(1)
+        counts = [0] * len(weights)
+        for _ in range(50000):
+            counts[table.sample(rng)] += 1
+        self.assertMatchesWeights(counts, weights)
+
+    def test_weighted_sampling(self):
+        self.category.sampling = Category.SAMPLING_UNDERPLAYED
+        self.category.save()
+        PointStats.objects.create(point=self.point_2, guesses_count=1)
+        PointStats.objects.create(point=self.point_3, guesses_count=3)
+        points = [self.point_1.pk, self.point_2.pk, self.point_3.pk]
+        random.seed(1)
+        counts = dict.fromkeys(points, 0)
+        for _ in range(20000):
+            counts[point_index.sample(self.category.pk)] += 1
+        self.assertMatchesWeights([counts[pk] for pk in points], [1, 0.5, 0.25])
+        for _ in range(100):
+            self.assertEqual(point_index.sample(self.category.pk, exclude_pk=points[:2]), self.point_3.pk)
+        self.assertCountEqual(point_index.sample_many(self.category.pk, 3), points)
+
 
 class GameModelTest(APITestCase):
     def test_round_counts(self):
@@ -82,11 +225,16 @@ class GameModelTest(APITestCase):
 
 class RoundModelTest(APITestCase):
     def test_set_round_num(self):
-        game = GameFactory()
+        game = GameFactory(category=CategoryFactory(rounds_count=3))
         generate_rounds_for_game(game, count=5)
-        round = RoundFactory(game=game)
-        round.set_round_num()
-        self.assertEqual(round.num, 6)
+        for num in range(1, 4):
+            round = RoundFactory(game=game)
+            round.set_round_num()
+            self.assertEqual(round.num, num)
+        game.refresh_from_db()
+        self.assertEqual(game.current_round, 3)
+        with self.assertRaises(NoRoundsLeft):
+            RoundFactory(game=game).set_round_num()
 
     @patch.object(Game, 'used_points_pk', new_callable=PropertyMock)
     def test_set_random_point(self, mock_used_points_pk):
@@ -117,6 +265,36 @@ class RoundModelTest(APITestCase):
         self.assertEqual(_round.score, score)
 
 
+class ScoringTest(APITestCase):
+    def test_distances_match_geos(self):
+        targets = [(37.61, 55.75), (-74.0, 40.71), (0, 0), (179.9, -89.9), (180, 0), (-180, 10)]
+        guesses = [(30.31, 59.93), (139.69, 35.68), (0, 0.001), (-179.9, 89.9), (179.999, 0), (-179.999, 10)]
+        expected = []
+        for target, guess in zip(targets, guesses):
+            ls = LineString(target, guess, srid=4326)
+            ls.transform(54009)
+            expected.append(round(ls.length))
+        self.assertEqual(list(scoring.distances(targets, guesses)), expected)
+
+    def test_scores(self):
+        result = scoring.scores([0, 150, 500, 50000, 200000, 1000000, 3000000])
+        self.assertEqual(list(result), [5000, 5000, 4500, 3950, 2600, 1000, 0])
+
+    def test_rescore_rounds_rebuilds_stats(self):
+        category = CategoryFactory(rounds_count=1)
+        user = UserFactory()
+        game = GameFactory(category=category, user=user)
+        RoundFactory(game=game, random_point=PointFactory(category=category, point=GEOSGeometry('POINT(0 0)', srid=4326)),
+                     user_point=GEOSGeometry('POINT(0 0)', srid=4326), score=1)
+        game.finish()
+        call_command('rescore_rounds', stdout=io.StringIO())
+        game.refresh_from_db()
+        self.assertEqual(game.score, 5000)
+        self.assertEqual(CategoryStats.objects.get(category=category).finished_score_sum, 5000)
+        self.assertEqual(LeaderboardEntry.objects.get(user=user).sum_score, 5000)
+        self.assertEqual(UserStats.objects.get(user=user).round_score_sum, 5000)
+
+
 
 class GameViewSetTest(APITestCase):
     def setUp(self) -> None:
@@ -148,6 +326,169 @@ class GameViewSetTest(APITestCase):
         response = self.client.post(url)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_start_pregenerated_game(self):
+        category = CategoryFactory(rounds_count=3)
+        points = [PointFactory(category=category) for _ in range(3)]
+        url = reverse('game-start_game')
+        response = self.client.post(url, data={'category': category.codename, 'mode': Game.MODE_PREGENERATED},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        game = Game.objects.get(pk=response.data['game'])
+        self.assertEqual(list(game.rounds.order_by('num').values_list('num', 'is_revealed')),
+                         [(1, True), (2, False), (3, False)])
+        self.assertCountEqual(game.used_points_pk, [point.pk for point in points])
+
+    def test_next_round_pregenerated(self):
+        category = CategoryFactory(rounds_count=2)
+        PointFactory(category=category)
+        PointFactory(category=category)
+        game = GameFactory(category=category, mode=Game.MODE_PREGENERATED)
+        game.start()
+        url = reverse('game-next_round', kwargs={'pk': game.pk})
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['num'], 2)
+        self.assertEqual(game.rounds.filter(is_revealed=False).count(), 0)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_history(self):
+        games = [GameFactory(user=self.user) for _ in range(5)]
+        GameFactory()
+        url = reverse('game-list')
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [game['id'] for game in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [game['id'] for game in response.data['results']]
+        self.assertEqual(ids, [game.pk for game in reversed(games)])
+
+    def test_list_history_filters(self):
+        category = CategoryFactory()
+        old_game = GameFactory(user=self.user, category=category, is_over=True)
+        Game.objects.filter(pk=old_game.pk).update(create_date=timezone.now() - timedelta(days=10))
+        game = GameFactory(user=self.user, category=category, is_over=True)
+        GameFactory(user=self.user, category=category)
+        GameFactory(user=self.user, is_over=True)
+        url = reverse('game-list')
+        response = self.client.get(url, {'category': category.pk, 'is_over': 'true',
+                                         'created_after': (timezone.now() - timedelta(days=1)).isoformat()})
+        self.assertEqual([item['id'] for item in response.data['results']], [game.pk])
+        response = self.client.get(url, {'created_before': (timezone.now() - timedelta(days=1)).isoformat()})
+        self.assertEqual([item['id'] for item in response.data['results']], [old_game.pk])
+        response = self.client.get(url, {'created_after': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_other_user_game(self):
+        game = GameFactory()
+        response = self.client.get(reverse('game-detail', kwargs={'pk': game.pk}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AsyncGameFlowTest(APITestCase):
+    def setUp(self) -> None:
+        self.user = UserFactory(password='password')
+        self.client.login(username=self.user.login,
+                          password='password')
+        self.category = CategoryFactory(rounds_count=2)
+        PointFactory(category=self.category)
+        PointFactory(category=self.category)
+
+    def test_game_flow(self):
+        response = self.client.post(reverse('async-start_game'), data={'category': self.category.codename},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        game = Game.objects.get(pk=response.json()['game'])
+        self.assertEqual(response.json()['num'], 1)
+        url = reverse('async-set_user_point', kwargs={'pk': response.json()['id']})
+        response = self.client.patch(url, data={'user_point': geojson.utils.generate_random('Point')},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse('async-next_round', kwargs={'pk': game.pk}))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['num'], 2)
+        response = self.client.post(reverse('async-end_game', kwargs={'pk': game.pk}))
+        game.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(game.is_over)
+        self.assertEqual(response.json()['score'], game.score)
+        response = self.client.get(reverse('async-top_players'))
+        self.assertEqual(response.json()[0]['id'], self.user.id)
+
+    def test_errors(self):
+        response = self.client.post(reverse('async-start_game'), data={'category': 'unknown'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('category', response.json())
+        response = self.client.post(reverse('async-end_game', kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('async-end_game', kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.client.logout()
+        response = self.client.post(reverse('async-start_game'), data={'category': self.category.codename},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class GameStateTest(APITestCase):
+    def setUp(self) -> None:
+        self.user = UserFactory(password='password')
+        self.client.login(username=self.user.login,
+                          password='password')
+        self.category = CategoryFactory(rounds_count=3)
+        self.points = [PointFactory(category=self.category) for _ in range(3)]
+
+    def start_game(self):
+        response = self.client.post(reverse('game-start_game'), data={'category': self.category.codename},
+                                    format='json')
+        return Game.objects.get(pk=response.data['game'])
+
+    def test_next_round_uses_cached_state(self):
+        game = self.start_game()
+        url = reverse('game-next_round', kwargs={'pk': game.pk})
+        response = self.client.post(url)
+        self.assertEqual(response.data['num'], 2)
+        state = game_states.get(game.pk)
+        self.assertEqual(state.current_round, 2)
+        self.assertEqual(len(set(state.used_points)), 2)
+
+    def test_state_is_rebuilt_on_cache_miss(self):
+        game = self.start_game()
+        self.client.post(reverse('game-next_round', kwargs={'pk': game.pk}))
+        game_states.delete(game.pk)
+        response = self.client.post(reverse('game-next_round', kwargs={'pk': game.pk}))
+        self.assertEqual(response.data['num'], 3)
+        self.assertCountEqual(game.used_points_pk, [point.pk for point in self.points])
+
+    def test_rounds_count_is_enforced(self):
+        game = self.start_game()
+        url = reverse('game-next_round', kwargs={'pk': game.pk})
+        self.assertEqual([self.client.post(url).status_code for _ in range(3)],
+                         [status.HTTP_201_CREATED, status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST])
+        game.refresh_from_db()
+        self.assertEqual(game.current_round, 3)
+        self.assertEqual(game.rounds.count(), 3)
+
+    def test_other_user_game_on_cache_miss(self):
+        game = GameFactory(category=self.category)
+        game_states.delete(game.pk)
+        for name in ('game-next_round', 'game-end_game', 'async-next_round', 'async-end_game'):
+            response = self.client.post(reverse(name, kwargs={'pk': game.pk}))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        game.refresh_from_db()
+        self.assertFalse(game.is_over)
+        self.assertEqual(game.current_round, 0)
+
+    def test_end_game_score(self):
+        game = self.start_game()
+        first_round = game.rounds.get()
+        self.client.patch(reverse('round-set_user_point', kwargs={'pk': first_round.pk}),
+                          data={'user_point': geojson.utils.generate_random('Point')}, format='json')
+        first_round.refresh_from_db()
+        response = self.client.post(reverse('game-end_game', kwargs={'pk': game.pk}))
+        self.assertEqual(response.data['score'], first_round.score)
+        self.assertIsNone(game_states.get(game.pk))
+
 
 class RoundViewSetTest(APITestCase):
     def setUp(self) -> None:
@@ -170,6 +511,32 @@ class RoundViewSetTest(APITestCase):
         self.assertEqual(response.data['distance_between_points'],
                          round.distance_between_points)
 
+    def test_list_rounds(self):
+        game = GameFactory(user=self.user)
+        rounds = [RoundFactory(game=game, num=num, random_point=PointFactory()) for num in range(1, 4)]
+        other_game = GameFactory(user=self.user)
+        RoundFactory(game=other_game, num=1, random_point=PointFactory())
+        RoundFactory(game=game, num=4, random_point=PointFactory(), is_revealed=False)
+        RoundFactory(random_point=PointFactory())
+        url = reverse('round-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'game': game.pk, 'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [rounds[2].pk, rounds[1].pk])
+        self.assertEqual(len([query for query in queries.captured_queries
+                              if 'game_round' in query['sql']]), 1)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['id'] for item in response.data['results']], [rounds[0].pk])
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_rounds_require_authentication(self):
+        round = RoundFactory(random_point=PointFactory())
+        self.assertEqual(self.client.get(reverse('round-detail', kwargs={'pk': round.pk})).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('round-list')).status_code, status.HTTP_403_FORBIDDEN)
+
 
 class CategoryViewSetTest(APITestCase):
     def setUp(self) -> None:
@@ -184,6 +551,61 @@ class CategoryViewSetTest(APITestCase):
         response = self.client.post(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn(self.user, category.likes.all())
+        self.assertTrue(response.data['like'])
+        self.assertIn(self.user.pk, response.data['likes'])
+
+    def test_list_query_count_is_constant(self):
+        url = reverse('category-list')
+        CategoryFactory()
+        with CaptureQueriesContext(connection) as initial:
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(5):
+                category = CategoryFactory()
+                PointFactory(category=category)
+                GameFactory(category=category, user=self.user, is_over=True)
+                category.likes.add(self.user)
+        with CaptureQueriesContext(connection) as grown:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 6)
+        self.assertEqual(sum(item['like'] for item in response.data), 5)
+        self.assertEqual(len(initial.captured_queries), len(grown.captured_queries))
+
+
+class CategoryCacheTest(APITestCase):
+    def setUp(self) -> None:
+        self.user = UserFactory(password='password')
+        self.client.login(username=self.user.login,
+                          password='password')
+        self.category = CategoryFactory()
+        category_cache.reset_stats()
+
+    def test_list_is_cached(self):
+        url = reverse('category-list')
+        self.client.get(url)
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.data[0]['id'], self.category.pk)
+        self.assertEqual(category_cache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_like_is_merged(self):
+        url = reverse('category-detail', kwargs={'pk': self.category.pk})
+        self.assertFalse(self.client.get(url).data['like'])
+        self.category.likes.add(self.user)
+        self.assertTrue(self.client.get(url).data['like'])
+        self.client.logout()
+        self.assertFalse(self.client.get(url).data['like'])
+
+    def test_point_changes_invalidate(self):
+        url = reverse('category-detail', kwargs={'pk': self.category.pk})
+        self.assertEqual(self.client.get(url).data['points_count'], 0)
+        with self.captureOnCommitCallbacks() as callbacks:
+            PointFactory(category=self.category)
+        # До коммита в кэше остаются прежние данные
+        self.assertEqual(self.client.get(url).data['points_count'], 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(url).data['points_count'], 1)
 
 
 class PlayInCategoryPermissionTest(APITestCase):
@@ -235,6 +657,94 @@ class TopPlayersViewTest(APITestCase):
                                             'avg_score': (game_3.score/category.max_score + game_4.score/category.max_score)*100/2,
                                             'sum_score': 7000})
 
+    def test_top_players_offset(self):
+        category = CategoryFactory(rounds_count=1)
+        users = [UserFactory() for _ in range(3)]
+        for num, user in enumerate(users):
+            GameFactory(category=category, user=user, score=1000 * (num + 1))
+        url = reverse('top_players')
+        response = self.client.get(url, {'limit': 2, 'offset': 1})
+        self.assertEqual([item['id'] for item in response.data], [users[1].id, users[0].id])
+
+    def test_top_players_invalid_query(self):
+        for url in [reverse('top_players'), reverse('async-top_players')]:
+            for params in [{'limit': 'abc'}, {'limit': 0}, {'limit': 1000}, {'offset': -1}]:
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_leaderboard_follows_finished_games(self):
+        category = CategoryFactory(rounds_count=1)
+        user = UserFactory()
+        game = GameFactory(category=category, user=user)
+        RoundFactory(game=game, score=2500)
+        game.finish()
+        entry = LeaderboardEntry.objects.get(user=user)
+        self.assertEqual(entry.sum_score, 2500)
+        self.assertEqual(entry.avg_score, 50)
+
+    def test_rebuild_leaderboard(self):
+        category = CategoryFactory(rounds_count=1)
+        user = UserFactory()
+        GameFactory(category=category, user=user, score=1000)
+        GameFactory(category=category, user=user, score=3000)
+        LeaderboardEntry.objects.all().delete()
+        LeaderboardEntry.objects.rebuild()
+        entry = LeaderboardEntry.objects.get(user=user)
+        self.assertEqual(entry.games_count, 2)
+        self.assertAlmostEqual(entry.avg_score, 40)
+
+    def test_deleted_game_leaves_leaderboard(self):
+        category = CategoryFactory(rounds_count=1)
+        user = UserFactory()
+        first = GameFactory(category=category, user=user, score=1000)
+        second = GameFactory(category=category, user=user, score=3000)
+        second.delete()
+        entry = LeaderboardEntry.objects.get(user=user)
+        self.assertEqual(entry.games_count, 1)
+        self.assertEqual(entry.sum_score, 1000)
+        self.assertAlmostEqual(entry.avg_score, 20)
+        first.delete()
+        entry = LeaderboardEntry.objects.get(user=user)
+        self.assertEqual((entry.games_count, entry.avg_score), (0, 0))
+        self.assertFalse(LeaderboardEntry.objects.top(10).exists())
+
+    def test_player_rank(self):
+        category = CategoryFactory(rounds_count=1)
+        user = UserFactory(password='password')
+        GameFactory(category=category, score=4000)
+        GameFactory(category=category, user=user, score=1000)
+        self.client.login(username=user.login, password='password')
+        response = self.client.get(reverse('player_rank'))
+        self.assertEqual(response.data['rank'], 2)
+        self.assertEqual(response.data['sum_score'], 1000)
+
+
+class LoadTestTest(APITestCase):
+    def test_summarize(self):
+        records = [('start_game', 201, 0.01 * num, {'X-DB-Queries': '4'}) for num in range(1, 101)]
+        records.append(('end_game', 404, 0.5, {}))
+        result = summarize(records, elapsed=2)
+        self.assertEqual(result['requests'], 101)
+        self.assertEqual(result['errors'], 1)
+        self.assertAlmostEqual(result['endpoints']['start_game']['p95_ms'], 950)
+        self.assertAlmostEqual(result['endpoints']['start_game']['p99_ms'], 990)
+        self.assertEqual(result['endpoints']['start_game']['avg_queries'], 4)
+        self.assertIsNone(result['endpoints']['end_game']['avg_queries'])
+
+    def test_play_game_in_process(self):
+        category = CategoryFactory(rounds_count=2)
+        PointFactory(category=category)
+        PointFactory(category=category)
+        player = ClientPlayer()
+        player.register()
+        records = []
+        play_game(player, SYNC_ENDPOINTS, category.codename, lambda *args: records.append(args))
+        self.assertEqual([record[0] for record in records],
+                         ['category_list', 'start_game', 'set_user_point', 'next_round',
+                          'set_user_point', 'end_game', 'top_players'])
+        self.assertTrue(all(record[1] < 400 for record in records))
+        self.assertTrue(Game.objects.get(category=category).is_over)
+
 
 class CategorySerializerTest(APITestCase):
     def test_players_count(self):
@@ -266,3 +776,616 @@ class CategorySerializerTest(APITestCase):
         self.assertFalse(data['like'])
 
 
+
+
+class QueryBudgetTest(QueryBudgetTestCase):
+    query_budgets = {
+        'category-list': 4,
+        'category-detail': 4,
+        'top_players': 1,
+    }
+
+    def setUp(self) -> None:
+        self.user = UserFactory(password='password')
+        self.client.login(username=self.user.login,
+                          password='password')
+
+    def create_categories(self, count):
+        for _ in range(count):
+            category = CategoryFactory()
+            PointFactory(category=category)
+            GameFactory(category=category, is_over=True, score=100)
+            category.likes.add(self.user)
+        return category
+
+    def test_category_list(self):
+        for count in [1, 10]:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_categories(count)
+            self.assertQueryBudget('category-list', self.client.get(reverse('category-list')))
+
+    def test_category_detail(self):
+        category = self.create_categories(1)
+        response = self.client.get(reverse('category-detail', kwargs={'pk': category.pk}))
+        self.assertQueryBudget('category-detail', response)
+        self.assertIn('X-DB-Time', response)
+
+    def test_top_players(self):
+        self.client.logout()
+        self.create_categories(10)
+        self.assertQueryBudget('top_players', self.client.get(reverse('top_players')))
+
+    def test_streaming_response_queries(self):
+        category = self.create_categories(1)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('category-points_ndjson', kwargs={'pk': category.pk}))
+        before_body = len(response.wsgi_request.db_queries)
+        self.assertEqual(int(response['X-DB-Queries']), before_body)
+        b''.join(response.streaming_content)
+        self.assertGreater(len(response.wsgi_request.db_queries), before_body)
+
+
+class ImportPointsTest(APITestCase):
+    def setUp(self) -> None:
+        self.category = CategoryFactory()
+
+    def import_file(self, suffix, content, *args):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        call_command('import_points', file.name, '--category', str(self.category.pk), '--batch-size', '2',
+                     *args, stdout=io.StringIO())
+
+    def test_iter_geojson_small_chunks(self):
+        features = [{'type': 'Feature', 'properties': {'name': 'a]b'},
+                     'geometry': {'type': 'Point', 'coordinates': [i, -i]}} for i in range(5)]
+        content = json.dumps({'type': 'FeatureCollection', 'name': 'test', 'features': features})
+        with patch.object(importers, 'CHUNK_SIZE', 7):
+            coordinates = list(importers.iter_geojson(io.StringIO(content)))
+        self.assertEqual(coordinates, [(i, -i) for i in range(5)])
+
+    def test_iter_geojson_any_chunk_boundary(self):
+        content = '{"type": "FeatureCollection", "features"  :  [{"type": "Point", "coordinates": [1, 2]}]}'
+        for chunk_size in range(1, len(content) + 1):
+            with patch.object(importers, 'CHUNK_SIZE', chunk_size):
+                self.assertEqual(list(importers.iter_geojson(io.StringIO(content))), [(1, 2)])
+
+    def test_validate(self):
+        coordinates, invalid = importers.validate([(10, 20), ('x', 1), (200, 0), (0, -91), (float('nan'), 0)])
+        self.assertEqual(coordinates.tolist(), [[10, 20]])
+        self.assertEqual(invalid, 4)
+
+    def test_import_geojson(self):
+        features = [{'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [i, i]}} for i in range(5)]
+        self.import_file('.geojson', json.dumps({'type': 'FeatureCollection', 'features': features}))
+        self.assertEqual(Point.objects.filter(category=self.category).count(), 5)
+        self.assertEqual(CategoryStats.objects.get(category=self.category).points_count, 5)
+        self.assertEqual(len(point_index.ids(self.category.pk)), 5)
+
+    def test_import_csv_and_ndjson(self):
+        self.import_file('.csv', 'name,Lat,Lon\na,10.5,20.25\nb,95,0\n')
+        self.import_file('.ndjson', '{"type": "Point", "coordinates": [1, 2]}\n\n{"lon": 3, "lat": 4}\n')
+        points = Point.objects.filter(category=self.category).order_by('id')
+        self.assertEqual([point.point.coords for point in points], [(20.25, 10.5), (1, 2), (3, 4)])
+
+    def test_import_unknown_category(self):
+        self.category.delete()
+        with self.assertRaises(CommandError):
+            self.import_file('.csv', 'lon,lat\n1,2\n')
+
+
+class CategoryPointsExportTest(APITestCase):
+    def setUp(self) -> None:
+        self.category = CategoryFactory()
+        self.points = [PointFactory(category=self.category, point=GEOSGeometry('POINT({} {})'.format(i * 10, i)))
+                       for i in range(5)]
+        PointFactory()
+        self.client.force_authenticate(UserFactory(is_staff=True))
+
+    def get_content(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_geojson(self):
+        response = self.client.get(reverse('category-points_geojson', kwargs={'pk': self.category.pk}))
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        data = json.loads(self.get_content(response))
+        self.assertEqual(data['type'], 'FeatureCollection')
+        self.assertEqual(sorted(feature['id'] for feature in data['features']),
+                         [point.pk for point in self.points])
+        feature = next(feature for feature in data['features'] if feature['id'] == self.points[2].pk)
+        self.assertEqual(feature['geometry'], {'type': 'Point', 'coordinates': [20, 2]})
+
+    def test_ndjson_bbox(self):
+        response = self.client.get(reverse('category-points_ndjson', kwargs={'pk': self.category.pk}),
+                                   {'bbox': '5,0,35,10'})
+        features = [json.loads(line) for line in self.get_content(response).splitlines()]
+        self.assertEqual(sorted(feature['id'] for feature in features),
+                         [point.pk for point in self.points[1:4]])
+
+    @patch('game.views.EXPORT_CHUNK_SIZE', 2)
+    def test_chunks(self):
+        response = self.client.get(reverse('category-points_ndjson', kwargs={'pk': self.category.pk}))
+        features = [json.loads(line) for line in self.get_content(response).splitlines()]
+        self.assertEqual([feature['id'] for feature in features], sorted(point.pk for point in self.points))
+
+    def test_errors(self):
+        url = reverse('category-points_geojson', kwargs={'pk': self.category.pk})
+        self.assertEqual(self.client.get(url, {'bbox': '1,2,3'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'bbox': '10,0,0,10'}).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('category-points_geojson', kwargs={'pk': self.category.pk + 100}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_staff_only(self):
+        url = reverse('category-points_ndjson', kwargs={'pk': self.category.pk})
+        self.client.force_authenticate(UserFactory())
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_accept_header(self):
+        response = self.client.get(reverse('category-points_geojson', kwargs={'pk': self.category.pk}),
+                                   HTTP_ACCEPT='application/geo+json')
+        self.assertEqual(json.loads(self.get_content(response))['type'], 'FeatureCollection')
+
+
+class ConnectionHealthCheckTest(APITestCase):
+    def get_connection(self, usable, in_atomic_block=False):
+        return Mock(connection=object(), in_atomic_block=in_atomic_block,
+                    is_usable=Mock(return_value=usable))
+
+    @override_settings(DB_CONN_HEALTH_CHECKS=True)
+    def test_closes_broken_connections(self):
+        usable, broken, in_transaction = (self.get_connection(True), self.get_connection(False),
+                                          self.get_connection(False, in_atomic_block=True))
+        with patch('geoquizz_backend.db.connections') as connections:
+            connections.all.return_value = [usable, broken, in_transaction]
+            check_connections()
+        usable.close.assert_not_called()
+        broken.close.assert_called_once()
+        in_transaction.is_usable.assert_not_called()
+
+    def test_disabled(self):
+        broken = self.get_connection(False)
+        with patch('geoquizz_backend.db.connections') as connections:
+            connections.all.return_value = [broken]
+            check_connections()
+        broken.is_usable.assert_not_called()
+
+
+class PointStatsTest(APITestCase):
+    def setUp(self) -> None:
+        self.point = PointFactory(point=GEOSGeometry('POINT(0 0)'))
+        self.guesses = [(0, 1), (0, 2), (0, 4), (3, 0)]
+        for lon, lat in self.guesses[:3]:
+            self.add_round(lon, lat)
+
+    def add_round(self, lon, lat, point=None):
+        round = RoundFactory(random_point=point or self.point)
+        round.set_user_point(GEOSGeometry('POINT({} {})'.format(lon, lat)))
+        return round
+
+    def test_update_since_watermark(self):
+        self.add_round(1, 1, point=PointFactory())
+        self.assertEqual(PointStats.objects.update_since_watermark(lag=0), 2)
+        stats = PointStats.objects.get(point=self.point)
+        distances = scoring.distances([(0, 0)] * 3, self.guesses[:3])
+        self.assertEqual(stats.guesses_count, 3)
+        self.assertAlmostEqual(stats.avg_distance, distances.mean())
+        self.assertAlmostEqual(stats.median_distance, distances[1])
+        self.assertAlmostEqual(stats.avg_score, scoring.scores(distances).mean(), places=0)
+        self.assertEqual(PointStats.objects.update_since_watermark(lag=0), 0)
+
+        self.add_round(*self.guesses[3])
+        self.assertEqual(PointStats.objects.update_since_watermark(lag=0), 1)
+        stats.refresh_from_db()
+        distances = scoring.distances([(0, 0)] * 4, self.guesses)
+        self.assertEqual(stats.guesses_count, 4)
+        self.assertAlmostEqual(stats.median_distance, (distances[1] + distances[3]) / 2)
+
+    def test_lag_postpones_recent_rounds(self):
+        self.assertEqual(PointStats.objects.update_since_watermark(lag=3600), 0)
+        call_command('update_point_stats', '--full', stdout=io.StringIO())
+        self.assertEqual(PointStats.objects.get(point=self.point).guesses_count, 3)
+
+    def test_api(self):
+        PointStats.objects.update_since_watermark(lag=0)
+        response = self.client.get(reverse('pointstats-list'), {'category': self.point.category_id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['point'] for item in response.data['results']], [self.point.pk])
+        self.assertEqual(response.data['results'][0]['guesses_count'], 3)
+        response = self.client.get(reverse('pointstats-list'), {'category': self.point.category_id + 100})
+        self.assertEqual(response.data['results'], [])
+
+
+class PointRotationTest(APITestCase):
+    def setUp(self) -> None:
+        self.user = UserFactory()
+        self.category = CategoryFactory(rounds_count=2)
+        self.points = [PointFactory(category=self.category) for _ in range(5)]
+
+    def test_feistel_permutation(self):
+        for size in [1, 2, 7, 64, 1000]:
+            permutation = FeistelPermutation(size, seed=42)
+            self.assertEqual(sorted(permutation[i] for i in range(size)), list(range(size)))
+        self.assertNotEqual([FeistelPermutation(100, seed)[0] for seed in range(5)], [0] * 5)
+
+    def test_deal_without_repeats(self):
+        dealt = [PointRotation.objects.deal(self.user.pk, self.category.pk, 1)[0] for _ in range(5)]
+        self.assertCountEqual(dealt, [point.pk for point in self.points])
+        rotation = PointRotation.objects.get(user=self.user, category=self.category)
+        self.assertEqual((rotation.cursor, rotation.pool_size), (5, 5))
+        PointRotation.objects.deal(self.user.pk, self.category.pk, 1)
+        rotation.refresh_from_db()
+        self.assertEqual(rotation.cursor, 1)
+
+    def test_deal_with_exclude_and_pool_change(self):
+        excluded = [point.pk for point in self.points[:4]]
+        self.assertEqual(PointRotation.objects.deal(self.user.pk, self.category.pk, 3, exclude_pk=excluded),
+                         [self.points[4].pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            point = PointFactory(category=self.category)
+        PointRotation.objects.deal(self.user.pk, self.category.pk, 1)
+        rotation = PointRotation.objects.get(user=self.user, category=self.category)
+        self.assertEqual((rotation.cursor, rotation.pool_size), (1, 6))
+        self.assertIn(point.pk, point_index.ids(self.category.pk))
+
+    def test_games_do_not_repeat_points(self):
+        used = []
+        for mode in [Game.MODE_CLASSIC, Game.MODE_PREGENERATED]:
+            game = GameFactory(user=self.user, category=self.category, mode=mode)
+            game.start()
+            if mode == Game.MODE_CLASSIC:
+                game.next_round()
+            used += game.used_points_pk
+        self.assertEqual(len(used), 4)
+        self.assertEqual(len(set(used)), 4)
+
+
+class DailyChallengeTest(APITestCase):
+    def setUp(self) -> None:
+        self.category = CategoryFactory(rounds_count=3)
+        self.points = [PointFactory(category=self.category) for _ in range(10)]
+        self.users = [UserFactory(password='password') for _ in range(2)]
+        self.url = reverse('game-start_game')
+
+    def play(self, user, user_point='POINT(10 10)'):
+        self.client.login(username=user.login, password='password')
+        response = self.client.post(self.url, data={'category': self.category.codename, 'mode': Game.MODE_DAILY},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        game = Game.objects.get(pk=response.data['game'])
+        game.next_round()
+        game.next_round()
+        with self.assertRaises(NoRoundsLeft):
+            game.next_round()
+        for round in game.rounds.select_related('random_point'):
+            round.set_user_point(GEOSGeometry(user_point, srid=4326))
+        game.finish()
+        return game
+
+    def test_sequence_is_shared(self):
+        games = [self.play(user) for user in self.users]
+        sequences = [list(game.rounds.order_by('num').values_list('random_point_id', flat=True))
+                     for game in games]
+        self.assertEqual(sequences[0], sequences[1])
+        self.assertEqual(len(set(sequences[0])), 3)
+        self.assertEqual([point_id for point_id, _, _ in
+                          daily_challenges.sequence(self.category.pk, games[0].challenge_date)], sequences[0])
+        tomorrow = games[0].challenge_date + timedelta(days=1)
+        self.assertEqual(daily_challenges.generate(self.category.pk, games[0].challenge_date),
+                         daily_challenges.sequence(self.category.pk, games[0].challenge_date))
+        self.assertEqual(len(daily_challenges.generate(self.category.pk, tomorrow)), 3)
+
+    def test_sequence_is_cached(self):
+        date = daily_challenges.today()
+        daily_challenges.sequence(self.category.pk, date)
+        with self.assertNumQueries(0):
+            daily_challenges.sequence(self.category.pk, date)
+
+    def test_one_attempt_per_day(self):
+        self.play(self.users[0])
+        response = self.client.post(self.url, data={'category': self.category.codename, 'mode': Game.MODE_DAILY},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, data={'category': self.category.codename}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def start_serializer(self, mode):
+        serializer = GameStartRequestBodySerializer(data={'category': self.category.codename, 'mode': mode},
+                                                    context={'user': self.users[0]})
+        self.assertTrue(serializer.is_valid())
+        return serializer
+
+    def test_concurrent_attempt(self):
+        serializer = self.start_serializer(Game.MODE_DAILY)
+        # Вторая попытка начата до того, как первая создала игру
+        GameFactory(user=self.users[0], category=self.category, mode=Game.MODE_DAILY,
+                    challenge_date=serializer.validated_data['challenge_date'])
+        with self.assertRaises(serializers.ValidationError):
+            serializer.save()
+
+    def test_other_integrity_errors_are_raised(self):
+        for mode in [Game.MODE_DAILY, Game.MODE_CLASSIC]:
+            serializer = self.start_serializer(mode)
+            with patch('rest_framework.serializers.ModelSerializer.create', side_effect=IntegrityError):
+                with self.assertRaises(IntegrityError):
+                    serializer.save()
+
+    def test_daily_leaderboard(self):
+        far, near = self.play(self.users[0], 'POINT(179 -89)'), self.play(self.users[1])
+        url = reverse('category-daily_leaderboard', kwargs={'pk': self.category.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = sorted([far, near], key=lambda game: -game.score)
+        self.assertEqual([entry['id'] for entry in response.data], [game.user_id for game in expected])
+        self.assertEqual([entry['score'] for entry in response.data], [game.score for game in expected])
+        response = self.client.get(url, {'date': (far.challenge_date - timedelta(days=1)).isoformat()})
+        self.assertEqual(response.data, [])
+
+
+class RoomConsumerTest(APITransactionTestCase):
+    def setUp(self) -> None:
+        self.application = URLRouter(websocket_urlpatterns)
+        self.category = CategoryFactory(rounds_count=2)
+        for _ in range(5):
+            PointFactory(category=self.category)
+        self.users = [UserFactory() for _ in range(2)]
+
+    def communicator(self, user, code='test'):
+        communicator = WebsocketCommunicator(self.application,
+                                             ROOM_PATH.format(code=code, category=self.category.codename))
+        communicator.scope['user'] = user
+        return communicator
+
+    async def receive(self, communicator, event_type):
+        while True:
+            event = await communicator.receive_json_from()
+            if event['type'] == event_type:
+                return event
+
+    def test_anonymous_is_rejected(self):
+        async def connect():
+            connected, _ = await self.communicator(AnonymousUser()).connect()
+            return connected
+        self.assertFalse(async_to_sync(connect)())
+        self.assertEqual(len(rooms), 0)
+
+    def test_room_game(self):
+        async def play():
+            host, guest = [self.communicator(user) for user in self.users]
+            for communicator in [host, guest]:
+                connected, _ = await communicator.connect()
+                self.assertTrue(connected)
+            room = await self.receive(host, 'room')
+            self.assertEqual(room['host'], self.users[0].pk)
+            await guest.send_json_to({'type': 'start'})
+            self.assertEqual((await self.receive(guest, 'error'))['detail'], NOT_HOST_MESSAGE)
+            await host.send_json_to({'type': 'start'})
+            started = [await self.receive(communicator, 'round_started') for communicator in [host, guest]]
+            self.assertEqual(started[0], started[1])
+            guess = {'type': 'guess', 'point': {'type': 'Point', 'coordinates': [10, 10]}}
+            for num in [1, 2]:
+                await host.send_json_to(guess)
+                await self.receive(guest, 'player_guessed')
+                await host.send_json_to(guess)
+                self.assertEqual((await self.receive(host, 'error'))['detail'], ALREADY_GUESSED_MESSAGE)
+                await guest.send_json_to(guess)
+                results = [await self.receive(communicator, 'round_results') for communicator in [host, guest]]
+                self.assertEqual(results[0], results[1])
+                self.assertEqual(results[0]['num'], num)
+                if num == 1:
+                    await host.send_json_to({'type': 'next_round'})
+                    await self.receive(guest, 'round_started')
+            game_over = await self.receive(guest, 'game_over')
+            for communicator in [host, guest]:
+                await communicator.disconnect()
+            return game_over
+
+        game_over = async_to_sync(play)()
+        games = Game.objects.filter(user__in=self.users)
+        self.assertEqual(len(games), 2)
+        self.assertTrue(all(game.is_over for game in games))
+        sequences = [list(game.rounds.order_by('num').values_list('random_point_id', flat=True)) for game in games]
+        self.assertEqual(sequences[0], sequences[1])
+        self.assertEqual({player['id']: player['score'] for player in game_over['players']},
+                         {game.user_id: game.score for game in games})
+        self.assertEqual(len(rooms), 0)
+
+    def start_room(self):
+        async def start():
+            host, guest = [self.communicator(user) for user in self.users]
+            for communicator in [host, guest]:
+                await communicator.connect()
+            await host.send_json_to({'type': 'start'})
+            await self.receive(guest, 'round_started')
+            return host, guest
+        return async_to_sync(start)()
+
+    def test_room_games_reject_game_actions(self):
+        host, guest = self.start_room()
+        game = Game.objects.get(user=self.users[1])
+        self.assertEqual(game.mode, Game.MODE_ROOM)
+        self.client.force_authenticate(self.users[1])
+        for name in ['game-next_round', 'game-end_game', 'async-next_round', 'async-end_game']:
+            response = self.client.post(reverse(name, kwargs={'pk': game.pk}))
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(game.rounds.filter(is_revealed=True).count(), 1)
+        response = self.client.post(reverse('game-start_game'),
+                                    data={'category': self.category.codename, 'mode': Game.MODE_ROOM}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        async_to_sync(host.disconnect)()
+        async_to_sync(guest.disconnect)()
+
+    def test_last_player_leaving_finishes_games(self):
+        host, guest = self.start_room()
+        async_to_sync(host.disconnect)()
+        self.assertFalse(Game.objects.filter(is_over=True).exists())
+        async_to_sync(guest.disconnect)()
+        self.assertEqual(len(rooms), 0)
+        self.assertTrue(all(game.is_over for game in Game.objects.filter(user__in=self.users)))
+
+    def test_load_test_rooms(self):
+        users = [UserFactory() for _ in range(6)]
+        records, elapsed = async_to_sync(run_rooms)(self.application, self.category.codename, users, 2)
+        result = summarize_fan_out(records, elapsed)
+        self.assertEqual(result['events']['connect']['count'], 6)
+        self.assertEqual(result['events']['round_started']['count'], 12)
+        self.assertEqual(result['events']['round_results']['count'], 12)
+        self.assertEqual(result['events']['game_over']['count'], 6)
+        self.assertEqual(Game.objects.finished().count(), 6)
+
+
+class GameEventTest(APITestCase):
+    def setUp(self) -> None:
+        game_events.start(background=False)
+        self.addCleanup(game_events.stop)
+        self.user = UserFactory(password='password')
+        self.client.login(username=self.user.login, password='password')
+
+    def test_game_records_events(self):
+        category = CategoryFactory(rounds_count=2)
+        for _ in range(3):
+            PointFactory(category=category)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('game-start_game'), data={'category': category.codename},
+                                        format='json')
+            game_id = response.data['game']
+            self.client.patch(reverse('round-set_user_point', kwargs={'pk': response.data['id']}),
+                              data={'user_point': geojson.utils.generate_random('Point')}, format='json')
+            self.client.post(reverse('game-next_round', kwargs={'pk': game_id}))
+            self.client.post(reverse('game-end_game', kwargs={'pk': game_id}))
+        self.assertEqual(GameEvent.objects.count(), 0)
+        self.assertEqual(game_events.flush(), 5)
+        events = list(GameEvent.objects.order_by('pk'))
+        self.assertEqual([event.type for event in events],
+                         [GameEvent.GAME_STARTED, GameEvent.ROUND_STARTED, GameEvent.GUESS_SUBMITTED,
+                          GameEvent.ROUND_STARTED, GameEvent.GAME_ENDED])
+        self.assertTrue(all(event.game_id == game_id and event.user_id == self.user.pk for event in events))
+        self.assertEqual(events[2].data['score'], Round.objects.get(pk=events[2].round_id).score)
+        self.assertEqual(events[4].data['score'], Game.objects.get(pk=game_id).score)
+
+    def test_record_is_deferred_and_bounded(self):
+        with self.assertNumQueries(0), self.captureOnCommitCallbacks() as callbacks:
+            game_events.record(GameEvent.GAME_STARTED, 1, self.user.pk)
+        self.assertEqual(len(game_events), 0)
+        callbacks[0]()
+        self.assertEqual(len(game_events), 1)
+        dropped = game_events.dropped
+        with override_settings(GAME_EVENTS_MAX_BUFFER=3), self.captureOnCommitCallbacks(execute=True):
+            for game_id in range(5):
+                game_events.record(GameEvent.GAME_STARTED, game_id)
+        self.assertEqual(len(game_events), 3)
+        self.assertEqual(game_events.dropped - dropped, 3)
+
+    def test_failed_flush_keeps_events(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            game_events.record(GameEvent.GAME_STARTED, 1)
+            game_events.record(GameEvent.GAME_ENDED, 1)
+        with patch.object(GameEvent.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                game_events.flush()
+        self.assertEqual(len(game_events), 2)
+        self.assertEqual(game_events.flush(), 2)
+        self.assertEqual(list(GameEvent.objects.order_by('pk').values_list('type', flat=True)),
+                         [GameEvent.GAME_STARTED, GameEvent.GAME_ENDED])
+
+    def test_created_at_is_insert_time(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            game_events.record(GameEvent.GAME_STARTED, 1)
+        recorded = timezone.now()
+        game_events.flush()
+        self.assertGreaterEqual(GameEvent.objects.get().created_at, recorded)
+
+    def test_consume_by_watermark(self):
+        old = timezone.now() - timedelta(minutes=1)
+        GameEvent.objects.bulk_create([GameEvent(type=GameEvent.GAME_STARTED, game_id=game_id, created_at=old)
+                                       for game_id in range(3)])
+        output = io.StringIO()
+        call_command('consume_game_events', lag=0, batch_size=2, stdout=output, stderr=io.StringIO())
+        self.assertEqual([json.loads(line)['game'] for line in output.getvalue().splitlines()], [0, 1, 2])
+        GameEvent.objects.create(type=GameEvent.GAME_ENDED, game_id=3, created_at=old)
+        GameEvent.objects.create(type=GameEvent.GAME_ENDED, game_id=4, created_at=timezone.now())
+        output = io.StringIO()
+        call_command('consume_game_events', lag=30, stdout=output, stderr=io.StringIO())
+        self.assertEqual([json.loads(line)['game'] for line in output.getvalue().splitlines()], [3])
+
+
+class ConcurrentFinishTest(APITransactionTestCase):
+    def run_threads(self, targets):
+        barrier = threading.Barrier(len(targets))
+        results = []
+
+        def run(target, *args):
+            barrier.wait()
+            try:
+                results.append(target(*args))
+            except GameIsOver:
+                results.append('game is over')
+            finally:
+                connection.close()
+        threads = [threading.Thread(target=run, args=target) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_finish_races_with_scoring(self):
+        category = CategoryFactory(rounds_count=4)
+        user = UserFactory()
+        game = GameFactory(category=category, user=user)
+        rounds = [RoundFactory(game=game, num=num, random_point=PointFactory(category=category))
+                  for num in range(1, 5)]
+
+        def finish():
+            Game.objects.get(pk=game.pk).finish()
+            return 'finished'
+
+        def score(round_pk):
+            round = Round.objects.select_related('random_point').get(pk=round_pk)
+            round.set_user_point(GEOSGeometry('POINT(10 10)', srid=4326))
+            return 'scored'
+
+        for _ in range(3):
+            results = self.run_threads([(finish,)] * 4 + [(score, round.pk) for round in rounds])
+            self.assertEqual(results.count('finished'), 1)
+            game.refresh_from_db()
+            round_scores = Round.objects.filter(game=game).values_list('score', flat=True)
+            self.assertTrue(game.is_over)
+            self.assertEqual(game.score, sum(round_scores))
+            self.assertEqual(UserStats.objects.get(user=user).games_count, 1)
+            self.assertEqual(UserStats.objects.get(user=user).round_score_sum, game.score)
+            self.assertEqual(CategoryStats.objects.get(category=category).finished_score_sum, game.score)
+            self.assertEqual(LeaderboardEntry.objects.get(user=user).sum_score, game.score)
+            Game.objects.filter(pk=game.pk).update(is_over=False, score=0)
+            Round.objects.filter(game=game).update(score=0, user_point=None)
+            UserStats.objects.rebuild(user_ids=[user.pk])
+            CategoryStats.objects.rebuild(category_ids=[category.pk])
+            LeaderboardEntry.objects.rebuild(user_ids=[user.pk])
+
+    def test_concurrent_next_round(self):
+        category = CategoryFactory(rounds_count=3)
+        for _ in range(6):
+            PointFactory(category=category)
+        game = GameFactory(category=category)
+        game.start()
+
+        def next_round():
+            try:
+                return Game.objects.get(pk=game.pk).next_round().num
+            except NoRoundsLeft:
+                return 'no rounds left'
+
+        results = self.run_threads([(next_round,)] * 6)
+        self.assertCountEqual(results, [2, 3] + ['no rounds left'] * 4)
+        self.assertEqual(sorted(game.rounds.values_list('num', flat=True)), [1, 2, 3])
+
+    def test_set_user_point_after_finish(self):
+        round = RoundFactory(random_point=PointFactory())
+        round.game.finish()
+        with self.assertRaises(GameIsOver):
+            round.set_user_point(GEOSGeometry('POINT(10 10)', srid=4326))
+        with self.assertRaises(GameIsOver):
+            round.game.finish()
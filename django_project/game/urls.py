@@ -1,15 +1,26 @@
 from django.urls import path
 from rest_framework.routers import SimpleRouter
-from .views import CategoryViewSet, GameViewSet, RoundViewSet, top_players
+from . import async_views
+from .views import (CategoryViewSet, GameViewSet, PointStatsViewSet, RoundViewSet, top_players,
+                    player_rank, category_points_geojson, category_points_ndjson)
 
 
 router = SimpleRouter()
 router.register('category', CategoryViewSet)
 router.register('game', GameViewSet)
 router.register('round', RoundViewSet)
+router.register('point_stats', PointStatsViewSet)
 
 urlpatterns = [
     path('top_players/', top_players, name='top_players'),
+    path('top_players/me/', player_rank, name='player_rank'),
+    path('category/<int:pk>/points.geojson', category_points_geojson, name='category-points_geojson'),
+    path('category/<int:pk>/points.ndjson', category_points_ndjson, name='category-points_ndjson'),
+    path('async/game/start_game/', async_views.start_game, name='async-start_game'),
+    path('async/game/<int:pk>/next_round/', async_views.next_round, name='async-next_round'),
+    path('async/game/<int:pk>/end_game/', async_views.end_game, name='async-end_game'),
+    path('async/round/<int:pk>/set_user_point/', async_views.set_user_point, name='async-set_user_point'),
+    path('async/top_players/', async_views.top_players, name='async-top_players'),
 ]
 
 urlpatterns += router.urls
\ No newline at end of file
@@ -1,17 +1,38 @@
-from django.utils import timezone
-from django.db.models import F
+import json
+from django.contrib.gis.geos import Polygon
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets
 from rest_framework import status
 from rest_framework import permissions
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.negotiation import BaseContentNegotiation
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
-from authorization.models import User
-from .serializers import (CategorySerializer, GameReadSerializer, GameStartRequestBodySerializer,
+from .serializers import (CategorySerializer, DailyLeaderboardEntrySerializer, DailyLeaderboardQuerySerializer,
+                          GameReadSerializer, GameStartRequestBodySerializer,
+                          GameHistoryQuerySerializer, RoundListQuerySerializer, PointStatsQuerySerializer,
+                          PointStatsSerializer,
                           RoundReadSerializer, RoundSetPointRequestBodySerializer, GameStartResponseSerializer,
-                          RoundSetPointResponseSerializer, TopPlayersResponseSerializer)
-from .models import Category, Game, Round
+                          RoundSetPointResponseSerializer, TopPlayersQuerySerializer, TopPlayersResponseSerializer,
+                          PlayerRankResponseSerializer)
+from .cache import category_cache
+from .functions import X, Y
+from .daily import daily_challenges
+from .models import Category, DailyLeaderboardEntry, Game, GameIsOver, LeaderboardEntry, NoRoundsLeft, PointStats, Round
+from .pagination import GamePagination, PointStatsPagination, RoundPagination
 from .permissions import PlayInCategoryPermission
+from .session import game_states
+
+
+NO_ROUNDS_LEFT_MESSAGE = 'Все раунды игры уже сыграны'
+GAME_IS_OVER_MESSAGE = 'Игра уже завершена'
+ROOM_GAME_MESSAGE = 'Раунды игры в комнате открывает и игру завершает комната'
+
+EXPORT_CHUNK_SIZE = 2000
 
 
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
@@ -28,8 +49,42 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     def set_like(self, request, pk):
         category = self.get_object()
         category.likes.add(request.user)
+        # is_liked посчитан with_stats() до добавления лайка
+        category.is_liked = True
         return Response(CategorySerializer(category).data)
 
+    @swagger_auto_schema(method='GET', query_serializer=DailyLeaderboardQuerySerializer(),
+                         responses={
+                             '200': DailyLeaderboardEntrySerializer(many=True)
+                         })
+    @action(methods=['GET'], detail=True, url_path='daily/leaderboard', url_name='daily_leaderboard')
+    def daily_leaderboard(self, request, pk):
+        """
+        Рейтинг ежедневного испытания категории
+        """
+        serializer = DailyLeaderboardQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        date = serializer.validated_data.get('date') or daily_challenges.today()
+        result = DailyLeaderboardEntry.objects.for_day(pk, date).top(serializer.validated_data['limit'],
+                                                                    serializer.validated_data['offset'])
+        return Response(DailyLeaderboardEntrySerializer(result, many=True).data)
+
+    def list(self, request, *args, **kwargs):
+        data = category_cache.get_list(
+            lambda: self.get_serializer(self.queryset.with_stats(), many=True).data
+        )
+        return Response(category_cache.merge_likes(data, request.user))
+
+    def retrieve(self, request, *args, **kwargs):
+        data = category_cache.get_detail(
+            kwargs['pk'],
+            lambda: self.get_serializer(get_object_or_404(self.queryset.with_stats(), pk=kwargs['pk'])).data
+        )
+        return Response(category_cache.merge_likes(data, request.user))
+
+    def get_queryset(self):
+        return self.queryset.with_stats(self.request.user)
+
     def get_serializer_context(self):
         context = super(CategoryViewSet, self).get_serializer_context()
         context['user'] = self.request.user
@@ -40,6 +95,14 @@ class GameViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Game.objects.all()
     serializer_class = GameReadSerializer
     permission_classes = [permissions.IsAuthenticated, ]
+    pagination_class = GamePagination
+
+    @swagger_auto_schema(query_serializer=GameHistoryQuerySerializer())
+    def list(self, request, *args, **kwargs):
+        """
+        История игр пользователя
+        """
+        return super().list(request, *args, **kwargs)
 
     @swagger_auto_schema(method='POST', request_body=GameStartRequestBodySerializer(),
                         responses={
@@ -52,10 +115,9 @@ class GameViewSet(viewsets.ReadOnlyModelViewSet):
         """
         serializer = GameStartRequestBodySerializer(data=request.data, context={'user': request.user})
         serializer.is_valid(raise_exception=True)
-        game = serializer.save()
-        first_round = Round.objects.create(game=game, num=1)
-        first_round.set_random_point()
-        first_round.save()
+        with transaction.atomic():
+            game = serializer.save()
+            first_round = game.start()
         return Response(GameStartResponseSerializer(first_round).data,
                         status=status.HTTP_201_CREATED)
 
@@ -69,10 +131,10 @@ class GameViewSet(viewsets.ReadOnlyModelViewSet):
         Начать следующий раунд
         """
         game = self.get_object()
-        next_round = Round.objects.create(game=game)
-        next_round.set_round_num()
-        next_round.set_random_point()
-        next_round.save()
+        try:
+            next_round = game.next_round()
+        except NoRoundsLeft:
+            raise ValidationError(NO_ROUNDS_LEFT_MESSAGE)
         return Response(RoundReadSerializer(next_round).data,
                         status=status.HTTP_201_CREATED)
 
@@ -82,20 +144,43 @@ class GameViewSet(viewsets.ReadOnlyModelViewSet):
         Завершить игру
         """
         game = self.get_object()
-        game.is_over = True
-        game.set_score()
-        game.save()
+        try:
+            game.finish()
+        except GameIsOver:
+            raise NotFound()
         return Response(GameReadSerializer(game).data)
 
+    def get_object(self):
+        if self.action in ['next_round', 'end_game']:
+            game = game_states.get_game(self.kwargs['pk'], self.request.user) or super().get_object()
+            if game.mode == Game.MODE_ROOM:
+                raise ValidationError([ROOM_GAME_MESSAGE])
+            return game
+        return super().get_object()
+
     def get_queryset(self):
         if self.action in ['next_round', 'end_game']:
-            return self.queryset.active()
+            return self.queryset.active().filter(user=self.request.user)
+        if self.action == 'list':
+            serializer = GameHistoryQuerySerializer(data=self.request.query_params)
+            serializer.is_valid(raise_exception=True)
+            return self.queryset.history(self.request.user, **serializer.validated_data)
+        if self.action == 'retrieve':
+            return self.queryset.filter(user=self.request.user)
         return super().get_queryset()
 
 
 class RoundViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Round.objects.all()
+    queryset = Round.objects.filter(is_revealed=True).select_related('random_point', 'game')
     serializer_class = RoundReadSerializer
+    pagination_class = RoundPagination
+
+    @swagger_auto_schema(query_serializer=RoundListQuerySerializer())
+    def list(self, request, *args, **kwargs):
+        """
+        Раунды игр пользователя
+        """
+        return super().list(request, *args, **kwargs)
 
     @swagger_auto_schema(method='PATCH', request_body=RoundSetPointRequestBodySerializer(),
                          responses={
@@ -109,21 +194,153 @@ class RoundViewSet(viewsets.ReadOnlyModelViewSet):
         round = self.get_object()
         serializer = RoundSetPointRequestBodySerializer(round, data=request.data)
         serializer.is_valid(raise_exception=True)
-        round = serializer.save()
-        round.date_end = timezone.now()
-        round.set_score()
-        round.save()
+        try:
+            round.set_user_point(serializer.validated_data['user_point'])
+        except GameIsOver:
+            raise ValidationError(GAME_IS_OVER_MESSAGE)
         return Response(RoundSetPointResponseSerializer(round).data)
 
+    def get_permissions(self):
+        if self.action in ['list', 'retrieve']:
+            return [permissions.IsAuthenticated()]
+        return super().get_permissions()
+
+    def get_queryset(self):
+        if self.action == 'list':
+            serializer = RoundListQuerySerializer(data=self.request.query_params)
+            serializer.is_valid(raise_exception=True)
+            queryset = self.queryset.filter(game__user=self.request.user)
+            if 'game' in serializer.validated_data:
+                queryset = queryset.filter(game=serializer.validated_data['game'])
+            return queryset
+        if self.action == 'retrieve':
+            return self.queryset.filter(game__user=self.request.user)
+        return super().get_queryset()
+
 
-@swagger_auto_schema(method='GET', responses={'200': TopPlayersResponseSerializer(many=True)})
+class PointStatsViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Статистика ответов по точкам
+    """
+    queryset = PointStats.objects.select_related('point')
+    serializer_class = PointStatsSerializer
+    pagination_class = PointStatsPagination
+
+    @swagger_auto_schema(query_serializer=PointStatsQuerySerializer())
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        if self.action == 'list':
+            serializer = PointStatsQuerySerializer(data=self.request.query_params)
+            serializer.is_valid(raise_exception=True)
+            if 'category' in serializer.validated_data:
+                return self.queryset.filter(point__category=serializer.validated_data['category'])
+        return super().get_queryset()
+
+
+@swagger_auto_schema(method='GET', query_serializer=TopPlayersQuerySerializer(),
+                     responses={'200': TopPlayersResponseSerializer(many=True)})
 @api_view(['GET'])
 def top_players(request):
-    limit = int(request.GET.get('limit', 10))
-    query = 'SELECT u.id as id, u.login as login, avg((gg.score::float / gc.max_score::float) * 100) as avg_score, ' \
-            'sum(gg.score) as sum_score FROM users u INNER JOIN game_game gg on u.id = gg.user_id ' \
-            'INNER JOIN game_category gc on gg.category_id = gc.id ' \
-            'GROUP BY u.id, u.login ORDER BY avg_score DESC'
-    result = User.objects.raw(query)[:limit]
+    serializer = TopPlayersQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    result = LeaderboardEntry.objects.top(serializer.validated_data['limit'], serializer.validated_data['offset'])
     return Response(TopPlayersResponseSerializer(result, many=True).data)
 
+
+@swagger_auto_schema(method='GET', responses={'200': PlayerRankResponseSerializer()})
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, ])
+def player_rank(request):
+    """
+    Место пользователя в рейтинге
+    """
+    entry = get_object_or_404(LeaderboardEntry.objects.select_related('user'),
+                              user=request.user, games_count__gt=0)
+    entry.rank = LeaderboardEntry.objects.rank(entry)
+    return Response(PlayerRankResponseSerializer(entry).data)
+
+
+def parse_bbox(value):
+    """
+    bbox в формате min_lon,min_lat,max_lon,max_lat
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = map(float, value.split(','))
+    except ValueError:
+        raise ValidationError({'bbox': ['Ожидается min_lon,min_lat,max_lon,max_lat']})
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValidationError({'bbox': ['Минимальные координаты больше максимальных']})
+    return Polygon.from_bbox((min_lon, min_lat, max_lon, max_lat))
+
+
+def point_features(request, pk):
+    """
+    Точки категории в виде GeoJSON Feature. Точки читаются частями по EXPORT_CHUNK_SIZE
+    с пагинацией по id, а не серверным курсором: за pgbouncer в режиме transaction серверные
+    курсоры отключены. bbox фильтруется по пространственному индексу
+    """
+    category = get_object_or_404(Category, pk=pk)
+    queryset = category.points.annotate(x=X('point'), y=Y('point')).values_list('id', 'x', 'y').order_by('id')
+    if request.GET.get('bbox'):
+        queryset = queryset.filter(point__contained=parse_bbox(request.GET['bbox']))
+
+    def features():
+        last_id = 0
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id)[:EXPORT_CHUNK_SIZE])
+            for point_id, x, y in chunk:
+                yield {'type': 'Feature', 'id': point_id, 'properties': {'category': category.pk},
+                       'geometry': {'type': 'Point', 'coordinates': [x, y]}}
+            if len(chunk) < EXPORT_CHUNK_SIZE:
+                return
+            last_id = chunk[-1][0]
+    return features()
+
+
+def stream_geojson(features):
+    yield '{"type": "FeatureCollection", "features": ['
+    separator = ''
+    for feature in features:
+        yield separator + json.dumps(feature)
+        separator = ','
+    yield ']}'
+
+
+def stream_ndjson(features):
+    for feature in features:
+        yield json.dumps(feature) + '\n'
+
+
+class ExportContentNegotiation(BaseContentNegotiation):
+    """
+    Выгрузка отдает свой формат при любом Accept, ошибки отдаются в JSON
+    """
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class CategoryPointsExportView(APIView):
+    """
+    Потоковая выгрузка точек категории. Точки категории - ответы игры,
+    поэтому выгрузка доступна только персоналу
+    """
+    permission_classes = [permissions.IsAdminUser, ]
+    content_negotiation_class = ExportContentNegotiation
+    stream = None
+    content_type = None
+
+    def get(self, request, pk):
+        return StreamingHttpResponse(self.stream(point_features(request, pk)), content_type=self.content_type)
+
+
+# Выгрузка в GeoJSON FeatureCollection
+category_points_geojson = CategoryPointsExportView.as_view(stream=stream_geojson,
+                                                           content_type='application/geo+json')
+# Выгрузка в NDJSON, по одной Feature на строку
+category_points_ndjson = CategoryPointsExportView.as_view(stream=stream_ndjson,
+                                                          content_type='application/x-ndjson')
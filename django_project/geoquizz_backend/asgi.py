@@ -13,4 +13,20 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'geoquizz_backend.settings')
 
-application = get_asgi_application()
+import geoquizz_backend.db  # noqa: F401, проверка постоянных соединений с БД
+
+django_application = get_asgi_application()
+
+# Импорты Channels и маршрутов после инициализации Django, им нужны загруженные модели
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+from game.events import game_events  # noqa: E402
+from game.routing import websocket_urlpatterns  # noqa: E402
+
+game_events.start()
+
+application = ProtocolTypeRouter({
+    'http': django_application,
+    'websocket': AllowedHostsOriginValidator(AuthMiddlewareStack(URLRouter(websocket_urlpatterns))),
+})
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.dispatch import receiver
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    """
+    Закрывает постоянные соединения с БД, которые перестали отвечать
+    (перезапуск PostgreSQL или pgbouncer), чтобы запрос открыл новое соединение.
+    В Django 3.2 нет CONN_HEALTH_CHECKS, поэтому проверка делается при начале запроса.
+    """
+    if not getattr(settings, 'DB_CONN_HEALTH_CHECKS', False):
+        return
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        if not connection.is_usable():
+            connection.close()
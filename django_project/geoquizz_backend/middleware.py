@@ -0,0 +1,81 @@
+import logging
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """
+    execute_wrapper, запоминающий время выполнения каждого SQL запроса
+    """
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - started, sql))
+
+    @property
+    def total_time(self):
+        return sum(duration for duration, _ in self.queries)
+
+    def slowest(self, count):
+        return sorted(self.queries, key=lambda query: query[0], reverse=True)[:count]
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Считает SQL запросы запроса и их суммарное время и отдает их в заголовках
+    X-DB-Queries и X-DB-Time (мс), если включена настройка DB_INSTRUMENTATION.
+    Самые медленные запросы пишутся в лог.
+
+    Middleware только синхронный, под ASGI Django из-за него переводит всю цепочку
+    в синхронный режим, поэтому в MIDDLEWARE он добавляется только с DB_INSTRUMENTATION.
+    У потоковых ответов заголовки отправляются до тела, поэтому в них попадают только
+    запросы до начала отдачи, запросы во время отдачи тела учитываются и пишутся в лог
+    после ее окончания.
+    """
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'DB_INSTRUMENTATION', False):
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        with self.recording(recorder):
+            response = self.get_response(request)
+        response['X-DB-Queries'] = str(len(recorder.queries))
+        response['X-DB-Time'] = '{:.3f}'.format(recorder.total_time * 1000)
+        request.db_queries = recorder.queries
+        if response.streaming:
+            response.streaming_content = self.record_streaming(request, response.streaming_content, recorder)
+        else:
+            self.log(request, recorder)
+        return response
+
+    @staticmethod
+    def recording(recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def record_streaming(self, request, content, recorder):
+        try:
+            with self.recording(recorder):
+                yield from content
+        finally:
+            self.log(request, recorder)
+
+    def log(self, request, recorder):
+        for duration, sql in recorder.slowest(getattr(settings, 'DB_INSTRUMENTATION_SLOWEST', 3)):
+            logger.debug('%s %s: %.3f ms %s', request.method, request.path, duration * 1000, sql)
@@ -20,12 +20,12 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/3.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-a=6c!^*z8*mwiv3x(&3n@4!se(nv8bz@!jw((2biftxeiihdg5'
+SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-a=6c!^*z8*mwiv3x(&3n@4!se(nv8bz@!jw((2biftxeiihdg5')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = ['*']
+ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', '*').split(',')
 
 
 # Application definition
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.gis',
+    'channels',
     'drf_yasg',
     'rest_framework',
     'rest_framework_gis',
@@ -79,18 +80,83 @@ WSGI_APPLICATION = 'geoquizz_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# CONN_MAX_AGE оставляет соединение открытым между запросами, DB_CONN_HEALTH_CHECKS
+# закрывает переставшие отвечать соединения (geoquizz_backend.db).
+# За pgbouncer в режиме transaction нужен DISABLE_SERVER_SIDE_CURSORS=1:
+# серверные курсоры iterator() не переживают смену соединения между транзакциями
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.contrib.gis.db.backends.postgis',
-        'NAME': 'postgres',
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
-        'HOST': 'db',
-        'PORT': 5432,
+        'NAME': os.environ.get('DB_NAME', 'postgres'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'postgres'),
+        'HOST': os.environ.get('DB_HOST', 'db'),
+        'PORT': int(os.environ.get('DB_PORT', 5432)),
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 0)),
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DISABLE_SERVER_SIDE_CURSORS', '0') == '1',
+    }
+}
+
+DB_CONN_HEALTH_CHECKS = os.environ.get('DB_CONN_HEALTH_CHECKS', '0') == '1'
+
+
+# Cache
+# Для тестов и разработки используется locmem, в продакшене общий кэш, например
+# CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache CACHE_LOCATION=memcached:11211
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+CATEGORY_CACHE_TIMEOUT = int(os.environ.get('CATEGORY_CACHE_TIMEOUT', 60 * 60))
+
+
+# Game events
+# События игры копятся в памяти процесса и записываются фоновым потоком пакетами
+# по GAME_EVENTS_BATCH_SIZE или раз в GAME_EVENTS_FLUSH_INTERVAL секунд
+
+GAME_EVENTS_BATCH_SIZE = int(os.environ.get('GAME_EVENTS_BATCH_SIZE', 500))
+
+GAME_EVENTS_FLUSH_INTERVAL = float(os.environ.get('GAME_EVENTS_FLUSH_INTERVAL', 1.0))
+
+GAME_EVENTS_MAX_BUFFER = int(os.environ.get('GAME_EVENTS_MAX_BUFFER', 50000))
+
+
+# Channels
+# Комнаты многопользовательской игры держат состояние в памяти воркера, события комнаты
+# рассылаются через слой каналов. InMemoryChannelLayer работает внутри одного процесса,
+# в продакшене общий слой, например
+# CHANNEL_LAYER_BACKEND=channels_redis.core.RedisChannelLayer CHANNEL_LAYER_HOSTS=redis://redis:6379/0
+
+ASGI_APPLICATION = 'geoquizz_backend.asgi.application'
+
+CHANNEL_LAYER_HOSTS = [host for host in os.environ.get('CHANNEL_LAYER_HOSTS', '').split(',') if host]
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': os.environ.get('CHANNEL_LAYER_BACKEND', 'channels.layers.InMemoryChannelLayer'),
+        'CONFIG': {'hosts': CHANNEL_LAYER_HOSTS} if CHANNEL_LAYER_HOSTS else {},
     }
 }
 
 
+# SQL instrumentation
+# Заголовки X-DB-Queries и X-DB-Time с числом и временем SQL запросов каждого запроса
+
+DB_INSTRUMENTATION = os.environ.get('DB_INSTRUMENTATION', '0') == '1'
+
+INSTRUMENTATION_MIDDLEWARE = 'geoquizz_backend.middleware.QueryInstrumentationMiddleware'
+
+if DB_INSTRUMENTATION:
+    MIDDLEWARE.insert(0, INSTRUMENTATION_MIDDLEWARE)
+
+DB_INSTRUMENTATION_SLOWEST = 3
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -130,6 +196,7 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+
+@override_settings(DB_INSTRUMENTATION=True, MIDDLEWARE=[settings.INSTRUMENTATION_MIDDLEWARE] + [
+    middleware for middleware in settings.MIDDLEWARE if middleware != settings.INSTRUMENTATION_MIDDLEWARE])
+class QueryBudgetTestCase(APITestCase):
+    """
+    Тесты с бюджетом SQL запросов на эндпоинт.
+
+    query_budgets задает максимальное число запросов для имени эндпоинта,
+    число запросов берется из заголовка X-DB-Queries.
+    """
+    query_budgets = {}
+
+    def assertQueryBudget(self, name, response):
+        budget = self.query_budgets[name]
+        queries = int(response['X-DB-Queries'])
+        if queries > budget:
+            self.fail('{} made {} queries, budget is {} ({} ms)'.format(
+                name, queries, budget, response['X-DB-Time']))
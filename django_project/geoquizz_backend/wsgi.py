@@ -13,4 +13,10 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'geoquizz_backend.settings')
 
+import geoquizz_backend.db  # noqa: F401, проверка постоянных соединений с БД
+
 application = get_wsgi_application()
+
+from game.events import game_events  # noqa: E402
+
+game_events.start()
@@ -0,0 +1,23 @@
+"""
+Настройки gunicorn для продакшена, все параметры задаются переменными окружения.
+
+WSGI:  gunicorn geoquizz_backend.wsgi -c gunicorn.conf.py
+ASGI:  GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn geoquizz_backend.asgi -c gunicorn.conf.py
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8080')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Перезапуск воркеров ограничивает рост памяти, jitter разносит перезапуски во времени
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 500))
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+# Приложение загружается в воркерах после fork, чтобы соединения с БД не делились между процессами
+preload_app = False